@@ -1,13 +1,18 @@
 from abc import ABC, abstractmethod
 from contextlib import asynccontextmanager
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field, model_validator
 
+from app.checkpoint import CheckpointStore, MemoryTracker, get_checkpoint_store
+from app.deadline import deadline_scope, default_step_timeout
+from app.ledger import RunLedger, current_run, track_run, track_step
 from app.llm import LLM
 from app.logger import logger
-from app.sandbox.client import SANDBOX_CLIENT
+from app.loop_detection import STOP, LoopDetection, LoopDetector
 from app.schema import ROLE_TYPE, AgentState, Memory, Message
+from app.session import Session, current_session, get_sandbox_client, use_session
+from app.tracing import span
 
 
 class BaseAgent(BaseModel, ABC):
@@ -30,6 +35,10 @@ class BaseAgent(BaseModel, ABC):
     )
 
     # Dependencies
+    session: Optional[Session] = Field(
+        default_factory=current_session,
+        description="Session owning the agent's sandbox and LLM instances",
+    )
     llm: LLM = Field(default_factory=LLM, description="Language model instance")
     memory: Memory = Field(default_factory=Memory, description="Agent's memory store")
     state: AgentState = Field(
@@ -39,8 +48,31 @@ class BaseAgent(BaseModel, ABC):
     # Execution control
     max_steps: int = Field(default=10, description="Maximum steps before termination")
     current_step: int = Field(default=0, description="Current step in execution")
+    step_timeout: Optional[float] = Field(
+        default_factory=default_step_timeout,
+        description="Seconds a step may take, tool calls are cut off at the deadline",
+    )
 
     duplicate_threshold: int = 2
+    loop_detector: Optional[LoopDetector] = Field(
+        default_factory=LoopDetector.from_config,
+        description="Detects repeated cycles of steps (None: compare replies only)",
+    )
+    step_hints: List[str] = Field(
+        default_factory=list,
+        description="One-off guidance sent with the next request only",
+    )
+    _loop: Optional[LoopDetection] = None
+
+    ledger: Optional[RunLedger] = Field(
+        None, description="Token and latency ledger of the current or last run"
+    )
+    checkpoints: Optional[CheckpointStore] = Field(
+        default_factory=get_checkpoint_store,
+        description="Store the run is checkpointed to after every step",
+    )
+    _checkpoint_key: Optional[str] = None
+    _memory_tracker: Optional[MemoryTracker] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -130,29 +162,114 @@ class BaseAgent(BaseModel, ABC):
 
         if request:
             self.update_memory("user", request)
+        if self.loop_detector:
+            self.loop_detector.reset()
+        return await self._run_steps()
+
+    async def resume(self, run_id: str) -> str:
+        """Continue a checkpointed run, e.g. after the process running it died.
+
+        Raises:
+            ValueError: If checkpoints are disabled or the run has none.
+            RuntimeError: If the agent is not in IDLE state.
+        """
+        if self.state != AgentState.IDLE:
+            raise RuntimeError(f"Cannot resume agent from state: {self.state}")
+        status = self.restore_checkpoint(run_id)
+        if status is None:
+            raise ValueError(f"No checkpoint of {self.name} for run {run_id}")
+        if status == "finished":
+            raise ValueError(f"Run {run_id} of {self.name} already finished")
+        logger.info(
+            f"Resuming run {run_id} of {self.name} after step {self.current_step}"
+        )
+        return await self._run_steps(run_id)
 
+    async def _run_steps(self, run_id: Optional[str] = None) -> str:
+        # Tools and LLM calls of the run resolve the agent's session
+        with use_session(self.session or current_session()):
+            return await self._run_session_steps(run_id)
+
+    async def _run_session_steps(self, run_id: Optional[str] = None) -> str:
         results: List[str] = []
-        async with self.state_context(AgentState.RUNNING):
-            while (
-                self.current_step < self.max_steps and self.state != AgentState.FINISHED
-            ):
-                self.current_step += 1
-                logger.info(f"Executing step {self.current_step}/{self.max_steps}")
-                step_result = await self.step()
-
-                # Check for stuck state
-                if self.is_stuck():
-                    self.handle_stuck_state()
-
-                results.append(f"Step {self.current_step}: {step_result}")
-
-            if self.current_step >= self.max_steps:
-                self.current_step = 0
-                self.state = AgentState.IDLE
-                results.append(f"Terminated: Reached max steps ({self.max_steps})")
-        await SANDBOX_CLIENT.cleanup()
+        with track_run(self.name, run_id) as ledger, span(
+            "agent.run", agent=self.name, run_id=ledger.run_id
+        ):
+            self.ledger = ledger
+            if self.checkpoints:
+                logger.info(f"Checkpointing run {ledger.run_id} of {self.name}")
+            self.save_checkpoint()
+            async with self.state_context(AgentState.RUNNING):
+                while (
+                    self.current_step < self.max_steps
+                    and self.state != AgentState.FINISHED
+                ):
+                    self.current_step += 1
+                    logger.info(f"Executing step {self.current_step}/{self.max_steps}")
+                    with track_step(self.current_step), span(
+                        "step", step=self.current_step
+                    ), deadline_scope(self.step_timeout):
+                        step_result = await self.step()
+
+                    # Check for stuck state
+                    if self.is_stuck():
+                        self.handle_stuck_state()
+
+                    self.save_checkpoint()
+                    results.append(f"Step {self.current_step}: {step_result}")
+
+                if self.current_step >= self.max_steps:
+                    self.current_step = 0
+                    self.state = AgentState.IDLE
+                    results.append(f"Terminated: Reached max steps ({self.max_steps})")
+            self.save_checkpoint(status="finished")
+        await get_sandbox_client().cleanup()
         return "\n".join(results) if results else "No steps executed"
 
+    def checkpoint_state(self) -> Dict[str, Any]:
+        """JSON-serializable agent state stored with each checkpoint"""
+        return {
+            "current_step": self.current_step,
+            "next_step_prompt": self.next_step_prompt,
+            "step_hints": self.step_hints,
+        }
+
+    def load_checkpoint_state(self, state: Dict[str, Any]) -> None:
+        """Restore the state returned by `checkpoint_state`"""
+        self.current_step = state.get("current_step", 0)
+        self.next_step_prompt = state.get("next_step_prompt", self.next_step_prompt)
+        self.step_hints = list(state.get("step_hints", []))
+
+    def save_checkpoint(self, status: str = "running") -> None:
+        """Store the messages added since the last checkpoint and the agent state"""
+        run = current_run()
+        if not self.checkpoints or run is None:
+            return
+        key = f"{run.run_id}/{self.name}"
+        if key != self._checkpoint_key or self._memory_tracker is None:
+            self._checkpoint_key, self._memory_tracker = key, MemoryTracker()
+        start, added = self._memory_tracker.delta(self.memory.messages)
+        self.checkpoints.save(
+            key, run.run_id, status, self.checkpoint_state(), start, added
+        )
+
+    def restore_checkpoint(self, run_id: str) -> Optional[str]:
+        """Load memory and state of a run's checkpoint, returning its status"""
+        if not self.checkpoints:
+            raise ValueError("Checkpoints are disabled, enable [checkpoint] in config")
+        key = f"{run_id}/{self.name}"
+        checkpoint = self.checkpoints.load(key)
+        if checkpoint is None:
+            return None
+        messages = checkpoint["messages"]
+        self.memory.messages = list(messages)
+        self._checkpoint_key = key
+        self._memory_tracker = MemoryTracker(
+            self.memory.messages, checkpoint["memory_start"]
+        )
+        self.load_checkpoint_state(checkpoint["state"])
+        return checkpoint["status"]
+
     @abstractmethod
     async def step(self) -> str:
         """Execute a single step in the agent's workflow.
@@ -162,13 +279,43 @@ class BaseAgent(BaseModel, ABC):
 
     def handle_stuck_state(self):
         """Handle stuck state by adding a prompt to change strategy"""
+        if self._loop:
+            self._intervene(self._loop)
+            return
         stuck_prompt = "\
         Observed duplicate responses. Consider new strategies and avoid repeating ineffective paths already attempted."
+        if stuck_prompt in (self.next_step_prompt or ""):
+            return  # Already asked to change strategy
         self.next_step_prompt = f"{stuck_prompt}\n{self.next_step_prompt}"
         logger.warning(f"Agent detected stuck state. Added prompt: {stuck_prompt}")
 
+    def _intervene(self, loop: LoopDetection) -> None:
+        """Escalate from a one-off hint to stopping the agent"""
+        logger.warning(
+            f"Agent repeated a cycle of {loop.cycle_length} step(s) {loop.repeats} "
+            f"times (intervention level {loop.level}): {loop.steps}"
+        )
+        if loop.level < STOP:
+            self.step_hints.append(loop.prompt())
+            return
+        self.memory.add_message(
+            Message.assistant_message(
+                f"Stopped: the same {loop.cycle_length} step(s) were repeated "
+                f"{loop.repeats} times with identical results."
+            )
+        )
+        self.state = AgentState.FINISHED
+
     def is_stuck(self) -> bool:
-        """Check if the agent is stuck in a loop by detecting duplicate content"""
+        """Check if the last step continued a loop.
+
+        With a loop detector the step is recorded and compared with the
+        previous ones, otherwise only duplicate assistant replies are counted.
+        """
+        if self.loop_detector:
+            self._loop = self.loop_detector.observe(self.memory.messages)
+            return self._loop is not None
+
         if len(self.memory.messages) < 2:
             return False
 
@@ -66,6 +66,11 @@ class BrowserContextHelper:
                 image_message = Message.user_message(
                     content="Current browser screenshot:",
                     base64_image=self._current_base64_image,
+                    image_caption=(
+                        f"browser screenshot at step {self.agent.current_step}, "
+                        f"URL: {browser_state.get('url', 'N/A')}, "
+                        f"title: {browser_state.get('title', 'N/A')}"
+                    ),
                 )
                 self.agent.memory.add_message(image_message)
                 self._current_base64_image = None  # Consume the image after adding
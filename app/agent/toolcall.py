@@ -1,18 +1,42 @@
 import asyncio
 import json
-from typing import Any, List, Optional, Union
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from pydantic import Field
+from pydantic import Field, model_validator
 
 from app.agent.react import ReActAgent
-from app.exceptions import TokenLimitExceeded
+from app.artifacts import ArtifactStore
+from app.compaction import ContextCompactor
+from app.deadline import expired
+from app.exceptions import TokenBudgetExceeded, TokenLimitExceeded
+from app.ledger import annotate, call_site, record_tool
+from app.llm import RequestPriority
 from app.logger import logger
+from app.observation import ObservationCompressor
 from app.prompt.toolcall import NEXT_STEP_PROMPT, SYSTEM_PROMPT
-from app.schema import TOOL_CHOICE_TYPE, AgentState, Message, ToolCall, ToolChoice
+from app.prompt_cache import PromptLayout
+from app.schema import (
+    TOOL_CHOICE_TYPE,
+    AgentState,
+    CompactionRecord,
+    Message,
+    ToolCall,
+    ToolChoice,
+)
 from app.tool import CreateChatCompletion, Terminate, ToolCollection
+from app.tool.read_artifact import MAX_CHARS, RESERVED_CHARS, ReadArtifact
+from app.tracing import span
 
 
 TOOL_CALL_REQUIRED = "Tool calls required but none provided"
+STEP_DEADLINE_EXCEEDED = "Error: Not run, the step exceeded its deadline"
+
+# Image captured by the tool call running in the current task
+_tool_image: ContextVar[Optional[str]] = ContextVar("tool_image", default=None)
+# Tokens the compressor saved on the output of that tool call
+_tokens_saved: ContextVar[int] = ContextVar("tokens_saved", default=0)
 
 
 class ToolCallAgent(ReActAgent):
@@ -24,42 +48,86 @@ class ToolCallAgent(ReActAgent):
     system_prompt: str = SYSTEM_PROMPT
     next_step_prompt: str = NEXT_STEP_PROMPT
 
-    available_tools: ToolCollection = ToolCollection(
-        CreateChatCompletion(), Terminate()
+    available_tools: ToolCollection = Field(
+        default_factory=lambda: ToolCollection(CreateChatCompletion(), Terminate())
     )
     tool_choices: TOOL_CHOICE_TYPE = ToolChoice.AUTO  # type: ignore
     special_tool_names: List[str] = Field(default_factory=lambda: [Terminate().name])
 
     tool_calls: List[ToolCall] = Field(default_factory=list)
-    _current_base64_image: Optional[str] = None
+
+    # Store next_step_prompt in memory on every step instead of sending it
+    # with the current request only
+    persist_next_step_prompt: bool = False
+    _step_prompts: List[Message] = []
 
     max_steps: int = 30
     max_observe: Optional[Union[int, bool]] = None
+    # Keeps outputs longer than max_observe in full instead of cutting them off
+    artifact_store: Optional[ArtifactStore] = Field(
+        default_factory=ArtifactStore.from_config
+    )
+    # Compresses tool outputs before they are added to memory
+    compressor: Optional[ObservationCompressor] = Field(
+        default_factory=ObservationCompressor.from_config
+    )
+
+    # Limit on concurrency-safe tool calls of one turn running at the same time
+    max_parallel_tools: int = 4
+
+    # Stream completions and start running each tool call as soon as it is complete
+    stream_tool_calls: bool = False
+    _tool_runs: Dict[str, asyncio.Task] = {}
+
+    # Summarizes old messages when the prompt gets close to the context limit
+    compactor: Optional[ContextCompactor] = Field(
+        default_factory=ContextCompactor.from_config
+    )
+    # Keeps consecutive requests prefix-stable for provider prompt caching
+    prompt_layout: Optional[PromptLayout] = Field(
+        default_factory=PromptLayout.from_config
+    )
+
+    @model_validator(mode="after")
+    def add_artifact_tool(self) -> "ToolCallAgent":
+        """Let the agent read outputs that are stored instead of observed in full"""
+        if self.artifact_store and (self.max_observe or self.compressor):
+            if not self.available_tools.get_tool("read_artifact"):
+                reader = ReadArtifact(store=self.artifact_store)
+                if self.max_observe:
+                    reader.max_output = min(
+                        int(self.max_observe) - RESERVED_CHARS, MAX_CHARS
+                    )
+                self.available_tools.add_tool(reader)
+        return self
 
     async def think(self) -> bool:
         """Process current state and decide next actions using tools"""
+        self._step_prompts = []
         if self.next_step_prompt:
             user_msg = Message.user_message(self.next_step_prompt)
-            self.messages += [user_msg]
+            if self.persist_next_step_prompt:
+                self.memory.add_message(user_msg)
+            else:
+                self._step_prompts = [user_msg]
+        if self.step_hints:
+            self._step_prompts += [Message.user_message("\n\n".join(self.step_hints))]
+            self.step_hints = []
 
         try:
             # Get response with tool options
-            response = await self.llm.ask_tool(
-                messages=self.messages,
-                system_msgs=(
-                    [Message.system_message(self.system_prompt)]
-                    if self.system_prompt
-                    else None
-                ),
-                tools=self.available_tools.to_params(),
-                tool_choice=self.tool_choices,
-            )
+            with call_site("think"):
+                response = await self._ask_with_compaction()
         except ValueError:
             raise
         except Exception as e:
-            # Check if this is a RetryError containing TokenLimitExceeded
-            if hasattr(e, "__cause__") and isinstance(e.__cause__, TokenLimitExceeded):
-                token_limit_error = e.__cause__
+            # Check if this is TokenLimitExceeded, possibly inside a RetryError
+            token_limit_error = (
+                e
+                if isinstance(e, TokenLimitExceeded)
+                else getattr(e, "__cause__", None)
+            )
+            if isinstance(token_limit_error, TokenLimitExceeded):
                 logger.error(
                     f"🚨 Token limit error (from RetryError): {token_limit_error}"
                 )
@@ -128,6 +196,190 @@ class ToolCallAgent(ReActAgent):
             )
             return False
 
+    def _step_request(self) -> dict:
+        """Arguments of the LLM request for the next step"""
+        return dict(
+            messages=self.messages + self._step_prompts,
+            system_msgs=(
+                [Message.system_message(self.system_prompt)]
+                if self.system_prompt
+                else None
+            ),
+            tools=self.available_tools.to_params(),
+            tool_choice=self.tool_choices,
+        )
+
+    async def compact_memory(self, force: bool = False) -> Optional[CompactionRecord]:
+        """Summarize old messages if the prompt is close to the context limit"""
+        if not self.compactor:
+            return None
+        request = self._step_request()
+        return await self.compactor.compact(
+            self.memory,
+            self.llm,
+            system_msgs=request["system_msgs"],
+            tools=request["tools"],
+            force=force,
+        )
+
+    async def _ask_with_compaction(self) -> Any:
+        """Request the next step, compacting memory first when it grew too large"""
+        await self.compact_memory()
+        try:
+            return await self._ask_step()
+        except TokenLimitExceeded as e:
+            # Retry only if a compacted prompt fits in the remaining input budget
+            if isinstance(e, TokenBudgetExceeded) or not (
+                self.compactor and self.compactor.can_relieve(self.llm)
+            ):
+                raise
+            record = await self.compact_memory(force=True)
+            if not record or not self.llm.check_token_limit(record.tokens_after):
+                raise
+            logger.warning("Token limit reached, retrying with compacted memory")
+            return await self._ask_step()
+
+    async def _ask_step(self) -> Any:
+        """Send the step request, laid out for prompt caching when enabled"""
+        request = self._step_request()
+        if not self.prompt_layout:
+            return await self._ask_llm(**request)
+        system_msgs, messages, reuse = self.prompt_layout.build(
+            self.llm,
+            request["system_msgs"],
+            self.messages,
+            request["tools"],
+            tail=self._step_prompts,
+        )
+        with annotate(prefix_reuse=reuse):
+            return await self._ask_llm(
+                **{**request, "system_msgs": system_msgs, "messages": messages}
+            )
+
+    async def _ask_llm(self, **kwargs) -> Any:
+        """Request the next tool calls, streaming them when enabled"""
+        await self._cancel_tool_runs()  # Leftovers of a step that never acted
+        kwargs.setdefault("priority", RequestPriority.INTERACTIVE)
+        if not self.stream_tool_calls or self.tool_choices == ToolChoice.NONE:
+            return await self.llm.ask_tool(**kwargs)
+
+        try:
+            return await self.llm.ask_tool_stream(
+                **kwargs, on_tool_call=self._dispatch_tool_call
+            )
+        except (ValueError, TokenLimitExceeded):
+            await self._cancel_tool_runs()
+            raise
+        except Exception as e:
+            if self._tool_runs:
+                # Tools already started, a retry could run them twice
+                await self._cancel_tool_runs()
+                raise
+            logger.warning(f"Streaming tool calls failed ({e}), retrying without")
+            return await self.llm.ask_tool(**kwargs)
+
+    def _dispatch_tool_call(self, command: ToolCall) -> None:
+        """Start a streamed tool call; calls still run one after another"""
+        previous = next(reversed(self._tool_runs.values()), None)
+
+        async def run_after_previous() -> Tuple[str, Optional[str]]:
+            if previous:
+                await asyncio.wait([previous])
+            return await self._run_tool(command)
+
+        logger.info(
+            f"⚡ Dispatching tool '{command.function.name}' before the response completed"
+        )
+        self._tool_runs[command.id] = asyncio.create_task(run_after_previous())
+
+    async def _cancel_tool_runs(self) -> None:
+        """Cancel tool calls dispatched during a failed streaming request"""
+        runs, self._tool_runs = list(self._tool_runs.values()), {}
+        for task in runs:
+            task.cancel()
+        if runs:
+            await asyncio.gather(*runs, return_exceptions=True)
+
+    async def _run_tool(self, command: ToolCall) -> Tuple[str, Optional[str]]:
+        """Execute a tool call, returning its observation and captured image"""
+        # Reset base64_image for each tool call
+        token = _tool_image.set(None)
+        saved_token = _tokens_saved.set(0)
+        try:
+            start = time.monotonic()
+            with span("tool", tool=command.function.name) as tool_span:
+                result = await self.execute_tool(command)
+                tool_span.set(
+                    bytes=len(result.encode("utf-8", "replace")),
+                    error=result.startswith("Error:"),
+                )
+            record_tool(
+                command.function.name,
+                time.monotonic() - start,
+                error=result if result.startswith("Error:") else None,
+                tokens_saved=_tokens_saved.get(),
+            )
+            return result, _tool_image.get()
+        finally:
+            _tokens_saved.reset(saved_token)
+            _tool_image.reset(token)
+
+    def _is_concurrency_safe(self, command: ToolCall) -> bool:
+        tool = self.available_tools.get_tool(command.function.name)
+        if not tool:
+            return False
+        try:
+            args = json.loads(command.function.arguments or "{}")
+        except json.JSONDecodeError:
+            return False
+        return isinstance(args, dict) and tool.is_concurrency_safe(**args)
+
+    def _batch_tool_calls(self) -> List[List[ToolCall]]:
+        """Group consecutive concurrency-safe calls; any other call runs alone"""
+        batches: List[List[ToolCall]] = []
+        parallel = False
+        for command in self.tool_calls:
+            safe = self._is_concurrency_safe(command)
+            if safe and parallel:
+                batches[-1].append(command)
+            else:
+                batches.append([command])
+            parallel = safe
+        return batches
+
+    async def _run_batch(
+        self, batch: List[ToolCall]
+    ) -> List[Tuple[str, Optional[str]]]:
+        """Run a batch of tool calls under the global and per-tool limits"""
+        if len(batch) == 1:
+            command = batch[0]
+            run = self._tool_runs.pop(command.id, None)
+            return [await (run or self._run_tool(command))]
+
+        limit = asyncio.Semaphore(self.max_parallel_tools)
+        tool_limits: Dict[str, asyncio.Semaphore] = {}
+        for command in batch:
+            tool = self.available_tools.get_tool(command.function.name)
+            if tool.max_concurrency and tool.name not in tool_limits:
+                tool_limits[tool.name] = asyncio.Semaphore(tool.max_concurrency)
+
+        async def run_limited(command: ToolCall) -> Tuple[str, Optional[str]]:
+            run = self._tool_runs.pop(command.id, None)
+            if run:
+                return await run
+            tool_limit = tool_limits.get(command.function.name)
+            async with limit:
+                if tool_limit is None:
+                    return await self._run_tool(command)
+                async with tool_limit:
+                    return await self._run_tool(command)
+
+        logger.info(
+            f"⏩ Running {len(batch)} tool calls concurrently: "
+            f"{[command.function.name for command in batch]}"
+        )
+        return await asyncio.gather(*(run_limited(command) for command in batch))
+
     async def act(self) -> str:
         """Execute tool calls and handle their results"""
         if not self.tool_calls:
@@ -138,31 +390,63 @@ class ToolCallAgent(ReActAgent):
             return self.messages[-1].content or "No content or commands to execute"
 
         results = []
-        for command in self.tool_calls:
-            # Reset base64_image for each tool call
-            self._current_base64_image = None
-
-            result = await self.execute_tool(command)
-
-            if self.max_observe:
-                result = result[: self.max_observe]
-
-            logger.info(
-                f"🎯 Tool '{command.function.name}' completed its mission! Result: {result}"
-            )
+        for batch in self._batch_tool_calls():
+            if expired():
+                # Every call still needs a result for the next request
+                outputs = [(STEP_DEADLINE_EXCEEDED, None)] * len(batch)
+            else:
+                outputs = await self._run_batch(batch)
+            # Results are stored in call order, whichever call finished first
+            for command, (result, base64_image) in zip(batch, outputs):
+                if self.max_observe:
+                    result = self._observe(result)
+
+                logger.info(
+                    f"🎯 Tool '{command.function.name}' completed its mission! Result: {result}"
+                )
 
-            # Add tool response to memory
-            tool_msg = Message.tool_message(
-                content=result,
-                tool_call_id=command.id,
-                name=command.function.name,
-                base64_image=self._current_base64_image,
-            )
-            self.memory.add_message(tool_msg)
-            results.append(result)
+                # Add tool response to memory
+                tool_msg = Message.tool_message(
+                    content=result,
+                    tool_call_id=command.id,
+                    name=command.function.name,
+                    base64_image=base64_image,
+                    image_caption=f"output of {command.function.name} at step {self.current_step}",
+                )
+                self.memory.add_message(tool_msg)
+                results.append(result)
 
         return "\n\n".join(results)
 
+    def _observe(self, result: str) -> str:
+        """Fit a tool output into max_observe characters"""
+        limit = int(self.max_observe)
+        if len(result) <= limit:
+            return result
+        if self.artifact_store:
+            try:
+                return self.artifact_store.excerpt(result, limit)
+            except OSError as e:
+                logger.warning(f"Failed to store tool output as artifact: {e}")
+        return result[:limit]
+
+    def _compress(self, name: str, output: str) -> str:
+        """Compress a tool output, keeping the original in the artifact store"""
+        compressed, saved = self.compressor.compress(name, output)
+        if not saved or not self.artifact_store:
+            _tokens_saved.set(saved)
+            return compressed
+        try:
+            artifact_id = self.artifact_store.put(output)
+        except OSError as e:
+            logger.warning(f"Failed to store tool output as artifact: {e}")
+            return output  # Compression may drop data that is then lost
+        _tokens_saved.set(saved)
+        return (
+            f"{compressed}\n[Compressed output. The original is stored as artifact "
+            f"{artifact_id}; use `read_artifact` to read lines of it or grep in it]"
+        )
+
     async def execute_tool(self, command: ToolCall) -> str:
         """Execute a single tool call with robust error handling"""
         if not command or not command.function or not command.function.name:
@@ -186,11 +470,15 @@ class ToolCallAgent(ReActAgent):
             # Check if result is a ToolResult with base64_image
             if hasattr(result, "base64_image") and result.base64_image:
                 # Store the base64_image for later use in tool_message
-                self._current_base64_image = result.base64_image
+                _tool_image.set(result.base64_image)
+
+            output = str(result)
+            if self.compressor and result and not getattr(result, "error", None):
+                output = self._compress(name, output)
 
             # Format result for display (standard case)
             observation = (
-                f"Observed output of cmd `{name}` executed:\n{str(result)}"
+                f"Observed output of cmd `{name}` executed:\n{output}"
                 if result
                 else f"Cmd `{name}` completed with no output"
             )
@@ -248,3 +536,25 @@ class ToolCallAgent(ReActAgent):
             return await super().run(request)
         finally:
             await self.cleanup()
+
+    async def resume(self, run_id: str) -> str:
+        """Continue a checkpointed run with cleanup when done."""
+        try:
+            return await super().resume(run_id)
+        finally:
+            await self.cleanup()
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        tools = {}
+        for tool in self.available_tools:
+            state = tool.get_state()
+            if state is not None:
+                tools[tool.name] = state
+        return {**super().checkpoint_state(), "tools": tools}
+
+    def load_checkpoint_state(self, state: Dict[str, Any]) -> None:
+        super().load_checkpoint_state(state)
+        for name, tool_state in state.get("tools", {}).items():
+            tool = self.available_tools.get_tool(name)
+            if tool:
+                tool.set_state(tool_state)
@@ -0,0 +1,97 @@
+"""Content-addressed store for tool outputs too large to keep in memory.
+
+When a tool output is longer than an agent observes, the full text is
+written once under the hash of its content and the observation becomes the
+head and tail of the output plus the artifact id. The `read_artifact` tool
+reads line ranges of a stored output or greps inside it, so nothing the tool
+printed is lost while prompts stay small.
+"""
+import hashlib
+import re
+import uuid
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.config import PROJECT_ROOT, ArtifactSettings, config
+
+
+ID_LENGTH = 16
+
+
+class ArtifactStore:
+    """Stores texts as `<dir>/<id[:2]>/<id>.txt`, keyed by their SHA-256"""
+
+    def __init__(self, settings: ArtifactSettings):
+        self.settings = settings
+        root = Path(settings.dir)
+        self.root = root if root.is_absolute() else PROJECT_ROOT / root
+
+    @classmethod
+    def from_config(cls) -> Optional["ArtifactStore"]:
+        """Create a store from the config, or None if spilling is disabled"""
+        settings = config.artifacts
+        if not settings or not settings.enabled:
+            return None
+        return cls(settings)
+
+    def path(self, artifact_id: str) -> Path:
+        if not re.fullmatch(r"[0-9a-f]{%d}" % ID_LENGTH, artifact_id):
+            raise ValueError(f"Invalid artifact id: {artifact_id}")
+        return self.root / artifact_id[:2] / f"{artifact_id}.txt"
+
+    def put(self, text: str) -> str:
+        """Store a text and return its id; identical texts are stored once"""
+        data = text.encode("utf-8", "surrogatepass")
+        artifact_id = hashlib.sha256(data).hexdigest()[:ID_LENGTH]
+        path = self.path(artifact_id)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)  # Readers never see a partial artifact
+        return artifact_id
+
+    def get(self, artifact_id: str) -> str:
+        path = self.path(artifact_id)
+        if not path.exists():
+            raise KeyError(f"Unknown artifact: {artifact_id}")
+        return path.read_bytes().decode("utf-8", "surrogatepass")
+
+    def read_lines(
+        self, artifact_id: str, start: int = 1, end: Optional[int] = None
+    ) -> Tuple[List[str], int]:
+        """Return lines `start` to `end` (1-based, inclusive) and the line count"""
+        lines = self.get(artifact_id).splitlines()
+        start = max(start, 1)
+        end = len(lines) if end is None else min(end, len(lines))
+        return lines[start - 1 : end], len(lines)
+
+    def grep(
+        self, artifact_id: str, pattern: str, context: int = 0, max_matches: int = 50
+    ) -> List[Tuple[int, str]]:
+        """Return numbered lines matching a regex, with `context` lines around"""
+        regex = re.compile(pattern)
+        lines = self.get(artifact_id).splitlines()
+        matches = [i for i, line in enumerate(lines) if regex.search(line)]
+        selected = set()
+        for index in matches[:max_matches]:
+            low, high = max(index - context, 0), min(index + context, len(lines) - 1)
+            selected.update(range(low, high + 1))
+        return [(index + 1, lines[index]) for index in sorted(selected)]
+
+    def excerpt(self, text: str, limit: int) -> str:
+        """Store a text longer than `limit` and return its head, tail and id"""
+        if len(text) <= limit:
+            return text
+        artifact_id = self.put(text)
+        head = min(self.settings.head_chars, limit // 2)
+        tail = min(self.settings.tail_chars, limit - head)
+        omitted = len(text) - head - tail
+        return (
+            f"{text[:head]}\n"
+            f"[... {omitted} characters omitted. The full output "
+            f"({len(text)} characters, {text.count(chr(10)) + 1} lines) is stored as "
+            f"artifact {artifact_id}; use `read_artifact` to read lines of it or "
+            f"grep in it ...]\n"
+            f"{text[len(text) - tail:] if tail else ''}"
+        )
@@ -1,37 +1,36 @@
+"""Amazon Bedrock backend exposing an OpenAI-compatible chat completions API.
+
+boto3 is synchronous, so every call runs in a worker thread and streamed
+events are handed back to the event loop as they arrive. Requests share no
+state, which makes the client safe for concurrent agents.
+"""
+import asyncio
+import base64
 import json
 import sys
+import threading
 import time
 import uuid
-from datetime import datetime
-from typing import Dict, List, Literal, Optional
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
 
 import boto3
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
 
 
-# Global variables to track the current tool use ID across function calls
-# Tmp solution
-CURRENT_TOOLUSE_ID = None
-
+# Bedrock stop reasons and their OpenAI finish_reason equivalents
+FINISH_REASONS = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "tool_use": "tool_calls",
+    "max_tokens": "length",
+    "content_filtered": "content_filter",
+    "guardrail_intervened": "content_filter",
+}
 
-# Class to handle OpenAI-style response formatting
-class OpenAIResponse:
-    def __init__(self, data):
-        # Recursively convert nested dicts and lists to OpenAIResponse objects
-        for key, value in data.items():
-            if isinstance(value, dict):
-                value = OpenAIResponse(value)
-            elif isinstance(value, list):
-                value = [
-                    OpenAIResponse(item) if isinstance(item, dict) else item
-                    for item in value
-                ]
-            setattr(self, key, value)
+IMAGE_FORMATS = ("png", "jpeg", "gif", "webp")
 
-    def model_dump(self, *args, **kwargs):
-        # Convert object to dict and add timestamp
-        data = self.__dict__
-        data["created_at"] = datetime.now().isoformat()
-        return data
+# Bedrock equivalent of an Anthropic `cache_control` breakpoint
+CACHE_POINT = {"cachePoint": {"type": "default"}}
 
 
 # Main client class for interacting with Amazon Bedrock
@@ -57,278 +56,385 @@ class ChatCompletions:
     def __init__(self, client):
         self.client = client
 
-    def _convert_openai_tools_to_bedrock_format(self, tools):
+    @staticmethod
+    def _convert_openai_tools_to_bedrock_format(tools: List[dict]) -> List[dict]:
         # Convert OpenAI function calling format to Bedrock tool format
         bedrock_tools = []
         for tool in tools:
             if tool.get("type") == "function":
                 function = tool.get("function", {})
-                bedrock_tool = {
-                    "toolSpec": {
-                        "name": function.get("name", ""),
-                        "description": function.get("description", ""),
-                        "inputSchema": {
-                            "json": {
-                                "type": "object",
-                                "properties": function.get("parameters", {}).get(
-                                    "properties", {}
-                                ),
-                                "required": function.get("parameters", {}).get(
-                                    "required", []
-                                ),
-                            }
-                        },
+                parameters = function.get("parameters") or {}
+                bedrock_tools.append(
+                    {
+                        "toolSpec": {
+                            "name": function.get("name", ""),
+                            "description": function.get("description", ""),
+                            "inputSchema": {
+                                "json": {
+                                    "type": "object",
+                                    "properties": parameters.get("properties", {}),
+                                    "required": parameters.get("required", []),
+                                }
+                            },
+                        }
                     }
-                }
-                bedrock_tools.append(bedrock_tool)
+                )
         return bedrock_tools
 
-    def _convert_openai_messages_to_bedrock_format(self, messages):
-        # Convert OpenAI message format to Bedrock message format
-        bedrock_messages = []
-        system_prompt = []
+    @staticmethod
+    def _convert_image(url: str) -> Optional[dict]:
+        """Convert a base64 data URL into a Bedrock image block"""
+        if not url.startswith("data:") or "," not in url:
+            return None
+        header, data = url.split(",", 1)
+        image_format = header[len("data:image/") :].split(";")[0].lower()
+        image_format = "jpeg" if image_format == "jpg" else image_format
+        if image_format not in IMAGE_FORMATS:
+            image_format = "jpeg"
+        return {
+            "image": {
+                "format": image_format,
+                "source": {"bytes": base64.b64decode(data)},
+            }
+        }
+
+    @classmethod
+    def _convert_content(cls, content: Any) -> List[dict]:
+        """Convert OpenAI message content into Bedrock content blocks"""
+        if not content:
+            return []
+        if isinstance(content, str):
+            return [{"text": content}]
+
+        blocks = []
+        for item in content:
+            if isinstance(item, str):
+                item = {"type": "text", "text": item}
+            if item.get("type") == "text" and item.get("text"):
+                blocks.append({"text": item["text"]})
+                if item.get("cache_control"):
+                    blocks.append(CACHE_POINT)
+            elif item.get("type") == "image_url":
+                image_url = item.get("image_url") or {}
+                url = image_url.get("url", "") if isinstance(image_url, dict) else ""
+                image = cls._convert_image(url)
+                blocks.append(image or {"text": f"[image: {url}]"})
+        return blocks
+
+    @staticmethod
+    def _pop_cache_point(blocks: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """Split cache points off content blocks so they can be placed last"""
+        content = [block for block in blocks if "cachePoint" not in block]
+        return content, [CACHE_POINT] if len(content) < len(blocks) else []
+
+    @staticmethod
+    def _parse_arguments(arguments: str) -> dict:
+        try:
+            parsed = json.loads(arguments or "{}")
+        except json.JSONDecodeError:
+            return {}
+        return parsed if isinstance(parsed, dict) else {}
+
+    @classmethod
+    def _convert_openai_messages_to_bedrock_format(
+        cls, messages: List[dict]
+    ) -> Tuple[List[dict], List[dict]]:
+        """Convert OpenAI messages into Bedrock system prompts and messages.
+
+        Every tool call of an assistant message becomes a toolUse block, and
+        each tool message a toolResult referencing its own tool_call_id.
+        Consecutive messages of the same Bedrock role are merged, since
+        Bedrock requires the roles to alternate and expects all results of
+        one assistant turn in a single user message.
+        """
+        system_prompt: List[dict] = []
+        bedrock_messages: List[dict] = []
+
+        def append(role: str, blocks: List[dict]) -> None:
+            if not blocks:
+                return
+            if bedrock_messages and bedrock_messages[-1]["role"] == role:
+                bedrock_messages[-1]["content"].extend(blocks)
+            else:
+                bedrock_messages.append({"role": role, "content": blocks})
+
         for message in messages:
-            if message.get("role") == "system":
-                system_prompt = [{"text": message.get("content")}]
-            elif message.get("role") == "user":
-                bedrock_message = {
-                    "role": message.get("role", "user"),
-                    "content": [{"text": message.get("content")}],
-                }
-                bedrock_messages.append(bedrock_message)
-            elif message.get("role") == "assistant":
-                bedrock_message = {
-                    "role": "assistant",
-                    "content": [{"text": message.get("content")}],
-                }
-                openai_tool_calls = message.get("tool_calls", [])
-                if openai_tool_calls:
-                    bedrock_tool_use = {
-                        "toolUseId": openai_tool_calls[0]["id"],
-                        "name": openai_tool_calls[0]["function"]["name"],
-                        "input": json.loads(
-                            openai_tool_calls[0]["function"]["arguments"]
-                        ),
-                    }
-                    bedrock_message["content"].append({"toolUse": bedrock_tool_use})
-                    global CURRENT_TOOLUSE_ID
-                    CURRENT_TOOLUSE_ID = openai_tool_calls[0]["id"]
-                bedrock_messages.append(bedrock_message)
-            elif message.get("role") == "tool":
-                bedrock_message = {
-                    "role": "user",
-                    "content": [
+            role = message.get("role")
+            if role == "system":
+                system_prompt.extend(cls._convert_content(message.get("content")))
+            elif role == "user":
+                append("user", cls._convert_content(message.get("content")))
+            elif role == "assistant":
+                blocks, cache_point = cls._pop_cache_point(
+                    cls._convert_content(message.get("content"))
+                )
+                for tool_call in message.get("tool_calls") or []:
+                    function = tool_call.get("function", {})
+                    blocks.append(
+                        {
+                            "toolUse": {
+                                "toolUseId": tool_call["id"],
+                                "name": function.get("name", ""),
+                                "input": cls._parse_arguments(
+                                    function.get("arguments")
+                                ),
+                            }
+                        }
+                    )
+                append("assistant", blocks + cache_point)
+            elif role == "tool":
+                result, cache_point = cls._pop_cache_point(
+                    cls._convert_content(message.get("content"))
+                )
+                append(
+                    "user",
+                    [
                         {
                             "toolResult": {
-                                "toolUseId": CURRENT_TOOLUSE_ID,
-                                "content": [{"text": message.get("content")}],
+                                "toolUseId": message.get("tool_call_id"),
+                                "content": result or [{"text": "(no output)"}],
                             }
                         }
-                    ],
-                }
-                bedrock_messages.append(bedrock_message)
+                    ]
+                    + cache_point,
+                )
             else:
-                raise ValueError(f"Invalid role: {message.get('role')}")
+                raise ValueError(f"Invalid role: {role}")
         return system_prompt, bedrock_messages
 
-    def _convert_bedrock_response_to_openai_format(self, bedrock_response):
+    @staticmethod
+    def _convert_bedrock_response_to_openai_format(
+        bedrock_response: dict, model: str
+    ) -> ChatCompletion:
         # Convert Bedrock response format to OpenAI format
-        content = ""
-        if bedrock_response.get("output", {}).get("message", {}).get("content"):
-            content_array = bedrock_response["output"]["message"]["content"]
-            content = "".join(item.get("text", "") for item in content_array)
-        if content == "":
-            content = "."
+        message = bedrock_response.get("output", {}).get("message", {})
+        content = "".join(
+            item.get("text", "") for item in message.get("content", [])
+        ).strip()
 
         # Handle tool calls in response
-        openai_tool_calls = []
-        if bedrock_response.get("output", {}).get("message", {}).get("content"):
-            for content_item in bedrock_response["output"]["message"]["content"]:
-                if content_item.get("toolUse"):
-                    bedrock_tool_use = content_item["toolUse"]
-                    global CURRENT_TOOLUSE_ID
-                    CURRENT_TOOLUSE_ID = bedrock_tool_use["toolUseId"]
-                    openai_tool_call = {
-                        "id": CURRENT_TOOLUSE_ID,
-                        "type": "function",
-                        "function": {
-                            "name": bedrock_tool_use["name"],
-                            "arguments": json.dumps(bedrock_tool_use["input"]),
+        tool_calls = [
+            {
+                "id": item["toolUse"]["toolUseId"],
+                "type": "function",
+                "function": {
+                    "name": item["toolUse"]["name"],
+                    "arguments": json.dumps(item["toolUse"].get("input", {})),
+                },
+            }
+            for item in message.get("content", [])
+            if item.get("toolUse")
+        ]
+
+        usage = bedrock_response.get("usage", {})
+        return ChatCompletion.model_validate(
+            {
+                "id": f"chatcmpl-{uuid.uuid4()}",
+                "created": int(time.time()),
+                "model": model,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "finish_reason": FINISH_REASONS.get(
+                            bedrock_response.get("stopReason"), "stop"
+                        ),
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": content or None,
+                            "tool_calls": tool_calls or None,
                         },
                     }
-                    openai_tool_calls.append(openai_tool_call)
-
-        # Construct final OpenAI format response
-        openai_format = {
-            "id": f"chatcmpl-{uuid.uuid4()}",
-            "created": int(time.time()),
-            "object": "chat.completion",
-            "system_fingerprint": None,
-            "choices": [
-                {
-                    "finish_reason": bedrock_response.get("stopReason", "end_turn"),
-                    "index": 0,
-                    "message": {
-                        "content": content,
-                        "role": bedrock_response.get("output", {})
-                        .get("message", {})
-                        .get("role", "assistant"),
-                        "tool_calls": openai_tool_calls
-                        if openai_tool_calls != []
-                        else None,
-                        "function_call": None,
-                    },
-                }
-            ],
-            "usage": {
-                "completion_tokens": bedrock_response.get("usage", {}).get(
-                    "outputTokens", 0
-                ),
-                "prompt_tokens": bedrock_response.get("usage", {}).get(
-                    "inputTokens", 0
-                ),
-                "total_tokens": bedrock_response.get("usage", {}).get("totalTokens", 0),
-            },
-        }
-        return OpenAIResponse(openai_format)
+                ],
+                "usage": {
+                    "completion_tokens": usage.get("outputTokens", 0),
+                    "prompt_tokens": usage.get("inputTokens", 0),
+                    "total_tokens": usage.get("totalTokens", 0),
+                },
+            }
+        )
 
-    async def _invoke_bedrock(
+    def _build_request(
         self,
         model: str,
-        messages: List[Dict[str, str]],
+        messages: List[dict],
         max_tokens: int,
-        temperature: float,
-        tools: Optional[List[dict]] = None,
-        tool_choice: Literal["none", "auto", "required"] = "auto",
-        **kwargs,
-    ) -> OpenAIResponse:
-        # Non-streaming invocation of Bedrock model
+        temperature: Optional[float],
+        tools: Optional[List[dict]],
+        tool_choice: str,
+    ) -> dict:
         (
             system_prompt,
             bedrock_messages,
         ) = self._convert_openai_messages_to_bedrock_format(messages)
-        response = self.client.converse(
-            modelId=model,
-            system=system_prompt,
-            messages=bedrock_messages,
-            inferenceConfig={"temperature": temperature, "maxTokens": max_tokens},
-            toolConfig={"tools": tools} if tools else None,
+        inference_config = {"maxTokens": max_tokens}
+        if temperature is not None:
+            inference_config["temperature"] = temperature
+        request = {
+            "modelId": model,
+            "messages": bedrock_messages,
+            "inferenceConfig": inference_config,
+        }
+        if system_prompt:
+            request["system"] = system_prompt
+        if tools:
+            tool_config = {"tools": self._convert_openai_tools_to_bedrock_format(tools)}
+            if tool_choice == "required":
+                tool_config["toolChoice"] = {"any": {}}
+            elif tool_choice == "auto":
+                tool_config["toolChoice"] = {"auto": {}}
+            request["toolConfig"] = tool_config
+        return request
+
+    async def _invoke_bedrock(self, request: dict) -> ChatCompletion:
+        # Non-streaming invocation, run off the event loop
+        response = await asyncio.to_thread(self.client.converse, **request)
+        return self._convert_bedrock_response_to_openai_format(
+            response, request["modelId"]
         )
-        openai_response = self._convert_bedrock_response_to_openai_format(response)
-        return openai_response
+
+    async def _stream_events(self, request: dict) -> AsyncIterator[dict]:
+        """Yield converse_stream events read by a worker thread"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        stop = threading.Event()
+
+        def post(item: Any) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:  # The event loop was closed
+                stop.set()
+
+        def read() -> None:
+            try:
+                stream = self.client.converse_stream(**request)["stream"]
+                try:
+                    for event in stream:
+                        if stop.is_set():
+                            break
+                        post(event)
+                finally:
+                    stream.close()
+            except Exception as e:
+                post(e)
+            finally:
+                post(finished)
+
+        reader = loop.run_in_executor(None, read)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            if reader.done():
+                reader.exception()  # Already delivered through the queue
 
     async def _invoke_bedrock_stream(
-        self,
-        model: str,
-        messages: List[Dict[str, str]],
-        max_tokens: int,
-        temperature: float,
-        tools: Optional[List[dict]] = None,
-        tool_choice: Literal["none", "auto", "required"] = "auto",
-        **kwargs,
-    ) -> OpenAIResponse:
-        # Streaming invocation of Bedrock model
-        (
-            system_prompt,
-            bedrock_messages,
-        ) = self._convert_openai_messages_to_bedrock_format(messages)
-        response = self.client.converse_stream(
-            modelId=model,
-            system=system_prompt,
-            messages=bedrock_messages,
-            inferenceConfig={"temperature": temperature, "maxTokens": max_tokens},
-            toolConfig={"tools": tools} if tools else None,
-        )
+        self, request: dict
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        """Stream a Bedrock response as OpenAI chat completion chunks"""
+        completion_id = f"chatcmpl-{uuid.uuid4()}"
+        created = int(time.time())
+        tool_indices: Dict[int, int] = {}  # contentBlockIndex -> tool call index
+        finish_reason = "stop"
+        usage = None
 
-        # Initialize response structure
-        bedrock_response = {
-            "output": {"message": {"role": "", "content": []}},
-            "stopReason": "",
-            "usage": {},
-            "metrics": {},
-        }
-        bedrock_response_text = ""
-        bedrock_response_tool_input = ""
+        def chunk(delta: dict, finish: Optional[str] = None) -> ChatCompletionChunk:
+            data = {
+                "id": completion_id,
+                "created": created,
+                "model": request["modelId"],
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if finish and usage:
+                data["usage"] = usage
+            return ChatCompletionChunk.model_validate(data)
 
-        # Process streaming response
-        stream = response.get("stream")
-        if stream:
-            for event in stream:
-                if event.get("messageStart", {}).get("role"):
-                    bedrock_response["output"]["message"]["role"] = event[
-                        "messageStart"
-                    ]["role"]
-                if event.get("contentBlockDelta", {}).get("delta", {}).get("text"):
-                    bedrock_response_text += event["contentBlockDelta"]["delta"]["text"]
-                    print(
-                        event["contentBlockDelta"]["delta"]["text"], end="", flush=True
-                    )
-                if event.get("contentBlockStop", {}).get("contentBlockIndex") == 0:
-                    bedrock_response["output"]["message"]["content"].append(
-                        {"text": bedrock_response_text}
+        async for event in self._stream_events(request):
+            if "messageStart" in event:
+                yield chunk({"role": event["messageStart"].get("role", "assistant")})
+            elif "contentBlockStart" in event:
+                block = event["contentBlockStart"]
+                tool_use = block.get("start", {}).get("toolUse")
+                if tool_use:
+                    index = tool_indices.setdefault(
+                        block.get("contentBlockIndex", 0), len(tool_indices)
                     )
-                if event.get("contentBlockStart", {}).get("start", {}).get("toolUse"):
-                    bedrock_tool_use = event["contentBlockStart"]["start"]["toolUse"]
-                    tool_use = {
-                        "toolUseId": bedrock_tool_use["toolUseId"],
-                        "name": bedrock_tool_use["name"],
-                    }
-                    bedrock_response["output"]["message"]["content"].append(
-                        {"toolUse": tool_use}
+                    yield chunk(
+                        {
+                            "tool_calls": [
+                                {
+                                    "index": index,
+                                    "id": tool_use["toolUseId"],
+                                    "type": "function",
+                                    "function": {
+                                        "name": tool_use["name"],
+                                        "arguments": "",
+                                    },
+                                }
+                            ]
+                        }
                     )
-                    global CURRENT_TOOLUSE_ID
-                    CURRENT_TOOLUSE_ID = bedrock_tool_use["toolUseId"]
-                if event.get("contentBlockDelta", {}).get("delta", {}).get("toolUse"):
-                    bedrock_response_tool_input += event["contentBlockDelta"]["delta"][
-                        "toolUse"
-                    ]["input"]
-                    print(
-                        event["contentBlockDelta"]["delta"]["toolUse"]["input"],
-                        end="",
-                        flush=True,
+            elif "contentBlockDelta" in event:
+                block = event["contentBlockDelta"]
+                delta = block.get("delta", {})
+                if delta.get("text"):
+                    yield chunk({"content": delta["text"]})
+                elif "toolUse" in delta:
+                    index = tool_indices.get(block.get("contentBlockIndex", 0), 0)
+                    yield chunk(
+                        {
+                            "tool_calls": [
+                                {
+                                    "index": index,
+                                    "function": {
+                                        "arguments": delta["toolUse"].get("input", "")
+                                    },
+                                }
+                            ]
+                        }
                     )
-                if event.get("contentBlockStop", {}).get("contentBlockIndex") == 1:
-                    bedrock_response["output"]["message"]["content"][1]["toolUse"][
-                        "input"
-                    ] = json.loads(bedrock_response_tool_input)
-        print()
-        openai_response = self._convert_bedrock_response_to_openai_format(
-            bedrock_response
-        )
-        return openai_response
+            elif "messageStop" in event:
+                finish_reason = FINISH_REASONS.get(
+                    event["messageStop"].get("stopReason"), "stop"
+                )
+            elif "metadata" in event:
+                metadata_usage = event["metadata"].get("usage", {})
+                usage = {
+                    "completion_tokens": metadata_usage.get("outputTokens", 0),
+                    "prompt_tokens": metadata_usage.get("inputTokens", 0),
+                    "total_tokens": metadata_usage.get("totalTokens", 0),
+                }
+
+        yield chunk({}, finish_reason)
 
-    def create(
+    async def create(
         self,
         model: str,
-        messages: List[Dict[str, str]],
-        max_tokens: int,
-        temperature: float,
+        messages: List[dict],
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
         stream: Optional[bool] = True,
         tools: Optional[List[dict]] = None,
         tool_choice: Literal["none", "auto", "required"] = "auto",
         **kwargs,
-    ) -> OpenAIResponse:
-        # Main entry point for chat completion
-        bedrock_tools = []
-        if tools is not None:
-            bedrock_tools = self._convert_openai_tools_to_bedrock_format(tools)
+    ) -> ChatCompletion | AsyncIterator[ChatCompletionChunk]:
+        """Create a chat completion, like `AsyncOpenAI().chat.completions.create`.
+
+        Returns a ChatCompletion, or an async iterator of ChatCompletionChunk
+        objects when `stream` is set.
+        """
+        max_tokens = max_tokens or kwargs.get("max_completion_tokens") or 4096
+        request = self._build_request(
+            model, messages, max_tokens, temperature, tools, tool_choice
+        )
         if stream:
-            return self._invoke_bedrock_stream(
-                model,
-                messages,
-                max_tokens,
-                temperature,
-                bedrock_tools,
-                tool_choice,
-                **kwargs,
-            )
-        else:
-            return self._invoke_bedrock(
-                model,
-                messages,
-                max_tokens,
-                temperature,
-                bedrock_tools,
-                tool_choice,
-                **kwargs,
-            )
+            return self._invoke_bedrock_stream(request)
+        return await self._invoke_bedrock(request)
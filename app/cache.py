@@ -0,0 +1,264 @@
+"""Content-addressed cache for LLM responses.
+
+Responses are keyed by a stable hash of the request payload. Recent entries
+live in an in-memory LRU, older ones in an on-disk store with TTL and
+size-based eviction. Identical requests that are in flight at the same time
+share a single upstream call.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from app.config import PROJECT_ROOT, WORKSPACE_ROOT, LLMCacheSettings, config
+from app.logger import logger
+
+
+class CacheStats(BaseModel):
+    """Hit/miss counters of a response cache"""
+
+    memory_hits: int = Field(default=0)
+    disk_hits: int = Field(default=0)
+    coalesced: int = Field(default=0)
+    misses: int = Field(default=0)
+    evictions: int = Field(default=0)
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits + self.coalesced
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> dict:
+        return {**self.model_dump(), "hits": self.hits, "hit_rate": self.hit_rate}
+
+
+class DiskStore:
+    """Append-only directory of JSON entries with TTL and size-based eviction"""
+
+    def __init__(self, path: Path, ttl: int, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._size = sum(f.stat().st_size for f in self.path.glob("*/*.json"))
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        file = self._file(key)
+        try:
+            entry = json.loads(file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(file)
+            return None
+        return entry.get("value")
+
+    def put(self, key: str, value: Any) -> int:
+        """Store an entry and return the number of evicted entries"""
+        file = self._file(key)
+        file.parent.mkdir(exist_ok=True)
+        data = json.dumps({"created": time.time(), "value": value})
+        tmp = file.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(data, encoding="utf-8")
+        previous = file.stat().st_size if file.exists() else 0
+        os.replace(tmp, file)
+        self._size += len(data.encode("utf-8")) - previous
+        return self._evict() if self._size > self.max_bytes else 0
+
+    def _remove(self, file: Path) -> None:
+        try:
+            size = file.stat().st_size
+            file.unlink()
+            self._size -= size
+        except OSError:
+            pass
+
+    def _evict(self) -> int:
+        """Drop expired entries, then the oldest ones until under the size limit"""
+        entries = []
+        for file in self.path.glob("*/*.json"):
+            try:
+                stat = file.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+
+        evicted = 0
+        now = time.time()
+        for mtime, _, file in entries:
+            if self._size <= self.max_bytes and now - mtime <= self.ttl:
+                break
+            self._remove(file)
+            evicted += 1
+        return evicted
+
+
+def _skip_none(convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda value: None if value is None else convert(value)
+
+
+class LLMResponseCache:
+    """Two-tier response cache with single-flight deduplication"""
+
+    def __init__(self, settings: LLMCacheSettings):
+        self.max_memory_entries = settings.max_memory_entries
+        self.ttl = settings.ttl
+        self._memory: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = CacheStats()
+
+        self.disk: Optional[DiskStore] = None
+        disk_path = settings.disk_path
+        if disk_path is None:
+            disk_path = str(WORKSPACE_ROOT / ".llm_cache")
+        if disk_path:
+            path = Path(disk_path)
+            if not path.is_absolute():
+                path = PROJECT_ROOT / path
+            self.disk = DiskStore(path, settings.ttl, settings.max_disk_bytes)
+
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """Stable hash of a request payload"""
+        data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if time.time() - created > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, value: Any, created: Optional[float] = None):
+        self._memory[key] = (created or time.time(), value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Look up a cached value in memory, then on disk"""
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats.memory_hits += 1
+            return value
+        if self.disk:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.stats.disk_hits += 1
+                self._memory_put(key, value)
+                return value
+        return None
+
+    async def put(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value in both tiers"""
+        self._memory_put(key, value)
+        if self.disk:
+            try:
+                self.stats.evictions += await asyncio.to_thread(
+                    self.disk.put, key, value
+                )
+            except (OSError, TypeError, ValueError) as e:
+                logger.warning(f"Failed to persist LLM cache entry: {e}")
+
+    async def get_or_create(
+        self,
+        payload: Dict[str, Any],
+        factory: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda value: value,
+    ) -> Any:
+        """Return the cached response for a payload or compute it once.
+
+        Args:
+            payload: Request parameters that determine the response
+            factory: Coroutine function performing the upstream call
+            encode: Converts a response into a JSON-serializable value
+            decode: Converts a cached value back into a response
+
+        A None response (e.g. an empty completion) is passed through without
+        encoding or decoding and is never cached.
+        """
+        key = self.make_key(payload)
+        encode = _skip_none(encode)
+        decode = _skip_none(decode)
+
+        cached = self._memory_get(key)
+        if cached is not None:
+            self.stats.memory_hits += 1
+            logger.info(f"LLM cache hit ({key[:12]})")
+            return decode(cached)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats.coalesced += 1
+            logger.info(f"LLM request coalesced with in-flight call ({key[:12]})")
+            try:
+                return decode(await asyncio.shield(inflight))
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The owning call was cancelled, perform the request ourselves
+                self.stats.coalesced -= 1
+                return await self.get_or_create(payload, factory, encode, decode)
+
+        # Register before any await so concurrent callers coalesce onto us
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self.get(key) if self.disk else None
+            if value is not None:
+                logger.info(f"LLM cache hit on disk ({key[:12]})")
+                future.set_result(value)
+                return decode(value)
+
+            self.stats.misses += 1
+            value = encode(await factory())
+            future.set_result(value)
+            if value is not None:
+                await self.put(key, value)
+            return decode(value)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Waiters re-raise it; avoid "exception was never retrieved"
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+
+_response_cache: Optional[LLMResponseCache] = None
+
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    """Return the process-wide response cache, or None if caching is disabled"""
+    global _response_cache
+    settings = config.llm_cache
+    if not settings or not settings.enabled:
+        return None
+    if _response_cache is None:
+        _response_cache = LLMResponseCache(settings)
+    return _response_cache
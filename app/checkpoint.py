@@ -0,0 +1,169 @@
+"""Crash-safe checkpoints of agent and flow runs.
+
+After every step an agent writes the messages added to its memory since the
+previous checkpoint, plus its small scalar state, to a SQLite database in one
+transaction. Stored messages form an append-only log per agent; trimming
+memory from the front only moves the start of the stored memory, and any
+other rewrite (e.g. a compaction) appends the new memory once in full. A run
+whose process died can be continued with `resume(run_id)`.
+"""
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import PROJECT_ROOT, config
+from app.schema import Message
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    key TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    state TEXT NOT NULL,
+    memory_start INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (key, seq)
+);
+"""
+
+
+class CheckpointStore:
+    """SQLite store of run checkpoints, keyed by `<run_id>/<agent or flow>`"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path))
+        # WAL keeps commits cheap while a crash still never loses a commit
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def save(
+        self,
+        key: str,
+        run_id: str,
+        status: str,
+        state: Dict[str, Any],
+        memory_start: int,
+        messages: List[Tuple[int, Message]],
+    ) -> None:
+        """Write a checkpoint and the messages added since the previous one"""
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO messages (key, seq, message) VALUES (?, ?, ?)",
+                [(key, seq, message.model_dump_json()) for seq, message in messages],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(key, run_id, status, state, memory_start, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    run_id,
+                    status,
+                    json.dumps(state, ensure_ascii=False),
+                    memory_start,
+                    time.time(),
+                ),
+            )
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the status, state and memory of a checkpoint"""
+        row = self._db.execute(
+            "SELECT status, state, memory_start FROM checkpoints WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, state, memory_start = row
+        rows = self._db.execute(
+            "SELECT seq, message FROM messages WHERE key = ? AND seq >= ? ORDER BY seq",
+            (key, memory_start),
+        ).fetchall()
+        return {
+            "status": status,
+            "state": json.loads(state),
+            "memory_start": memory_start,
+            "messages": [Message.model_validate_json(message) for _, message in rows],
+        }
+
+    def list_runs(self) -> List[Dict[str, Any]]:
+        """Checkpoints of all runs, most recently updated first"""
+        rows = self._db.execute(
+            "SELECT key, run_id, status, updated_at FROM checkpoints "
+            "ORDER BY updated_at DESC"
+        ).fetchall()
+        return [
+            {"key": key, "run_id": run_id, "status": status, "updated_at": updated}
+            for key, run_id, status, updated in rows
+        ]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class MemoryTracker:
+    """Computes which messages of a memory changed since its last checkpoint.
+
+    Stored messages of a key have increasing sequence numbers and the memory
+    is always the contiguous range starting at `memory_start`.
+    """
+
+    def __init__(self, messages: Optional[List[Message]] = None, start: int = 0):
+        self._messages: List[Message] = list(messages or [])
+        self._seqs = list(range(start, start + len(self._messages)))
+        self.next_seq = start + len(self._messages)
+
+    def delta(self, messages: List[Message]) -> Tuple[int, List[Tuple[int, Message]]]:
+        """Return the new memory start and the messages to store"""
+        prior = self._messages
+        dropped = 0
+        if prior:
+            # Trimming drops messages from the front; compare by identity
+            dropped = next(
+                (
+                    i
+                    for i, message in enumerate(prior)
+                    if messages and message is messages[0]
+                ),
+                len(prior),
+            )
+            kept = prior[dropped:]
+            if len(kept) > len(messages) or any(
+                old is not new for old, new in zip(kept, messages)
+            ):
+                dropped = len(prior)  # Rewritten, store it again in full
+        kept_count = len(prior) - dropped
+
+        added = messages[kept_count:]
+        seqs = list(range(self.next_seq, self.next_seq + len(added)))
+        self.next_seq += len(added)
+        self._messages = list(messages)
+        self._seqs = self._seqs[dropped:] + seqs
+        start = self._seqs[0] if self._seqs else self.next_seq
+        return start, list(zip(seqs, added))
+
+
+_store: Optional[CheckpointStore] = None
+
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    """Return the process-wide checkpoint store, or None if disabled"""
+    global _store
+    settings = config.checkpoint
+    if not settings or not settings.enabled:
+        return None
+    if _store is None:
+        path = Path(settings.path)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        _store = CheckpointStore(path)
+    return _store
@@ -0,0 +1,221 @@
+"""Compaction of agent memory close to the context limit.
+
+Once a step's prompt uses a configurable fraction of the context, the oldest
+messages are replaced by a summary written by a (possibly cheaper) LLM
+profile. The first user message, which holds the task, and the most recent
+messages are kept verbatim. An assistant message with tool calls is always
+kept or dropped together with its tool results.
+"""
+import time
+from typing import List, Optional, Tuple
+
+from app.config import CompactionSettings, config
+from app.ledger import call_site
+from app.llm import LLM, RequestPriority
+from app.logger import logger
+from app.prompt.compaction import SUMMARY_PREFIX, SYSTEM_PROMPT
+from app.schema import CompactionRecord, Memory, Message, Role
+
+
+# Characters of each message included in the transcript to summarize
+MAX_TRANSCRIPT_CHARS = 4000
+
+
+def group_messages(messages: List[Message]) -> List[List[Message]]:
+    """Split messages into units that must not be separated.
+
+    An assistant message with tool calls forms one unit with the tool
+    messages answering it; every other message is a unit of its own.
+    """
+    groups: List[List[Message]] = []
+    pending_ids: set = set()
+    for message in messages:
+        if message.role == Role.TOOL and message.tool_call_id in pending_ids:
+            groups[-1].append(message)
+            pending_ids.discard(message.tool_call_id)
+            continue
+        groups.append([message])
+        pending_ids = (
+            {call.id for call in message.tool_calls}
+            if message.role == Role.ASSISTANT and message.tool_calls
+            else set()
+        )
+    return groups
+
+
+def render_transcript(messages: List[Message]) -> str:
+    """Render messages as plain text for the summarizer"""
+    lines = []
+    for message in messages:
+        content = message.content or ""
+        if len(content) > MAX_TRANSCRIPT_CHARS:
+            content = content[:MAX_TRANSCRIPT_CHARS] + " ...[truncated]"
+        if message.role == Role.TOOL:
+            lines.append(f"[tool result: {message.name}]\n{content}")
+            continue
+        if content:
+            lines.append(f"[{message.role}]\n{content}")
+        for call in message.tool_calls or []:
+            arguments = call.function.arguments
+            if len(arguments) > MAX_TRANSCRIPT_CHARS:
+                arguments = arguments[:MAX_TRANSCRIPT_CHARS] + " ...[truncated]"
+            lines.append(f"[tool call: {call.function.name}] {arguments}")
+    return "\n\n".join(lines)
+
+
+class ContextCompactor:
+    """Replaces the oldest messages of a memory with a summary when needed"""
+
+    def __init__(self, settings: CompactionSettings):
+        self.settings = settings
+
+    @classmethod
+    def from_config(cls) -> Optional["ContextCompactor"]:
+        """Create a compactor from the config, or None if compaction is disabled"""
+        settings = config.compaction
+        if not settings or not settings.enabled:
+            return None
+        return cls(settings)
+
+    def context_limit(self, llm: LLM) -> Optional[int]:
+        # max_input_tokens budgets a whole run, not the size of one request
+        return self.settings.context_window
+
+    def can_relieve(self, llm: LLM) -> bool:
+        """Whether a compacted prompt would fit in what is left of the LLM's budget"""
+        limit = self.context_limit(llm)
+        return bool(limit) and llm.check_token_limit(
+            int(self.settings.target_ratio * limit)
+        )
+
+    @staticmethod
+    def count_tokens(llm: LLM, messages: List[Message]) -> int:
+        if not messages:
+            return 0
+        return llm.count_message_tokens(
+            llm.format_messages(messages, supports_images=True)
+        )
+
+    async def compact(
+        self,
+        memory: Memory,
+        llm: LLM,
+        system_msgs: Optional[List[Message]] = None,
+        tools: Optional[List[dict]] = None,
+        force: bool = False,
+    ) -> Optional[CompactionRecord]:
+        """Compact the memory if the prompt is close to the context limit.
+
+        Args:
+            memory: Memory to compact in place
+            llm: LLM the prompt is sent to, used for token counting
+            system_msgs: System messages sent along with the memory
+            tools: Tool definitions sent along with the memory
+            force: Compact even if the prompt is below the trigger threshold
+
+        Returns:
+            The record of the compaction, or None if nothing was compacted
+        """
+        limit = self.context_limit(llm)
+        if not limit:
+            return None
+
+        overhead = self.count_tokens(llm, system_msgs or [])
+        overhead += llm.token_counter.count_tools(tools)
+        groups = group_messages(memory.messages)
+        sizes = [self.count_tokens(llm, group) for group in groups]
+        tokens_before = overhead + sum(sizes)
+        if not force and tokens_before < self.settings.trigger_ratio * limit:
+            return None
+
+        # Keep the task and as many recent units as fit in the target size
+        pinned = 1 if groups and groups[0][0].role == Role.USER else 0
+        budget = self.settings.target_ratio * limit - overhead - sizes[0] * pinned
+        budget -= self.settings.max_summary_tokens
+        start = len(groups)
+        while start > pinned + 1 and sizes[start - 1] <= budget:
+            budget -= sizes[start - 1]
+            start -= 1
+        if start == len(groups):
+            start -= 1  # The latest unit is always kept
+        if start <= pinned:
+            return None
+
+        dropped = [message for group in groups[pinned:start] for message in group]
+        summary = await self.summarize(dropped)
+        summary_msg = Message.user_message(
+            f"{SUMMARY_PREFIX.format(count=len(dropped))}\n{summary}"
+        )
+        kept = [message for group in groups[start:] for message in group]
+        memory.messages = (
+            [message for group in groups[:pinned] for message in group]
+            + [summary_msg]
+            + kept
+        )
+
+        record = CompactionRecord(
+            created_at=time.time(),
+            tokens_before=tokens_before,
+            tokens_after=overhead + self.count_tokens(llm, memory.messages),
+            summary=summary,
+            tool_calls=[
+                call.function.name
+                for message in dropped
+                for call in message.tool_calls or []
+            ],
+            message_count=len(dropped),
+            # Kept on disk rather than in the record, which lives as long as the memory
+            spill_start=memory.spill(dropped),
+        )
+        memory.compactions.append(record)
+        logger.info(
+            f"🗜️ Compacted {len(dropped)} messages: "
+            f"{record.tokens_before} -> {record.tokens_after} prompt tokens"
+        )
+        return record
+
+    async def summarize(self, messages: List[Message]) -> str:
+        """Summarize messages, falling back to a plain digest if the LLM fails"""
+        summarizer = LLM(config_name=self.settings.llm_profile)
+        transcript = render_transcript(messages)
+        # The summarizer may be the agent's own LLM, whose budget is used up
+        if not summarizer.check_token_limit(summarizer.count_tokens(transcript)):
+            logger.warning("Token budget too small to summarize compacted messages")
+            return self.digest(messages)
+        try:
+            with call_site("compaction"):
+                summary = await summarizer.ask(
+                    [Message.user_message(transcript)],
+                    system_msgs=[
+                        Message.system_message(
+                            SYSTEM_PROMPT.format(
+                                max_tokens=self.settings.max_summary_tokens
+                            )
+                        )
+                    ],
+                    stream=False,
+                    priority=RequestPriority.BACKGROUND,
+                )
+            return self._truncate(summarizer, summary)
+        except Exception as e:
+            logger.warning(f"Failed to summarize compacted messages: {e}")
+            return self.digest(messages)
+
+    def _truncate(self, llm: LLM, text: str) -> str:
+        tokens = llm.tokenizer.encode(text)
+        if len(tokens) <= self.settings.max_summary_tokens:
+            return text
+        return llm.tokenizer.decode(tokens[: self.settings.max_summary_tokens])
+
+    @staticmethod
+    def digest(messages: List[Message]) -> str:
+        """List the tool calls of the dropped messages without an LLM"""
+        calls: List[Tuple[str, str]] = [
+            (call.function.name, call.function.arguments[:200])
+            for message in messages
+            for call in message.tool_calls or []
+        ]
+        lines = [f"- {name}({arguments})" for name, arguments in calls]
+        return "Earlier tool calls (results no longer available):\n" + (
+            "\n".join(lines) or "- none"
+        )
@@ -28,6 +28,28 @@ class LLMSettings(BaseModel):
     temperature: float = Field(1.0, description="Sampling temperature")
     api_type: str = Field(..., description="Azure, Openai, or Ollama")
     api_version: str = Field(..., description="Azure Openai version if AzureOpenai")
+    rpm: Optional[int] = Field(
+        None,
+        description="Requests per minute allowed for this model (None for unlimited)",
+    )
+    tpm: Optional[int] = Field(
+        None,
+        description="Tokens per minute allowed for this model (None for unlimited)",
+    )
+    endpoints: List[str] = Field(
+        default_factory=list,
+        description="Names of other llm profiles serving the same model to balance requests across",
+    )
+    load_balancing: str = Field(
+        "least_outstanding",
+        description="Endpoint selection strategy: least_outstanding or latency",
+    )
+    circuit_breaker_threshold: int = Field(
+        3, description="Consecutive failures before an endpoint is ejected"
+    )
+    circuit_breaker_cooldown: float = Field(
+        30.0, description="Seconds an ejected endpoint is skipped before a probe"
+    )
 
 
 class ProxySettings(BaseModel):
@@ -66,6 +88,272 @@ class RunflowSettings(BaseModel):
     )
 
 
+class LLMCacheSettings(BaseModel):
+    """Configuration for the LLM response cache"""
+
+    enabled: bool = Field(False, description="Whether to cache LLM responses")
+    max_memory_entries: int = Field(
+        256, description="Number of recent responses kept in the in-memory LRU"
+    )
+    disk_path: Optional[str] = Field(
+        None,
+        description="Directory of the on-disk store (None for <workspace>/.llm_cache, empty string to disable)",
+    )
+    ttl: int = Field(
+        7 * 24 * 3600, description="Seconds before a cached response expires"
+    )
+    max_disk_bytes: int = Field(
+        256 * 1024 * 1024, description="Size limit of the on-disk store in bytes"
+    )
+
+
+class HTTPPoolSettings(BaseModel):
+    """Configuration for the HTTP connection pool shared by LLM clients"""
+
+    max_connections: int = Field(
+        1000, description="Maximum number of concurrent connections per event loop"
+    )
+    max_keepalive_connections: int = Field(
+        100, description="Maximum number of idle connections kept alive"
+    )
+    keepalive_expiry: float = Field(
+        30.0, description="Seconds an idle connection is kept alive"
+    )
+    http2: bool = Field(
+        False, description="Whether to negotiate HTTP/2 (requires the h2 package)"
+    )
+    connect_timeout: float = Field(5.0, description="Connect timeout in seconds")
+    read_timeout: float = Field(600.0, description="Read timeout in seconds")
+    write_timeout: float = Field(600.0, description="Write timeout in seconds")
+    pool_timeout: float = Field(
+        600.0, description="Seconds to wait for a free connection from the pool"
+    )
+
+
+class HedgingSettings(BaseModel):
+    """Configuration for hedged (duplicated) slow tool requests"""
+
+    enabled: bool = Field(False, description="Whether to hedge slow ask_tool requests")
+    percentile: float = Field(
+        0.9, description="Latency percentile after which a duplicate is sent"
+    )
+    min_samples: int = Field(
+        20, description="Latency samples required before hedging starts"
+    )
+    window: int = Field(200, description="Number of recent latencies tracked per model")
+    min_delay: float = Field(
+        1.0, description="Minimum seconds to wait before sending a duplicate"
+    )
+    budget: float = Field(
+        0.1, description="Maximum extra requests as a fraction of all requests"
+    )
+
+
+class CompactionSettings(BaseModel):
+    """Configuration for compacting agent memory close to the context limit"""
+
+    enabled: bool = Field(False, description="Whether to compact agent memory")
+    llm_profile: str = Field(
+        "default", description="llm profile used to summarize compacted messages"
+    )
+    context_window: Optional[int] = Field(
+        None,
+        description="Context size of the model in tokens, required for compaction",
+    )
+    trigger_ratio: float = Field(
+        0.8, description="Fraction of the context at which memory is compacted"
+    )
+    target_ratio: float = Field(
+        0.5, description="Fraction of the context kept after compaction"
+    )
+    max_summary_tokens: int = Field(
+        1024, description="Maximum tokens of the summary replacing old messages"
+    )
+
+
+class MemorySettings(BaseModel):
+    """Configuration for agent memory"""
+
+    max_images: Optional[int] = Field(
+        3,
+        description="Images kept inline in memory, older ones become text placeholders (None keeps all)",
+    )
+    max_messages: int = Field(100, description="Messages kept in memory")
+    max_tokens: Optional[int] = Field(
+        None, description="Estimated tokens kept in memory (None for no limit)"
+    )
+    trim_ratio: float = Field(
+        0.8,
+        description="Share of the limits kept after trimming, so trims happen in batches",
+    )
+    spill_dir: Optional[str] = Field(
+        None,
+        description="Directory of append-only logs of trimmed messages (None drops them)",
+    )
+
+
+class LedgerSettings(BaseModel):
+    """Configuration for the per-run usage ledger"""
+
+    export_dir: Optional[str] = Field(
+        None, description="Directory the ledger of each run is written to"
+    )
+    export_formats: List[str] = Field(
+        default_factory=lambda: ["json"], description="Export formats: json, csv"
+    )
+    max_tokens: Optional[int] = Field(
+        None, description="Token budget of a run (None for unlimited)"
+    )
+    max_llm_calls: Optional[int] = Field(
+        None, description="LLM call budget of a run (None for unlimited)"
+    )
+
+
+class CheckpointSettings(BaseModel):
+    """Configuration for crash-safe run checkpoints"""
+
+    enabled: bool = Field(False, description="Whether to checkpoint runs")
+    path: str = Field(
+        "workspace/.checkpoints.db", description="SQLite database of checkpoints"
+    )
+
+
+class TracingSettings(BaseModel):
+    """Configuration for step-level tracing spans"""
+
+    enabled: bool = Field(False, description="Whether to record spans")
+    export_path: Optional[str] = Field(
+        None, description="JSON Lines file finished spans are appended to"
+    )
+
+
+class DeadlineSettings(BaseModel):
+    """Configuration for step and tool call deadlines"""
+
+    step_timeout: Optional[float] = Field(
+        None, description="Seconds one agent step may take (None for no limit)"
+    )
+    tool_timeout: Optional[float] = Field(
+        None, description="Seconds one tool call may take (None for no limit)"
+    )
+    tool_timeouts: Dict[str, float] = Field(
+        default_factory=dict, description="Per-tool overrides of tool_timeout"
+    )
+
+
+class ArtifactSettings(BaseModel):
+    """Configuration for storing full tool outputs that are too large to observe"""
+
+    enabled: bool = Field(False, description="Whether to spill large outputs")
+    dir: str = Field(
+        "workspace/.artifacts", description="Directory of the stored outputs"
+    )
+    head_chars: int = Field(
+        2000, description="Characters from the start kept in the observation"
+    )
+    tail_chars: int = Field(
+        2000, description="Characters from the end kept in the observation"
+    )
+
+
+class ObservationSettings(BaseModel):
+    """Configuration for compressing tool outputs before they enter memory"""
+
+    enabled: bool = Field(False, description="Whether to compress tool outputs")
+    minify_json: bool = Field(True, description="Whether to minify JSON outputs")
+    max_array_items: int = Field(
+        20, description="JSON arrays longer than this become a schema and samples"
+    )
+    sample_items: int = Field(3, description="Items kept from a summarized array")
+    min_repeats: int = Field(
+        3, description="Similar consecutive log lines collapsed into a count"
+    )
+    log_tools: List[str] = Field(
+        default_factory=lambda: ["bash", "sandbox_shell"],
+        description="Tools whose outputs are logs with repeated lines",
+    )
+    page_tools: List[str] = Field(
+        default_factory=lambda: ["web_search", "browser_use", "crawl4ai"],
+        description="Tools whose outputs are page text",
+    )
+
+
+class InterpreterSettings(BaseModel):
+    """Configuration for PythonExecute interpreters, pooled or one per call"""
+
+    enabled: bool = Field(
+        False,
+        description="Whether PythonExecute runs code in persistent pooled interpreters",
+    )
+    pool_size: int = Field(2, description="Idle interpreters kept started")
+    max_calls: int = Field(
+        200, description="Executions after which an interpreter is recycled"
+    )
+    max_memory_mb: int = Field(
+        2048, description="Resident memory above which an interpreter is recycled"
+    )
+    max_output_chars: int = Field(
+        100_000, description="Output kept of one execution, half head and half tail"
+    )
+    interrupt_grace: float = Field(
+        2.0,
+        description="Seconds an interrupted execution has to stop before its interpreter is killed",
+    )
+    preload: List[str] = Field(
+        default_factory=list, description="Modules imported by idle interpreters"
+    )
+    memory_limit_mb: Optional[int] = Field(
+        None, description="Address space limit of an interpreter (RLIMIT_AS)"
+    )
+    cpu_time_limit: Optional[int] = Field(
+        None, description="CPU seconds of one execution (RLIMIT_CPU)"
+    )
+    file_size_limit_mb: Optional[int] = Field(
+        None, description="Size limit of files written by the code (RLIMIT_FSIZE)"
+    )
+    open_files_limit: Optional[int] = Field(
+        None, description="Open file descriptors of an interpreter (RLIMIT_NOFILE)"
+    )
+
+    @property
+    def limits(self) -> Dict[str, Optional[int]]:
+        """Resource limits in the form `python_worker.apply_limits` expects"""
+        return {
+            "memory_mb": self.memory_limit_mb,
+            "cpu_seconds": self.cpu_time_limit,
+            "file_size_mb": self.file_size_limit_mb,
+            "open_files": self.open_files_limit,
+        }
+
+
+class LoopDetectionSettings(BaseModel):
+    """Configuration for detecting agents that repeat the same steps"""
+
+    enabled: bool = Field(False, description="Whether to detect repeated step cycles")
+    max_cycle_length: int = Field(
+        3, description="Longest cycle of steps that is detected"
+    )
+    min_repeats: int = Field(
+        3, description="Consecutive repetitions of a cycle that count as a loop"
+    )
+    stop: bool = Field(
+        True, description="Stop the agent if it keeps looping after two warnings"
+    )
+
+
+class PromptCacheSettings(BaseModel):
+    """Configuration for laying out agent prompts for provider prefix caching"""
+
+    enabled: bool = Field(False, description="Whether to use the cache-friendly layout")
+    cache_control: str = Field(
+        "auto",
+        description="Emit cache breakpoints: auto (Anthropic models), always or never",
+    )
+    max_breakpoints: int = Field(
+        3, description="Maximum cache breakpoints per request (Anthropic allows 4)"
+    )
+
+
 class BrowserSettings(BaseModel):
     headless: bool = Field(False, description="Whether to run browser in headless mode")
     disable_security: bool = Field(
@@ -189,6 +477,48 @@ class AppConfig(BaseModel):
     daytona_config: Optional[DaytonaSettings] = Field(
         None, description="Daytona configuration"
     )
+    llm_cache_config: Optional[LLMCacheSettings] = Field(
+        None, description="LLM response cache configuration"
+    )
+    http_pool_config: Optional[HTTPPoolSettings] = Field(
+        None, description="LLM HTTP connection pool configuration"
+    )
+    llm_hedging_config: Optional[HedgingSettings] = Field(
+        None, description="Hedged LLM request configuration"
+    )
+    compaction_config: Optional[CompactionSettings] = Field(
+        None, description="Memory compaction configuration"
+    )
+    memory_config: Optional[MemorySettings] = Field(
+        None, description="Agent memory configuration"
+    )
+    ledger_config: Optional[LedgerSettings] = Field(
+        None, description="Usage ledger configuration"
+    )
+    prompt_cache_config: Optional[PromptCacheSettings] = Field(
+        None, description="Prompt cache layout configuration"
+    )
+    loop_detection_config: Optional[LoopDetectionSettings] = Field(
+        None, description="Loop detection configuration"
+    )
+    checkpoint_config: Optional[CheckpointSettings] = Field(
+        None, description="Run checkpoint configuration"
+    )
+    tracing_config: Optional[TracingSettings] = Field(
+        None, description="Tracing configuration"
+    )
+    deadlines_config: Optional[DeadlineSettings] = Field(
+        None, description="Deadline configuration"
+    )
+    artifacts_config: Optional[ArtifactSettings] = Field(
+        None, description="Artifact store configuration"
+    )
+    observation_config: Optional[ObservationSettings] = Field(
+        None, description="Observation compression configuration"
+    )
+    interpreter_config: Optional[InterpreterSettings] = Field(
+        None, description="Interpreter pool configuration"
+    )
 
     class Config:
         arbitrary_types_allowed = True
@@ -246,6 +576,12 @@ class Config:
             "temperature": base_llm.get("temperature", 1.0),
             "api_type": base_llm.get("api_type", ""),
             "api_version": base_llm.get("api_version", ""),
+            "rpm": base_llm.get("rpm"),
+            "tpm": base_llm.get("tpm"),
+            "endpoints": base_llm.get("endpoints", []),
+            "load_balancing": base_llm.get("load_balancing", "least_outstanding"),
+            "circuit_breaker_threshold": base_llm.get("circuit_breaker_threshold", 3),
+            "circuit_breaker_cooldown": base_llm.get("circuit_breaker_cooldown", 30.0),
         }
 
         # handle browser config.
@@ -310,11 +646,82 @@ class Config:
             run_flow_settings = RunflowSettings(**run_flow_config)
         else:
             run_flow_settings = RunflowSettings()
+        llm_cache_config = raw_config.get("llm_cache")
+        if llm_cache_config:
+            llm_cache_settings = LLMCacheSettings(**llm_cache_config)
+        else:
+            llm_cache_settings = LLMCacheSettings()
+        http_pool_config = raw_config.get("http_pool")
+        if http_pool_config:
+            http_pool_settings = HTTPPoolSettings(**http_pool_config)
+        else:
+            http_pool_settings = HTTPPoolSettings()
+        llm_hedging_config = raw_config.get("llm_hedging")
+        if llm_hedging_config:
+            llm_hedging_settings = HedgingSettings(**llm_hedging_config)
+        else:
+            llm_hedging_settings = HedgingSettings()
+        compaction_config = raw_config.get("compaction")
+        if compaction_config:
+            compaction_settings = CompactionSettings(**compaction_config)
+        else:
+            compaction_settings = CompactionSettings()
+        memory_config = raw_config.get("memory")
+        if memory_config:
+            memory_settings = MemorySettings(**memory_config)
+        else:
+            memory_settings = MemorySettings()
+        ledger_config = raw_config.get("ledger")
+        if ledger_config:
+            ledger_settings = LedgerSettings(**ledger_config)
+        else:
+            ledger_settings = LedgerSettings()
+        prompt_cache_config = raw_config.get("prompt_cache")
+        if prompt_cache_config:
+            prompt_cache_settings = PromptCacheSettings(**prompt_cache_config)
+        else:
+            prompt_cache_settings = PromptCacheSettings()
+        loop_detection_config = raw_config.get("loop_detection")
+        if loop_detection_config:
+            loop_detection_settings = LoopDetectionSettings(**loop_detection_config)
+        else:
+            loop_detection_settings = LoopDetectionSettings()
+        checkpoint_config = raw_config.get("checkpoint")
+        if checkpoint_config:
+            checkpoint_settings = CheckpointSettings(**checkpoint_config)
+        else:
+            checkpoint_settings = CheckpointSettings()
+        tracing_config = raw_config.get("tracing")
+        if tracing_config:
+            tracing_settings = TracingSettings(**tracing_config)
+        else:
+            tracing_settings = TracingSettings()
+        deadlines_config = raw_config.get("deadlines")
+        if deadlines_config:
+            deadlines_settings = DeadlineSettings(**deadlines_config)
+        else:
+            deadlines_settings = DeadlineSettings()
+        artifacts_config = raw_config.get("artifacts")
+        if artifacts_config:
+            artifacts_settings = ArtifactSettings(**artifacts_config)
+        else:
+            artifacts_settings = ArtifactSettings()
+        observation_config = raw_config.get("observation")
+        if observation_config:
+            observation_settings = ObservationSettings(**observation_config)
+        else:
+            observation_settings = ObservationSettings()
+        interpreter_config = raw_config.get("interpreter")
+        if interpreter_config:
+            interpreter_settings = InterpreterSettings(**interpreter_config)
+        else:
+            interpreter_settings = InterpreterSettings()
         config_dict = {
             "llm": {
                 "default": default_settings,
                 **{
-                    name: {**default_settings, **override_config}
+                    # Profiles do not inherit the endpoint pool of the default one
+                    name: {**default_settings, "endpoints": [], **override_config}
                     for name, override_config in llm_overrides.items()
                 },
             },
@@ -324,6 +731,20 @@ class Config:
             "mcp_config": mcp_settings,
             "run_flow_config": run_flow_settings,
             "daytona_config": daytona_settings,
+            "llm_cache_config": llm_cache_settings,
+            "http_pool_config": http_pool_settings,
+            "llm_hedging_config": llm_hedging_settings,
+            "compaction_config": compaction_settings,
+            "memory_config": memory_settings,
+            "ledger_config": ledger_settings,
+            "prompt_cache_config": prompt_cache_settings,
+            "loop_detection_config": loop_detection_settings,
+            "checkpoint_config": checkpoint_settings,
+            "tracing_config": tracing_settings,
+            "deadlines_config": deadlines_settings,
+            "artifacts_config": artifacts_settings,
+            "observation_config": observation_settings,
+            "interpreter_config": interpreter_settings,
         }
 
         self._config = AppConfig(**config_dict)
@@ -358,6 +779,76 @@ class Config:
         """Get the Run Flow configuration"""
         return self._config.run_flow_config
 
+    @property
+    def llm_cache(self) -> LLMCacheSettings:
+        """Get the LLM response cache configuration"""
+        return self._config.llm_cache_config
+
+    @property
+    def http_pool(self) -> HTTPPoolSettings:
+        """Get the LLM HTTP connection pool configuration"""
+        return self._config.http_pool_config
+
+    @property
+    def llm_hedging(self) -> HedgingSettings:
+        """Get the hedged LLM request configuration"""
+        return self._config.llm_hedging_config
+
+    @property
+    def compaction(self) -> CompactionSettings:
+        """Get the memory compaction configuration"""
+        return self._config.compaction_config
+
+    @property
+    def memory(self) -> MemorySettings:
+        """Get the agent memory configuration"""
+        return self._config.memory_config
+
+    @property
+    def ledger(self) -> LedgerSettings:
+        """Get the usage ledger configuration"""
+        return self._config.ledger_config
+
+    @property
+    def prompt_cache(self) -> PromptCacheSettings:
+        """Get the prompt cache layout configuration"""
+        return self._config.prompt_cache_config
+
+    @property
+    def loop_detection(self) -> LoopDetectionSettings:
+        """Get the loop detection configuration"""
+        return self._config.loop_detection_config
+
+    @property
+    def checkpoint(self) -> CheckpointSettings:
+        """Get the run checkpoint configuration"""
+        return self._config.checkpoint_config
+
+    @property
+    def tracing(self) -> TracingSettings:
+        """Get the tracing configuration"""
+        return self._config.tracing_config
+
+    @property
+    def deadlines(self) -> DeadlineSettings:
+        """Get the deadline configuration"""
+        return self._config.deadlines_config
+
+    @property
+    def artifacts(self) -> ArtifactSettings:
+        """Get the artifact store configuration"""
+        return self._config.artifacts_config
+
+    @property
+    def observation(self) -> ObservationSettings:
+        """Get the observation compression configuration"""
+        return self._config.observation_config
+
+    @property
+    def interpreter(self) -> InterpreterSettings:
+        """Get the interpreter pool configuration"""
+        return self._config.interpreter_config
+
     @property
     def workspace_root(self) -> Path:
         """Get the workspace root directory"""
@@ -0,0 +1,87 @@
+"""Deadlines of agent steps and tool calls.
+
+A deadline set with `deadline_scope` applies to everything awaited inside
+it, including tasks started there; nested scopes can only shorten it.
+Operations with their own timeouts (bash commands, Python code, sandbox
+commands, page loads) cap them with `remaining()`, and `run_with_deadline`
+cancels an awaitable that overruns, so tools release their processes and
+connections in their cancellation handlers.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+from app.config import DeadlineSettings, config
+from app.exceptions import DeadlineExceeded
+
+
+T = TypeVar("T")
+
+# Absolute time.monotonic() of the current deadline
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def _settings() -> DeadlineSettings:
+    return config.deadlines or DeadlineSettings()
+
+
+def default_step_timeout() -> Optional[float]:
+    """Configured time limit of one agent step"""
+    return _settings().step_timeout
+
+
+def tool_timeout(name: str) -> Optional[float]:
+    """Configured time limit of one call of a tool"""
+    settings = _settings()
+    return settings.tool_timeouts.get(name, settings.tool_timeout)
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Seconds left until the current deadline, capped at `default`"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    left = max(deadline - time.monotonic(), 0.0)
+    return left if default is None else min(left, default)
+
+
+def expired() -> bool:
+    """Whether the current deadline has passed"""
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[Optional[float]]:
+    """Set a deadline `timeout` seconds from now, unless an earlier one applies"""
+    deadline = _deadline.get()
+    if timeout is not None:
+        ours = time.monotonic() + timeout
+        deadline = ours if deadline is None else min(deadline, ours)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+async def run_with_deadline(
+    awaitable: Awaitable[T], timeout: Optional[float], what: str
+) -> T:
+    """Await under a deadline, cancelling the awaitable when it is reached.
+
+    Raises:
+        DeadlineExceeded: If the deadline passed before the awaitable finished.
+    """
+    with deadline_scope(timeout):
+        limit = remaining()
+        if limit is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, limit)
+        except asyncio.TimeoutError:
+            if not expired():
+                raise  # A timeout of the awaitable itself
+            raise DeadlineExceeded(f"{what} exceeded its deadline") from None
@@ -11,3 +11,11 @@ class OpenManusError(Exception):
 
 class TokenLimitExceeded(OpenManusError):
     """Exception raised when the token limit is exceeded"""
+
+
+class TokenBudgetExceeded(TokenLimitExceeded):
+    """Exception raised when a run has used up its token or call budget"""
+
+
+class DeadlineExceeded(OpenManusError):
+    """Exception raised when a step or tool call runs past its deadline"""
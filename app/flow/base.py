@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.agent.base import BaseAgent
+from app.checkpoint import CheckpointStore, get_checkpoint_store
+from app.ledger import RunLedger
 
 
 class BaseFlow(BaseModel, ABC):
@@ -12,6 +14,8 @@ class BaseFlow(BaseModel, ABC):
     agents: Dict[str, BaseAgent]
     tools: Optional[List] = None
     primary_agent_key: Optional[str] = None
+    ledger: Optional[RunLedger] = None
+    checkpoints: Optional[CheckpointStore] = Field(default_factory=get_checkpoint_store)
 
     class Config:
         arbitrary_types_allowed = True
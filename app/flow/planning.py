@@ -1,13 +1,14 @@
 import json
 import time
 from enum import Enum
-from typing import Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 from pydantic import Field
 
 from app.agent.base import BaseAgent
 from app.flow.base import BaseFlow
-from app.llm import LLM
+from app.ledger import call_site, current_run, track_run
+from app.llm import LLM, RequestPriority
 from app.logger import logger
 from app.schema import AgentState, Message, ToolChoice
 from app.tool import PlanningTool
@@ -93,6 +94,62 @@ class PlanningFlow(BaseFlow):
 
     async def execute(self, input_text: str) -> str:
         """Execute the planning flow with agents."""
+        with track_run("planning_flow") as ledger:
+            self.ledger = ledger
+            return await self._execute(input_text)
+
+    async def resume(self, run_id: str) -> str:
+        """Continue a checkpointed run from its first unfinished plan step.
+
+        Raises:
+            ValueError: If checkpoints are disabled or the run has none.
+        """
+        if not self.checkpoints:
+            raise ValueError("Checkpoints are disabled, enable [checkpoint] in config")
+        checkpoint = self.checkpoints.load(f"{run_id}/planning_flow")
+        if checkpoint is None:
+            raise ValueError(f"No checkpoint of planning flow run {run_id}")
+        if checkpoint["status"] == "finished":
+            raise ValueError(f"Planning flow run {run_id} already finished")
+
+        self.load_checkpoint_state(checkpoint["state"])
+        for agent in self.agents.values():
+            agent.restore_checkpoint(run_id)
+        logger.info(
+            f"Resuming planning flow run {run_id} with plan {self.active_plan_id}"
+        )
+        with track_run("planning_flow", run_id) as ledger:
+            self.ledger = ledger
+            return await self._execute("")
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        """JSON-serializable flow state stored with each checkpoint"""
+        return {
+            "active_plan_id": self.active_plan_id,
+            "current_step_index": self.current_step_index,
+            "planning": self.planning_tool.get_state(),
+        }
+
+    def load_checkpoint_state(self, state: Dict[str, Any]) -> None:
+        self.active_plan_id = state["active_plan_id"]
+        self.current_step_index = state.get("current_step_index")
+        self.planning_tool.set_state(state.get("planning") or {})
+
+    def save_checkpoint(self, status: str = "running") -> None:
+        """Store the plan progress of the current run"""
+        run = current_run()
+        if not self.checkpoints or run is None:
+            return
+        self.checkpoints.save(
+            f"{run.run_id}/planning_flow",
+            run.run_id,
+            status,
+            self.checkpoint_state(),
+            memory_start=0,
+            messages=[],
+        )
+
+    async def _execute(self, input_text: str) -> str:
         try:
             if not self.primary_agent:
                 raise ValueError("No primary agent available")
@@ -107,6 +164,7 @@ class PlanningFlow(BaseFlow):
                         f"Plan creation failed. Plan ID {self.active_plan_id} not found in planning tool."
                     )
                     return f"Failed to create plan for: {input_text}"
+                self.save_checkpoint()
 
             result = ""
             while True:
@@ -116,6 +174,7 @@ class PlanningFlow(BaseFlow):
                 # Exit if no more steps or plan completed
                 if self.current_step_index is None:
                     result += await self._finalize_plan()
+                    self.save_checkpoint(status="finished")
                     break
 
                 # Execute current step with appropriate agent
@@ -123,6 +182,7 @@ class PlanningFlow(BaseFlow):
                 executor = self.get_executor(step_type)
                 step_result = await self._execute_step(executor, step_info)
                 result += step_result + "\n"
+                self.save_checkpoint()
 
                 # Check if agent wants to terminate
                 if hasattr(executor, "state") and executor.state == AgentState.FINISHED:
@@ -168,12 +228,13 @@ class PlanningFlow(BaseFlow):
         )
 
         # Call LLM with PlanningTool
-        response = await self.llm.ask_tool(
-            messages=[user_message],
-            system_msgs=[system_message],
-            tools=[self.planning_tool.to_param()],
-            tool_choice=ToolChoice.AUTO,
-        )
+        with call_site("plan"):
+            response = await self.llm.ask_tool(
+                messages=[user_message],
+                system_msgs=[system_message],
+                tools=[self.planning_tool.to_param()],
+                tool_choice=ToolChoice.AUTO,
+            )
 
         # Process tool calls if present
         if response.tool_calls:
@@ -417,9 +478,12 @@ class PlanningFlow(BaseFlow):
                 f"The plan has been completed. Here is the final plan status:\n\n{plan_text}\n\nPlease provide a summary of what was accomplished and any final thoughts."
             )
 
-            response = await self.llm.ask(
-                messages=[user_message], system_msgs=[system_message]
-            )
+            with call_site("finalize"):
+                response = await self.llm.ask(
+                    messages=[user_message],
+                    system_msgs=[system_message],
+                    priority=RequestPriority.BACKGROUND,
+                )
 
             return f"Plan completed:\n\n{response}"
         except Exception as e:
@@ -0,0 +1,329 @@
+"""Per-run ledger of LLM usage and tool latency.
+
+Agents and flows open a run with `track_run`. Every LLM request and tool
+call made inside it is recorded with the agent, step and call site it
+belongs to (think, plan, extract_content, finalize, ...). Attribution uses
+context variables, so concurrent agents sharing one LLM instance keep
+separate numbers.
+"""
+import csv
+import io
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from app.config import PROJECT_ROOT, LedgerSettings, config
+from app.exceptions import TokenBudgetExceeded
+from app.logger import logger
+
+
+class LedgerEntry(BaseModel):
+    """One LLM request attempt or tool call"""
+
+    kind: Literal["llm", "tool"] = Field(..., description="What was recorded")
+    agent: Optional[str] = Field(None, description="Agent that made the call")
+    step: Optional[int] = Field(None, description="Agent step of the call")
+    call_site: str = Field(..., description="Purpose of the call or tool name")
+    model: Optional[str] = Field(None, description="Model of an LLM request")
+    prompt_tokens: int = Field(0, description="Prompt tokens of an LLM request")
+    completion_tokens: int = Field(0, description="Completion tokens")
+    latency: float = Field(0.0, description="Duration in seconds")
+    attempts: int = Field(
+        1, description="Upstream attempts of an LLM request (failover, hedging)"
+    )
+    cache_hit: bool = Field(False, description="Served from the response cache")
+    prefix_reuse: Optional[float] = Field(
+        None, description="Share of prompt tokens identical to the previous request"
+    )
+    tokens_saved: int = Field(
+        0, description="Tokens saved by compressing the output of a tool call"
+    )
+    error: Optional[str] = Field(None, description="Error of a failed call")
+    started_at: float = Field(default_factory=time.time)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class RunLedger:
+    """Entries of one agent or flow run, with optional budgets"""
+
+    def __init__(
+        self,
+        run_id: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        max_llm_calls: Optional[int] = None,
+    ):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.max_tokens = max_tokens
+        self.max_llm_calls = max_llm_calls
+        self.entries: List[LedgerEntry] = []
+        self.started_at = time.time()
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(entry.total_tokens for entry in self.entries)
+
+    @property
+    def llm_calls(self) -> int:
+        return sum(1 for entry in self.entries if entry.kind == "llm")
+
+    def record(self, entry: LedgerEntry) -> None:
+        self.entries.append(entry)
+
+    def check_budget(self) -> None:
+        """Raise TokenBudgetExceeded if the run used up one of its budgets"""
+        if self.max_tokens is not None and self.total_tokens >= self.max_tokens:
+            raise TokenBudgetExceeded(
+                f"Run {self.run_id} used {self.total_tokens} tokens, "
+                f"budget is {self.max_tokens}"
+            )
+        if self.max_llm_calls is not None and self.llm_calls >= self.max_llm_calls:
+            raise TokenBudgetExceeded(
+                f"Run {self.run_id} made {self.llm_calls} LLM calls, "
+                f"budget is {self.max_llm_calls}"
+            )
+
+    def summary(self, group_by: str = "call_site") -> Dict[str, dict]:
+        """Aggregate entries by an entry field, e.g. call_site, step or agent"""
+        groups: Dict[str, dict] = {}
+        for entry in self.entries:
+            key = str(getattr(entry, group_by))
+            group = groups.setdefault(
+                key,
+                {
+                    "calls": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "latency": 0.0,
+                    "retries": 0,
+                    "cache_hits": 0,
+                    "errors": 0,
+                    "tokens_saved": 0,
+                },
+            )
+            group["calls"] += 1
+            group["prompt_tokens"] += entry.prompt_tokens
+            group["completion_tokens"] += entry.completion_tokens
+            group["latency"] += entry.latency
+            group["retries"] += entry.attempts - 1 + (1 if entry.error else 0)
+            group["cache_hits"] += int(entry.cache_hit)
+            group["errors"] += int(entry.error is not None)
+            group["tokens_saved"] += entry.tokens_saved
+        return groups
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "total_tokens": self.total_tokens,
+            "llm_calls": self.llm_calls,
+            "by_call_site": self.summary("call_site"),
+            "by_step": self.summary("step"),
+            "entries": [entry.model_dump() for entry in self.entries],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+
+    def to_csv(self) -> str:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(LedgerEntry.model_fields))
+        writer.writeheader()
+        for entry in self.entries:
+            writer.writerow(entry.model_dump())
+        return buffer.getvalue()
+
+    def export(self, directory: Path, formats: List[str]) -> List[Path]:
+        """Write the ledger as `<run_id>.<format>` files into a directory"""
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for fmt in formats:
+            if fmt not in ("json", "csv"):
+                raise ValueError(f"Unsupported ledger export format: {fmt}")
+            path = directory / f"{self.run_id}.{fmt}"
+            path.write_text(
+                self.to_json() if fmt == "json" else self.to_csv(), encoding="utf-8"
+            )
+            paths.append(path)
+        return paths
+
+
+_current_run: ContextVar[Optional[RunLedger]] = ContextVar("ledger_run", default=None)
+_current_agent: ContextVar[Optional[str]] = ContextVar("ledger_agent", default=None)
+_current_step: ContextVar[Optional[int]] = ContextVar("ledger_step", default=None)
+_current_call_site: ContextVar[str] = ContextVar("ledger_call_site", default="llm")
+_current_call: ContextVar[Optional[LedgerEntry]] = ContextVar(
+    "ledger_call", default=None
+)
+_annotations: ContextVar[Dict[str, Any]] = ContextVar("ledger_annotations", default={})
+
+
+def current_run() -> Optional[RunLedger]:
+    """Return the ledger of the run the caller belongs to, if any"""
+    return _current_run.get()
+
+
+@contextmanager
+def track_run(agent: str, run_id: Optional[str] = None) -> Iterator[RunLedger]:
+    """Record LLM and tool usage of an agent or flow run.
+
+    A run started inside another one (e.g. an agent executing a flow step)
+    records into the outer ledger. The outermost run exports its ledger when
+    `[ledger] export_dir` is configured.
+    """
+    ledger = _current_run.get()
+    outermost = ledger is None
+    if outermost:
+        settings = config.ledger or LedgerSettings()
+        ledger = RunLedger(run_id, settings.max_tokens, settings.max_llm_calls)
+    run_token = _current_run.set(ledger)
+    agent_token = _current_agent.set(agent)
+    step_token = _current_step.set(None)
+    try:
+        yield ledger
+    finally:
+        _current_step.reset(step_token)
+        _current_agent.reset(agent_token)
+        _current_run.reset(run_token)
+        if outermost:
+            _finish_run(ledger)
+
+
+def _finish_run(ledger: RunLedger) -> None:
+    llm_usage = ledger.summary("kind").get("llm")
+    if llm_usage:
+        logger.info(
+            f"📒 Run {ledger.run_id}: {llm_usage['calls']} LLM calls, "
+            f"{ledger.total_tokens} tokens, {llm_usage['latency']:.1f}s in LLM"
+        )
+    saved = {
+        tool: usage["tokens_saved"]
+        for tool, usage in ledger.summary("call_site").items()
+        if usage["tokens_saved"]
+    }
+    if saved:
+        logger.info(
+            f"📒 Run {ledger.run_id}: compressing tool outputs saved "
+            f"{sum(saved.values())} tokens {saved}"
+        )
+    settings = config.ledger
+    if not settings or not settings.export_dir:
+        return
+    directory = Path(settings.export_dir)
+    if not directory.is_absolute():
+        directory = PROJECT_ROOT / directory
+    try:
+        for path in ledger.export(directory, settings.export_formats):
+            logger.info(f"📒 Ledger written to {path}")
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to export ledger of run {ledger.run_id}: {e}")
+
+
+@contextmanager
+def track_step(step: int) -> Iterator[None]:
+    """Attribute calls to an agent step"""
+    token = _current_step.set(step)
+    try:
+        yield
+    finally:
+        _current_step.reset(token)
+
+
+@contextmanager
+def call_site(name: str) -> Iterator[None]:
+    """Attribute LLM calls to a call site such as think or finalize"""
+    token = _current_call_site.set(name)
+    try:
+        yield
+    finally:
+        _current_call_site.reset(token)
+
+
+@contextmanager
+def annotate(**fields: Any) -> Iterator[None]:
+    """Set entry fields, e.g. prefix_reuse, of LLM calls made inside the block"""
+    token = _annotations.set({**_annotations.get(), **fields})
+    try:
+        yield
+    finally:
+        _annotations.reset(token)
+
+
+@contextmanager
+def track_llm_call(model: str) -> Iterator[Optional[LedgerEntry]]:
+    """Record one LLM request attempt in the current run.
+
+    Checks the run's budgets first. Usage reported with `record_usage`
+    while the request is running is added to the entry.
+    """
+    ledger = _current_run.get()
+    if ledger is None:
+        yield None
+        return
+
+    ledger.check_budget()
+    entry = LedgerEntry(
+        kind="llm",
+        agent=_current_agent.get(),
+        step=_current_step.get(),
+        call_site=_current_call_site.get(),
+        model=model,
+        attempts=0,
+        cache_hit=True,  # Until the request actually goes upstream
+        **_annotations.get(),
+    )
+    token = _current_call.set(entry)
+    start = time.monotonic()
+    try:
+        yield entry
+    except BaseException as e:
+        entry.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_call.reset(token)
+        entry.latency = time.monotonic() - start
+        entry.attempts = max(entry.attempts, 1)
+        ledger.record(entry)
+
+
+def record_attempt() -> None:
+    """Count an upstream attempt (endpoint try) of the current LLM request"""
+    entry = _current_call.get()
+    if entry is not None:
+        entry.attempts += 1
+        entry.cache_hit = False
+
+
+def record_usage(prompt_tokens: int, completion_tokens: int = 0) -> None:
+    """Add token usage to the LLM request currently being recorded"""
+    entry = _current_call.get()
+    if entry is not None:
+        entry.prompt_tokens += prompt_tokens
+        entry.completion_tokens += completion_tokens
+
+
+def record_tool(
+    name: str, latency: float, error: Optional[str] = None, tokens_saved: int = 0
+) -> None:
+    """Record a tool execution in the current run"""
+    ledger = _current_run.get()
+    if ledger is not None:
+        ledger.record(
+            LedgerEntry(
+                kind="tool",
+                agent=_current_agent.get(),
+                step=_current_step.get(),
+                call_site=name,
+                latency=latency,
+                tokens_saved=tokens_saved,
+                error=error,
+            )
+        )
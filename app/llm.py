@@ -1,26 +1,50 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import heapq
+import io
+import itertools
+import json
 import math
-from typing import Dict, List, Optional, Union
+import time
+import uuid
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
 
 import tiktoken
 from openai import (
+    APIConnectionError,
     APIError,
+    APIStatusError,
     AsyncAzureOpenAI,
     AsyncOpenAI,
     AuthenticationError,
+    NotFoundError,
     OpenAIError,
+    PermissionDeniedError,
     RateLimitError,
 )
-from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat import (
+    ChatCompletion,
+    ChatCompletionMessage,
+    ChatCompletionMessageToolCall,
+)
+from PIL import Image, UnidentifiedImageError
 from tenacity import (
     retry,
-    retry_if_exception_type,
+    retry_if_exception,
     stop_after_attempt,
     wait_random_exponential,
 )
 
 from app.bedrock import BedrockClient
-from app.config import LLMSettings, config
+from app.cache import get_response_cache
+from app.config import HedgingSettings, LLMSettings, config
 from app.exceptions import TokenLimitExceeded
+from app.ledger import record_attempt, record_usage, track_llm_call
 from app.logger import logger  # Assuming a logger is set up in your app
 from app.schema import (
     ROLE_VALUES,
@@ -29,6 +53,9 @@ from app.schema import (
     Message,
     ToolChoice,
 )
+from app.session import current_session
+from app.tracing import current_span, span
+from app.transport import get_http_client
 
 
 REASONING_MODELS = ["o1", "o3-mini"]
@@ -40,6 +67,21 @@ MULTIMODAL_MODELS = [
     "claude-3-sonnet-20240229",
     "claude-3-haiku-20240307",
 ]
+# Request parameters that do not affect the response and are left out of cache keys
+UNCACHED_PARAMS = ("stream", "timeout")
+
+
+def get_image_dimensions(url: str) -> Optional[Tuple[int, int]]:
+    """Read the width and height of an image given as a base64 data URL"""
+    if not url.startswith("data:") or "," not in url:
+        return None
+    try:
+        data = base64.b64decode(url.split(",", 1)[1])
+        # Only the header is parsed, the pixels are never decoded
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except (binascii.Error, ValueError, UnidentifiedImageError):
+        return None
 
 
 class TokenCounter:
@@ -54,8 +96,47 @@ class TokenCounter:
     HIGH_DETAIL_TARGET_SHORT_SIDE = 768
     TILE_SIZE = 512
 
+    # Memoization limits (entries)
+    MESSAGE_CACHE_SIZE = 4096
+    TOOL_CACHE_SIZE = 256
+
     def __init__(self, tokenizer):
         self.tokenizer = tokenizer
+        # Content hash -> token count, so each message is only encoded once
+        self._message_cache: OrderedDict[str, int] = OrderedDict()
+        self._tool_cache: OrderedDict[str, int] = OrderedDict()
+
+    @staticmethod
+    def _fingerprint(payload: Any) -> str:
+        """Stable content hash used as memoization key"""
+        if not isinstance(payload, str):
+            payload = json.dumps(
+                payload, sort_keys=True, ensure_ascii=False, default=str
+            )
+        return hashlib.sha1(payload.encode("utf-8", "surrogatepass")).hexdigest()
+
+    @staticmethod
+    def _cache_get(cache: OrderedDict, key: str) -> Optional[int]:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    @staticmethod
+    def _cache_put(cache: OrderedDict, key: str, value: int, max_size: int) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+    def count_texts(self, texts: List[str]) -> List[int]:
+        """Calculate tokens for several strings, batching the encoder when possible"""
+        if not texts:
+            return []
+        encode_batch = getattr(self.tokenizer, "encode_batch", None)
+        if encode_batch is None or len(texts) == 1:
+            return [self.count_text(text) for text in texts]
+        return [len(tokens) for tokens in encode_batch(texts)]
 
     def count_text(self, text: str) -> int:
         """Calculate tokens for a text string"""
@@ -72,7 +153,10 @@ class TokenCounter:
         3. Count 512px tiles (170 tokens each)
         4. Add 85 tokens
         """
-        detail = image_item.get("detail", "medium")
+        image_url = image_item.get("image_url")
+        if not isinstance(image_url, dict):
+            image_url = {"url": image_url or ""}
+        detail = image_url.get("detail") or image_item.get("detail", "medium")
 
         # For low detail, always return fixed token count
         if detail == "low":
@@ -87,6 +171,10 @@ class TokenCounter:
             if "dimensions" in image_item:
                 width, height = image_item["dimensions"]
                 return self._calculate_high_detail_tokens(width, height)
+            # Otherwise read them from the image itself
+            dimensions = get_image_dimensions(image_url.get("url", ""))
+            if dimensions:
+                return self._calculate_high_detail_tokens(*dimensions)
 
         return (
             self._calculate_high_detail_tokens(1024, 1024) if detail == "high" else 1024
@@ -144,31 +232,550 @@ class TokenCounter:
                 token_count += self.count_text(function.get("arguments", ""))
         return token_count
 
+    def count_tools(self, tools: Optional[List[dict]]) -> int:
+        """Calculate tokens for tool schemas, memoized per schema"""
+        token_count = 0
+        for tool in tools or []:
+            text = str(tool)
+            key = self._fingerprint(text)
+            cached = self._cache_get(self._tool_cache, key)
+            if cached is None:
+                cached = self.count_text(text)
+                self._cache_put(self._tool_cache, key, cached, self.TOOL_CACHE_SIZE)
+            token_count += cached
+        return token_count
+
+    def _message_parts(self, message: dict) -> Tuple[int, List[str]]:
+        """Split a message into fixed token cost and the texts that need encoding"""
+        fixed_tokens = self.BASE_MESSAGE_TOKENS  # Base tokens per message
+        texts = [message.get("role", "")]
+
+        # Content: plain text, text parts and images
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif content:
+            for item in content:
+                if isinstance(item, str):
+                    texts.append(item)
+                elif isinstance(item, dict):
+                    if "text" in item:
+                        texts.append(item["text"])
+                    elif "image_url" in item:
+                        fixed_tokens += self.count_image(item)
+
+        # Tool calls
+        for tool_call in message.get("tool_calls") or []:
+            if "function" in tool_call:
+                function = tool_call["function"]
+                texts.append(function.get("name", ""))
+                texts.append(function.get("arguments", ""))
+
+        # Name and tool_call_id
+        texts.append(message.get("name", ""))
+        texts.append(message.get("tool_call_id", ""))
+
+        return fixed_tokens, [text for text in texts if text]
+
     def count_message_tokens(self, messages: List[dict]) -> int:
-        """Calculate the total number of tokens in a message list"""
+        """Calculate the total number of tokens in a message list.
+
+        Per-message counts are memoized by content hash, so a growing history
+        only pays tokenizer cost for messages that were not seen before. New
+        messages are encoded in a single batch.
+        """
         total_tokens = self.FORMAT_TOKENS  # Base format tokens
 
+        misses: List[str] = []
+        pending: Dict[str, Tuple[int, List[str]]] = {}
         for message in messages:
-            tokens = self.BASE_MESSAGE_TOKENS  # Base tokens per message
+            key = self._fingerprint(message)
+            cached = self._cache_get(self._message_cache, key)
+            if cached is not None:
+                total_tokens += cached
+                continue
+            misses.append(key)
+            if key not in pending:
+                pending[key] = self._message_parts(message)
+
+        if pending:
+            texts = [text for _, parts in pending.values() for text in parts]
+            counts = iter(self.count_texts(texts))
+            fresh: Dict[str, int] = {}
+            for key, (fixed_tokens, parts) in pending.items():
+                fresh[key] = fixed_tokens + sum(next(counts) for _ in parts)
+                self._cache_put(
+                    self._message_cache, key, fresh[key], self.MESSAGE_CACHE_SIZE
+                )
+            total_tokens += sum(fresh[key] for key in misses)
 
-            # Add role tokens
-            tokens += self.count_text(message.get("role", ""))
+        return total_tokens
 
-            # Add content tokens
-            if "content" in message:
-                tokens += self.count_content(message["content"])
 
-            # Add tool calls tokens
-            if "tool_calls" in message:
-                tokens += self.count_tool_calls(message["tool_calls"])
+class ToolCallAssembler:
+    """Assemble streamed tool call deltas into complete tool calls.
 
-            # Add name and tool_call_id tokens
-            tokens += self.count_text(message.get("name", ""))
-            tokens += self.count_text(message.get("tool_call_id", ""))
+    A tool call is complete as soon as its arguments parse as a JSON object, or
+    when a later tool call starts. Each completed call is handed to
+    `on_tool_call` immediately, while the rest of the completion is still
+    streaming.
+    """
 
-            total_tokens += tokens
+    def __init__(
+        self,
+        on_tool_call: Optional[Callable[[ChatCompletionMessageToolCall], None]] = None,
+    ):
+        self.on_tool_call = on_tool_call
+        self.content_parts: List[str] = []
+        self._calls: Dict[int, dict] = {}
+        self._completed: Dict[int, ChatCompletionMessageToolCall] = {}
+
+    def add_delta(self, delta: Any) -> None:
+        """Consume one `choices[0].delta` of a streamed chat completion"""
+        if delta.content:
+            self.content_parts.append(delta.content)
+
+        for tool_call in delta.tool_calls or []:
+            index = tool_call.index if tool_call.index is not None else 0
+            if index not in self._calls:
+                # A new call has started, so all earlier calls are complete
+                for previous in sorted(self._calls):
+                    self._complete(previous)
+                self._calls[index] = {
+                    "id": "",
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""},
+                }
+
+            call = self._calls[index]
+            if tool_call.id:
+                call["id"] = tool_call.id
+            if tool_call.function:
+                call["function"]["name"] += tool_call.function.name or ""
+                call["function"]["arguments"] += tool_call.function.arguments or ""
+
+            if index not in self._completed and self._arguments_complete(call):
+                self._complete(index)
 
-        return total_tokens
+    @staticmethod
+    def _arguments_complete(call: dict) -> bool:
+        if not call["id"] or not call["function"]["name"]:
+            return False
+        arguments = call["function"]["arguments"].rstrip()
+        # Cheap check first so partial arguments are not re-parsed on every delta
+        if not arguments.endswith("}"):
+            return False
+        try:
+            return isinstance(json.loads(arguments), dict)
+        except ValueError:
+            return False
+
+    def _complete(self, index: int) -> None:
+        if index in self._completed:
+            return
+        call = self._calls[index]
+        if not call["id"]:
+            call["id"] = f"call_{uuid.uuid4().hex[:24]}"
+        tool_call = ChatCompletionMessageToolCall.model_validate(call)
+        self._completed[index] = tool_call
+        if self.on_tool_call:
+            self.on_tool_call(tool_call)
+
+    def finish(self) -> ChatCompletionMessage:
+        """Complete any remaining tool calls and build the assistant message"""
+        for index in sorted(self._calls):
+            self._complete(index)
+        tool_calls = [self._completed[index] for index in sorted(self._completed)]
+        return ChatCompletionMessage(
+            role="assistant",
+            content="".join(self.content_parts) or None,
+            tool_calls=tool_calls or None,
+        )
+
+
+class RequestPriority(IntEnum):
+    """Scheduling priority of an LLM request (lower runs first)"""
+
+    INTERACTIVE = 0  # Agent steps a user is waiting on
+    NORMAL = 1
+    BACKGROUND = 2  # Plan finalization, summaries and other deferred work
+
+
+# Upper bound for honoring a provider's Retry-After header, in seconds
+MAX_RETRY_AFTER = 120.0
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+RETRYABLE_BEDROCK_ERRORS = (
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "InternalServerException",
+)
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Whether a failed LLM request is worth retrying.
+
+    Rate limits, timeouts, connection failures and server errors are transient.
+    Invalid requests, authentication problems, token limits and validation
+    errors fail the same way on every attempt.
+    """
+    if isinstance(error, TokenLimitExceeded):
+        return False
+    if isinstance(error, APIConnectionError):  # Includes timeouts
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    # botocore ClientError, checked structurally to avoid importing boto
+    code = getattr(error, "response", None)
+    if isinstance(code, dict):
+        return code.get("Error", {}).get("Code") in RETRYABLE_BEDROCK_ERRORS
+    return False
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Read the server-requested delay from a failed response, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if "retry-after-ms" in headers:
+            return min(float(headers["retry-after-ms"]) / 1000, MAX_RETRY_AFTER)
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                delay = float(value)
+            except ValueError:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            return min(max(delay, 0.0), MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class wait_retry_after(wait_random_exponential):
+    """Wait as long as the server asks via Retry-After, else back off exponentially"""
+
+    def __call__(self, retry_state) -> float:
+        error = retry_state.outcome.exception() if retry_state.outcome else None
+        delay = get_retry_after(error) if error else None
+        return delay if delay is not None else super().__call__(retry_state)
+
+
+class TokenBucket:
+    """A per-minute budget that refills continuously"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` is available"""
+        self._refill()
+        amount = min(amount, self.capacity)  # Oversized requests wait for a full bucket
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def consume(self, amount: float) -> None:
+        """Take `amount` from the budget; the level may go negative"""
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimitScheduler:
+    """Admission control for one model endpoint.
+
+    Enforces requests-per-minute and tokens-per-minute budgets, pauses all
+    callers while the provider asks to back off (Retry-After), and admits
+    waiting requests by priority, then arrival order.
+    """
+
+    _registry: Dict[Tuple[str, str], "RateLimitScheduler"] = {}
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._blocked_until = 0.0
+        self._waiters: List[list] = []  # Heap of [priority, seq, future]
+        self._seq = itertools.count()
+
+    @classmethod
+    def for_endpoint(
+        cls, base_url: str, model: str, rpm: Optional[int], tpm: Optional[int]
+    ) -> "RateLimitScheduler":
+        """Return the scheduler shared by every client of an endpoint and model"""
+        key = (base_url, model)
+        scheduler = cls._registry.get(key)
+        if scheduler is None:
+            scheduler = cls._registry[key] = cls(rpm, tpm)
+        return scheduler
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _delay(self, tokens: int) -> float:
+        delay = self._blocked_until - time.monotonic()
+        if self.requests:
+            delay = max(delay, self.requests.delay(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.delay(tokens))
+        return delay
+
+    def _wake_head(self) -> None:
+        if not self._waiters:
+            return
+        future = self._waiters[0][2]
+        if future.done():
+            return
+        loop = future.get_loop()
+        if loop.is_closed():
+            return
+        loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+    async def acquire(
+        self, tokens: int, priority: RequestPriority = RequestPriority.NORMAL
+    ) -> None:
+        """Wait until the request may be sent, then charge it to the budgets"""
+        if not self._waiters and self._delay(tokens) <= 0:
+            self._charge(tokens)
+            return
+
+        loop = asyncio.get_running_loop()
+        entry = [int(priority), next(self._seq), loop.create_future()]
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                if self._waiters[0] is entry:
+                    delay = self._delay(tokens)
+                    if delay <= 0:
+                        heapq.heappop(self._waiters)
+                        self._charge(tokens)
+                        self._wake_head()
+                        return
+                    await asyncio.sleep(delay)
+                else:
+                    await entry[2]
+                    entry[2] = loop.create_future()
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._wake_head()
+            raise
+
+    def _charge(self, tokens: int) -> None:
+        if self.requests:
+            self.requests.consume(1)
+        if self.tokens:
+            self.tokens.consume(tokens)
+
+    def charge_tokens(self, tokens: int) -> None:
+        """Charge tokens only known after the request, e.g. completion tokens"""
+        if self.tokens and tokens:
+            self.tokens.consume(tokens)
+
+    def block_for(self, seconds: float) -> None:
+        """Hold back all requests, e.g. after a 429 with Retry-After"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        logger.warning(f"Rate limited, pausing requests for {seconds:.1f}s")
+
+
+ENDPOINT_FAILURES = (AuthenticationError, PermissionDeniedError, NotFoundError)
+LATENCY_SMOOTHING = 0.3
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """Whether an error indicates that the endpoint itself is unhealthy"""
+    return isinstance(error, ENDPOINT_FAILURES) or is_retryable_error(error)
+
+
+class CircuitBreaker:
+    """Ejects an endpoint after consecutive failures.
+
+    Once `threshold` failures happen in a row the breaker opens and the
+    endpoint gets no traffic for `cooldown` seconds. A single probe request is
+    then let through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    @property
+    def retry_at(self) -> float:
+        """Monotonic time at which the endpoint may be probed again"""
+        return (self.opened_at or 0.0) + self.cooldown
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def on_attempt(self) -> None:
+        if self.state == "half_open":
+            self._probing = True
+
+    def on_abort(self) -> None:
+        """Release the probe slot of a request that was cancelled"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> bool:
+        """Count a failure and return True if the endpoint is now ejected"""
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+
+class LLMEndpoint:
+    """One upstream endpoint of an LLM pool with its client and health state"""
+
+    _registry: Dict[Tuple[str, str, str, str], "LLMEndpoint"] = {}
+
+    def __init__(self, name: str, settings: LLMSettings):
+        self.name = name
+        self.model = settings.model
+        self.base_url = settings.base_url
+        self.api_type = settings.api_type
+
+        # All HTTP clients share one connection pool per event loop
+        if self.api_type == "azure":
+            self.client = AsyncAzureOpenAI(
+                base_url=self.base_url,
+                api_key=settings.api_key,
+                api_version=settings.api_version,
+                http_client=get_http_client(),
+            )
+        elif self.api_type == "aws":
+            self.client = BedrockClient()
+        else:
+            self.client = AsyncOpenAI(
+                api_key=settings.api_key,
+                base_url=self.base_url,
+                http_client=get_http_client(),
+            )
+
+        self.scheduler = RateLimitScheduler.for_endpoint(
+            self.base_url, self.model, settings.rpm, settings.tpm
+        )
+        self.breaker = CircuitBreaker(
+            settings.circuit_breaker_threshold, settings.circuit_breaker_cooldown
+        )
+        self.outstanding = 0
+        self.latency: Optional[float] = None  # Smoothed seconds per request
+        self.requests = 0
+        self.failures = 0
+
+    @classmethod
+    def for_profile(cls, name: str, settings: LLMSettings) -> "LLMEndpoint":
+        """Return the endpoint shared by every LLM using the same upstream"""
+        key = (settings.api_type, settings.base_url, settings.model, settings.api_key)
+        endpoint = cls._registry.get(key)
+        if endpoint is None:
+            endpoint = cls._registry[key] = cls(name, settings)
+        return endpoint
+
+    def score(self, strategy: str) -> float:
+        """Lower is better; endpoints without samples are tried first"""
+        if strategy == "latency":
+            return (self.latency or 0.0) * (self.outstanding + 1)
+        return self.outstanding
+
+    def record_latency(self, seconds: float) -> None:
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "state": self.breaker.state,
+            "outstanding": self.outstanding,
+            "latency": self.latency,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class HedgingPolicy:
+    """Decides when a slow request of a model gets a duplicate.
+
+    The hedge delay adapts to a percentile of recent latencies, and the
+    number of duplicates is capped at a fraction of all requests so that
+    hedging cannot multiply load during a provider-wide slowdown.
+    """
+
+    _registry: Dict[str, "HedgingPolicy"] = {}
+
+    def __init__(self, settings: HedgingSettings):
+        self.settings = settings
+        self.latencies: Deque[float] = deque(maxlen=settings.window)
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+    @classmethod
+    def for_model(cls, model: str, settings: HedgingSettings) -> "HedgingPolicy":
+        """Return the policy shared by every client of a model"""
+        policy = cls._registry.get(model)
+        if policy is None:
+            policy = cls._registry[model] = cls(settings)
+        return policy
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if hedging is not possible"""
+        if len(self.latencies) < self.settings.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(
+            len(ordered) - 1, math.ceil(self.settings.percentile * len(ordered)) - 1
+        )
+        return max(self.settings.min_delay, ordered[max(index, 0)])
+
+    def try_hedge(self) -> bool:
+        """Reserve one duplicate request if the budget allows it"""
+        if self.hedges + 1 > max(1.0, self.settings.budget * self.requests):
+            return False
+        self.hedges += 1
+        return True
+
+    def record(self, latency: float) -> None:
+        self.latencies.append(latency)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "delay": self.delay(),
+        }
 
 
 class LLM:
@@ -177,18 +784,21 @@ class LLM:
     def __new__(
         cls, config_name: str = "default", llm_config: Optional[LLMSettings] = None
     ):
-        if config_name not in cls._instances:
+        # Each session has its own instances, and so its own token counters
+        session = current_session()
+        instances = session.llms if session else cls._instances
+        if config_name not in instances:
             instance = super().__new__(cls)
             instance.__init__(config_name, llm_config)
-            cls._instances[config_name] = instance
-        return cls._instances[config_name]
+            instances[config_name] = instance
+        return instances[config_name]
 
     def __init__(
         self, config_name: str = "default", llm_config: Optional[LLMSettings] = None
     ):
         if not hasattr(self, "client"):  # Only initialize if not already initialized
-            llm_config = llm_config or config.llm
-            llm_config = llm_config.get(config_name, llm_config["default"])
+            profiles = llm_config or config.llm
+            llm_config = profiles.get(config_name, profiles["default"])
             self.model = llm_config.model
             self.max_tokens = llm_config.max_tokens
             self.temperature = llm_config.temperature
@@ -213,18 +823,26 @@ class LLM:
                 # If the model is not in tiktoken's presets, use cl100k_base as default
                 self.tokenizer = tiktoken.get_encoding("cl100k_base")
 
-            if self.api_type == "azure":
-                self.client = AsyncAzureOpenAI(
-                    base_url=self.base_url,
-                    api_key=self.api_key,
-                    api_version=self.api_version,
-                )
-            elif self.api_type == "aws":
-                self.client = BedrockClient()
-            else:
-                self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+            # Requests are balanced across this profile and its pooled ones
+            self.endpoints = [LLMEndpoint.for_profile(config_name, llm_config)]
+            for name in llm_config.endpoints:
+                if name not in profiles:
+                    logger.warning(f"Unknown llm profile '{name}' in endpoints")
+                    continue
+                endpoint = LLMEndpoint.for_profile(name, profiles[name])
+                if endpoint not in self.endpoints:
+                    self.endpoints.append(endpoint)
+            self.load_balancing = llm_config.load_balancing
+            self.client = self.endpoints[0].client
+            self.scheduler = self.endpoints[0].scheduler
 
             self.token_counter = TokenCounter(self.tokenizer)
+            self.response_cache = get_response_cache()
+            self.hedging = (
+                HedgingPolicy.for_model(self.model, config.llm_hedging)
+                if config.llm_hedging and config.llm_hedging.enabled
+                else None
+            )
 
     def count_tokens(self, text: str) -> int:
         """Calculate the number of tokens in a text"""
@@ -240,12 +858,41 @@ class LLM:
         # Only track tokens if max_input_tokens is set
         self.total_input_tokens += input_tokens
         self.total_completion_tokens += completion_tokens
+        record_usage(input_tokens, completion_tokens)
+        traced = current_span()
+        if traced:
+            traced.set(prompt_tokens=input_tokens, completion_tokens=completion_tokens)
         logger.info(
             f"Token usage: Input={input_tokens}, Completion={completion_tokens}, "
             f"Cumulative Input={self.total_input_tokens}, Cumulative Completion={self.total_completion_tokens}, "
             f"Total={input_tokens + completion_tokens}, Cumulative Total={self.total_input_tokens + self.total_completion_tokens}"
         )
 
+    def get_cache_stats(self) -> Optional[dict]:
+        """Return response cache hit/miss statistics, or None if caching is disabled"""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.stats.to_dict()
+
+    def get_hedging_stats(self) -> Optional[dict]:
+        """Return hedged request statistics, or None if hedging is disabled"""
+        return self.hedging.stats() if self.hedging else None
+
+    def get_endpoint_stats(self) -> List[dict]:
+        """Return load and health of every endpoint this LLM balances across"""
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    def _select_endpoint(self, exclude: List[LLMEndpoint]) -> Optional[LLMEndpoint]:
+        """Pick the best healthy endpoint that has not failed this request yet"""
+        candidates = [e for e in self.endpoints if e not in exclude]
+        if not candidates:
+            return None
+        healthy = [e for e in candidates if e.breaker.available()]
+        if healthy:
+            return min(healthy, key=lambda e: e.score(self.load_balancing))
+        # Every remaining endpoint is ejected, try the one due for a probe first
+        return min(candidates, key=lambda e: e.breaker.retry_at)
+
     def check_token_limit(self, input_tokens: int) -> bool:
         """Check if token limits are exceeded"""
         if self.max_input_tokens is not None:
@@ -351,12 +998,359 @@ class LLM:
 
         return formatted_messages
 
+    async def _send_request(
+        self,
+        params: dict,
+        request: Callable[[LLMEndpoint], Awaitable[Any]],
+        input_tokens: int,
+        priority: RequestPriority = RequestPriority.NORMAL,
+        encode: Optional[Callable[[Any], Any]] = None,
+        decode: Optional[Callable[[Any], Any]] = None,
+        can_failover: Callable[[], bool] = lambda: True,
+        hedge: bool = False,
+    ) -> Any:
+        """Send an upstream request through the response cache and rate limiter.
+
+        The request is routed to the best available endpoint. If the endpoint
+        fails with an error that indicates it is unhealthy, the request fails
+        over to the next endpoint until `can_failover` returns False or every
+        endpoint has been tried. With `hedge`, a slow request is duplicated
+        according to the hedging policy.
+        """
+        attempts: List[str] = []  # Endpoints tried, none if served from the cache
+
+        async def send(
+            tried: List[LLMEndpoint], avoid: Optional[LLMEndpoint] = None
+        ) -> Any:
+            while True:
+                # Prefer another endpoint than `avoid`, but fall back to it
+                endpoint = self._select_endpoint(tried + [avoid])
+                endpoint = endpoint or self._select_endpoint(tried)
+                tried.append(endpoint)
+                attempts.append(endpoint.name)
+                record_attempt()
+                endpoint.breaker.on_attempt()
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+                try:
+                    await endpoint.scheduler.acquire(input_tokens, priority)
+                    start = time.monotonic()
+                    with span("llm.attempt", endpoint=endpoint.name):
+                        result = await request(endpoint)
+                except asyncio.CancelledError:
+                    endpoint.breaker.on_abort()
+                    raise
+                except Exception as e:
+                    if isinstance(e, RateLimitError):
+                        # Hold back every caller of this endpoint, not just this one
+                        endpoint.scheduler.block_for(get_retry_after(e) or 1.0)
+                    if not is_endpoint_failure(e):
+                        endpoint.breaker.on_abort()
+                        raise
+                    endpoint.failures += 1
+                    if endpoint.breaker.record_failure():
+                        logger.warning(f"LLM endpoint '{endpoint.name}' ejected: {e}")
+                    if len(tried) == len(self.endpoints) or not can_failover():
+                        raise
+                    logger.warning(
+                        f"LLM endpoint '{endpoint.name}' failed, failing over: {e}"
+                    )
+                else:
+                    endpoint.breaker.record_success()
+                    endpoint.record_latency(time.monotonic() - start)
+                    return result
+                finally:
+                    endpoint.outstanding -= 1
+
+        async def scheduled() -> Any:
+            if hedge and self.hedging:
+                return await self._send_hedged(send)
+            return await send([])
+
+        with track_llm_call(self.model), span(
+            "llm.request", model=self.model, input_tokens=input_tokens
+        ) as request_span:
+            try:
+                if self.response_cache is None:
+                    return await scheduled()
+
+                payload = {k: v for k, v in params.items() if k not in UNCACHED_PARAMS}
+                # The same model name can mean different models on other servers
+                payload.update(base_url=self.base_url, api_type=self.api_type)
+                return await self.response_cache.get_or_create(
+                    payload,
+                    scheduled,
+                    encode=encode or (lambda value: value),
+                    decode=decode or (lambda value: value),
+                )
+            finally:
+                request_span.set(attempts=len(attempts), cache_hit=not attempts)
+
+    async def _send_hedged(
+        self,
+        send: Callable[[List[LLMEndpoint], Optional[LLMEndpoint]], Awaitable[Any]],
+    ) -> Any:
+        """Send a request and duplicate it if it is slower than usual.
+
+        The duplicate prefers a different endpoint than the original. The
+        first successful response wins and the other attempt is cancelled.
+        """
+        policy = self.hedging
+        policy.requests += 1
+        start = time.monotonic()
+        tried: List[LLMEndpoint] = []
+        primary = asyncio.create_task(send(tried, None))
+        attempts = [primary]
+        try:
+            delay = policy.delay()
+            if delay is not None:
+                await asyncio.wait(attempts, timeout=delay)
+                if not primary.done() and policy.try_hedge():
+                    logger.info(
+                        f"LLM request still running after {delay:.1f}s, hedging"
+                    )
+                    avoid = tried[-1] if tried else None
+                    attempts.append(asyncio.create_task(send([], avoid)))
+
+            error = None
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            policy.wins += 1
+                        policy.record(time.monotonic() - start)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+            await asyncio.gather(*attempts, return_exceptions=True)
+
+    async def _ask_completion(
+        self, endpoint: LLMEndpoint, params: dict, stream: bool, input_tokens: int
+    ) -> str:
+        """Perform the upstream completion request for `ask`"""
+        params = {**params, "model": endpoint.model}
+        if not stream:
+            # Non-streaming request
+            response = await endpoint.client.chat.completions.create(
+                **params, stream=False
+            )
+
+            if not response.choices or not response.choices[0].message.content:
+                raise ValueError("Empty or invalid response from LLM")
+
+            # Update token counts
+            self.update_token_count(
+                response.usage.prompt_tokens, response.usage.completion_tokens
+            )
+            endpoint.scheduler.charge_tokens(response.usage.completion_tokens)
+
+            return response.choices[0].message.content
+
+        # Streaming request, For streaming, update estimated token count before making the request
+        self.update_token_count(input_tokens)
+
+        response = await endpoint.client.chat.completions.create(**params, stream=True)
+
+        collected_messages = []
+        completion_text = ""
+        async for chunk in response:
+            chunk_message = chunk.choices[0].delta.content or ""
+            collected_messages.append(chunk_message)
+            completion_text += chunk_message
+            print(chunk_message, end="", flush=True)
+
+        print()  # Newline after streaming
+        full_response = "".join(collected_messages).strip()
+        if not full_response:
+            raise ValueError("Empty response from streaming LLM")
+
+        # estimate completion tokens for streaming response
+        completion_tokens = self.count_tokens(completion_text)
+        logger.info(
+            f"Estimated completion tokens for streaming response: {completion_tokens}"
+        )
+        self.total_completion_tokens += completion_tokens
+        record_usage(0, completion_tokens)
+        endpoint.scheduler.charge_tokens(completion_tokens)
+
+        return full_response
+
+    async def _ask_with_images_completion(
+        self, endpoint: LLMEndpoint, params: dict, input_tokens: int
+    ) -> str:
+        """Perform the upstream completion request for `ask_with_images`"""
+        params = {**params, "model": endpoint.model}
+        # Handle non-streaming request
+        if not params["stream"]:
+            response = await endpoint.client.chat.completions.create(**params)
+
+            if not response.choices or not response.choices[0].message.content:
+                raise ValueError("Empty or invalid response from LLM")
+
+            self.update_token_count(
+                response.usage.prompt_tokens, response.usage.completion_tokens
+            )
+            endpoint.scheduler.charge_tokens(response.usage.completion_tokens)
+            return response.choices[0].message.content
+
+        # Handle streaming request
+        self.update_token_count(input_tokens)
+        response = await endpoint.client.chat.completions.create(**params)
+
+        collected_messages = []
+        async for chunk in response:
+            chunk_message = chunk.choices[0].delta.content or ""
+            collected_messages.append(chunk_message)
+            print(chunk_message, end="", flush=True)
+
+        print()  # Newline after streaming
+        full_response = "".join(collected_messages).strip()
+
+        if not full_response:
+            raise ValueError("Empty response from streaming LLM")
+
+        # Estimate completion tokens for streaming response
+        completion_tokens = self.count_tokens(full_response)
+        self.total_completion_tokens += completion_tokens
+        record_usage(0, completion_tokens)
+        endpoint.scheduler.charge_tokens(completion_tokens)
+
+        return full_response
+
+    def _prepare_tool_request(
+        self,
+        messages: List[Union[dict, Message]],
+        system_msgs: Optional[List[Union[dict, Message]]],
+        timeout: int,
+        tools: Optional[List[dict]],
+        tool_choice: TOOL_CHOICE_TYPE,  # type: ignore
+        temperature: Optional[float],
+        **kwargs,
+    ) -> Tuple[dict, int]:
+        """Validate and format a tool request, returning its params and input tokens"""
+        # Validate tool_choice
+        if tool_choice not in TOOL_CHOICE_VALUES:
+            raise ValueError(f"Invalid tool_choice: {tool_choice}")
+
+        # Check if the model supports images
+        supports_images = self.model in MULTIMODAL_MODELS
+
+        # Format messages
+        with span("llm.format", messages=len(messages)):
+            if system_msgs:
+                system_msgs = self.format_messages(system_msgs, supports_images)
+                messages = system_msgs + self.format_messages(messages, supports_images)
+            else:
+                messages = self.format_messages(messages, supports_images)
+
+        with span("llm.count_tokens") as count_span:
+            # Calculate input token count
+            input_tokens = self.count_message_tokens(messages)
+
+            # If there are tools, calculate token count for tool descriptions
+            input_tokens += self.token_counter.count_tools(tools)
+            count_span.set(input_tokens=input_tokens)
+
+        # Check if token limits are exceeded
+        if not self.check_token_limit(input_tokens):
+            error_message = self.get_limit_error_message(input_tokens)
+            # Raise a special exception that won't be retried
+            raise TokenLimitExceeded(error_message)
+
+        # Validate tools if provided
+        if tools:
+            for tool in tools:
+                if not isinstance(tool, dict) or "type" not in tool:
+                    raise ValueError("Each tool must be a dict with 'type' field")
+
+        # Set up the completion request
+        params = {
+            "model": self.model,
+            "messages": messages,
+            "tools": tools,
+            "tool_choice": tool_choice,
+            "timeout": timeout,
+            **kwargs,
+        }
+
+        if self.model in REASONING_MODELS:
+            params["max_completion_tokens"] = self.max_tokens
+        else:
+            params["max_tokens"] = self.max_tokens
+            params["temperature"] = (
+                temperature if temperature is not None else self.temperature
+            )
+
+        return params, input_tokens
+
+    async def _ask_tool_completion(
+        self, endpoint: LLMEndpoint, params: dict
+    ) -> ChatCompletionMessage | None:
+        """Perform the upstream completion request for `ask_tool`"""
+        # Always use non-streaming for tool requests
+        params = {**params, "model": endpoint.model, "stream": False}
+        response: ChatCompletion = await endpoint.client.chat.completions.create(
+            **params
+        )
+
+        # Check if response is valid
+        if not response.choices or not response.choices[0].message:
+            logger.warning(f"Invalid or empty response from LLM: {response}")
+            return None
+
+        # Update token counts
+        self.update_token_count(
+            response.usage.prompt_tokens, response.usage.completion_tokens
+        )
+        endpoint.scheduler.charge_tokens(response.usage.completion_tokens)
+
+        return response.choices[0].message
+
+    async def _ask_tool_stream_completion(
+        self,
+        endpoint: LLMEndpoint,
+        params: dict,
+        input_tokens: int,
+        on_tool_call: Optional[Callable[[ChatCompletionMessageToolCall], None]],
+    ) -> ChatCompletionMessage | None:
+        """Perform a streamed upstream request for `ask_tool_stream`"""
+        # For streaming, update estimated token count before making the request
+        self.update_token_count(input_tokens)
+
+        params = {**params, "model": endpoint.model}
+        response = await endpoint.client.chat.completions.create(**params, stream=True)
+
+        assembler = ToolCallAssembler(on_tool_call)
+        async for chunk in response:
+            if chunk.choices:
+                assembler.add_delta(chunk.choices[0].delta)
+        message = assembler.finish()
+
+        if not message.content and not message.tool_calls:
+            return None
+
+        # Estimate completion tokens for streaming response
+        completion_tokens = self.count_tokens(message.content or "")
+        for tool_call in message.tool_calls or []:
+            completion_tokens += self.count_tokens(tool_call.function.name)
+            completion_tokens += self.count_tokens(tool_call.function.arguments)
+        self.total_completion_tokens += completion_tokens
+        record_usage(0, completion_tokens)
+        endpoint.scheduler.charge_tokens(completion_tokens)
+
+        return message
+
     @retry(
-        wait=wait_random_exponential(min=1, max=60),
+        wait=wait_retry_after(min=1, max=60),
         stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
+        retry=retry_if_exception(is_retryable_error),
     )
     async def ask(
         self,
@@ -364,6 +1358,7 @@ class LLM:
         system_msgs: Optional[List[Union[dict, Message]]] = None,
         stream: bool = True,
         temperature: Optional[float] = None,
+        priority: RequestPriority = RequestPriority.NORMAL,
     ) -> str:
         """
         Send a prompt to the LLM and get the response.
@@ -373,6 +1368,7 @@ class LLM:
             system_msgs: Optional system messages to prepend
             stream (bool): Whether to stream the response
             temperature (float): Sampling temperature for the response
+            priority: Scheduling priority when the endpoint is rate limited
 
         Returns:
             str: The generated response
@@ -380,7 +1376,7 @@ class LLM:
         Raises:
             TokenLimitExceeded: If token limits are exceeded
             ValueError: If messages are invalid or response is empty
-            OpenAIError: If API call fails after retries
+            OpenAIError: If API call fails after retrying transient errors
             Exception: For unexpected errors
         """
         try:
@@ -416,48 +1412,14 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
-            if not stream:
-                # Non-streaming request
-                response = await self.client.chat.completions.create(
-                    **params, stream=False
-                )
-
-                if not response.choices or not response.choices[0].message.content:
-                    raise ValueError("Empty or invalid response from LLM")
-
-                # Update token counts
-                self.update_token_count(
-                    response.usage.prompt_tokens, response.usage.completion_tokens
-                )
-
-                return response.choices[0].message.content
-
-            # Streaming request, For streaming, update estimated token count before making the request
-            self.update_token_count(input_tokens)
-
-            response = await self.client.chat.completions.create(**params, stream=True)
-
-            collected_messages = []
-            completion_text = ""
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                completion_text += chunk_message
-                print(chunk_message, end="", flush=True)
-
-            print()  # Newline after streaming
-            full_response = "".join(collected_messages).strip()
-            if not full_response:
-                raise ValueError("Empty response from streaming LLM")
-
-            # estimate completion tokens for streaming response
-            completion_tokens = self.count_tokens(completion_text)
-            logger.info(
-                f"Estimated completion tokens for streaming response: {completion_tokens}"
+            return await self._send_request(
+                params,
+                lambda endpoint: self._ask_completion(
+                    endpoint, params, stream, input_tokens
+                ),
+                input_tokens,
+                priority,
             )
-            self.total_completion_tokens += completion_tokens
-
-            return full_response
 
         except TokenLimitExceeded:
             # Re-raise token limit errors without logging
@@ -479,11 +1441,9 @@ class LLM:
             raise
 
     @retry(
-        wait=wait_random_exponential(min=1, max=60),
+        wait=wait_retry_after(min=1, max=60),
         stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
+        retry=retry_if_exception(is_retryable_error),
     )
     async def ask_with_images(
         self,
@@ -492,6 +1452,7 @@ class LLM:
         system_msgs: Optional[List[Union[dict, Message]]] = None,
         stream: bool = False,
         temperature: Optional[float] = None,
+        priority: RequestPriority = RequestPriority.NORMAL,
     ) -> str:
         """
         Send a prompt with images to the LLM and get the response.
@@ -502,6 +1463,7 @@ class LLM:
             system_msgs: Optional system messages to prepend
             stream (bool): Whether to stream the response
             temperature (float): Sampling temperature for the response
+            priority: Scheduling priority when the endpoint is rate limited
 
         Returns:
             str: The generated response
@@ -509,7 +1471,7 @@ class LLM:
         Raises:
             TokenLimitExceeded: If token limits are exceeded
             ValueError: If messages are invalid or response is empty
-            OpenAIError: If API call fails after retries
+            OpenAIError: If API call fails after retrying transient errors
             Exception: For unexpected errors
         """
         try:
@@ -588,33 +1550,14 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
-            # Handle non-streaming request
-            if not stream:
-                response = await self.client.chat.completions.create(**params)
-
-                if not response.choices or not response.choices[0].message.content:
-                    raise ValueError("Empty or invalid response from LLM")
-
-                self.update_token_count(response.usage.prompt_tokens)
-                return response.choices[0].message.content
-
-            # Handle streaming request
-            self.update_token_count(input_tokens)
-            response = await self.client.chat.completions.create(**params)
-
-            collected_messages = []
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                print(chunk_message, end="", flush=True)
-
-            print()  # Newline after streaming
-            full_response = "".join(collected_messages).strip()
-
-            if not full_response:
-                raise ValueError("Empty response from streaming LLM")
-
-            return full_response
+            return await self._send_request(
+                params,
+                lambda endpoint: self._ask_with_images_completion(
+                    endpoint, params, input_tokens
+                ),
+                input_tokens,
+                priority,
+            )
 
         except TokenLimitExceeded:
             raise
@@ -635,11 +1578,9 @@ class LLM:
             raise
 
     @retry(
-        wait=wait_random_exponential(min=1, max=60),
+        wait=wait_retry_after(min=1, max=60),
         stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
+        retry=retry_if_exception(is_retryable_error),
     )
     async def ask_tool(
         self,
@@ -649,6 +1590,7 @@ class LLM:
         tools: Optional[List[dict]] = None,
         tool_choice: TOOL_CHOICE_TYPE = ToolChoice.AUTO,  # type: ignore
         temperature: Optional[float] = None,
+        priority: RequestPriority = RequestPriority.NORMAL,
         **kwargs,
     ) -> ChatCompletionMessage | None:
         """
@@ -661,6 +1603,7 @@ class LLM:
             tools: List of tools to use
             tool_choice: Tool choice strategy
             temperature: Sampling temperature for the response
+            priority: Scheduling priority when the endpoint is rate limited
             **kwargs: Additional completion arguments
 
         Returns:
@@ -669,88 +1612,132 @@ class LLM:
         Raises:
             TokenLimitExceeded: If token limits are exceeded
             ValueError: If tools, tool_choice, or messages are invalid
-            OpenAIError: If API call fails after retries
+            OpenAIError: If API call fails after retrying transient errors
             Exception: For unexpected errors
         """
         try:
-            # Validate tool_choice
-            if tool_choice not in TOOL_CHOICE_VALUES:
-                raise ValueError(f"Invalid tool_choice: {tool_choice}")
-
-            # Check if the model supports images
-            supports_images = self.model in MULTIMODAL_MODELS
+            params, input_tokens = self._prepare_tool_request(
+                messages,
+                system_msgs,
+                timeout,
+                tools,
+                tool_choice,
+                temperature,
+                **kwargs,
+            )
 
-            # Format messages
-            if system_msgs:
-                system_msgs = self.format_messages(system_msgs, supports_images)
-                messages = system_msgs + self.format_messages(messages, supports_images)
-            else:
-                messages = self.format_messages(messages, supports_images)
+            return await self._send_request(
+                params,
+                lambda endpoint: self._ask_tool_completion(endpoint, params),
+                input_tokens,
+                priority,
+                encode=lambda message: message.model_dump(),
+                decode=ChatCompletionMessage.model_validate,
+                hedge=True,
+            )
 
-            # Calculate input token count
-            input_tokens = self.count_message_tokens(messages)
+        except TokenLimitExceeded:
+            # Re-raise token limit errors without logging
+            raise
+        except ValueError as ve:
+            logger.error(f"Validation error in ask_tool: {ve}")
+            raise
+        except OpenAIError as oe:
+            logger.error(f"OpenAI API error: {oe}")
+            if isinstance(oe, AuthenticationError):
+                logger.error("Authentication failed. Check API key.")
+            elif isinstance(oe, RateLimitError):
+                logger.error("Rate limit exceeded. Consider increasing retry attempts.")
+            elif isinstance(oe, APIError):
+                logger.error(f"API error: {oe}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in ask_tool: {e}")
+            raise
 
-            # If there are tools, calculate token count for tool descriptions
-            tools_tokens = 0
-            if tools:
-                for tool in tools:
-                    tools_tokens += self.count_tokens(str(tool))
+    async def ask_tool_stream(
+        self,
+        messages: List[Union[dict, Message]],
+        system_msgs: Optional[List[Union[dict, Message]]] = None,
+        timeout: int = 300,
+        tools: Optional[List[dict]] = None,
+        tool_choice: TOOL_CHOICE_TYPE = ToolChoice.AUTO,  # type: ignore
+        temperature: Optional[float] = None,
+        on_tool_call: Optional[Callable[[ChatCompletionMessageToolCall], None]] = None,
+        priority: RequestPriority = RequestPriority.NORMAL,
+        **kwargs,
+    ) -> ChatCompletionMessage | None:
+        """
+        Ask LLM using functions/tools with a streamed response.
 
-            input_tokens += tools_tokens
+        Tool call deltas are assembled as they arrive and each tool call is
+        passed to `on_tool_call` as soon as its arguments are complete, so the
+        caller can start executing it while the model is still generating.
+        Unlike `ask_tool`, failed requests are not retried here because tool
+        calls may already have been dispatched.
 
-            # Check if token limits are exceeded
-            if not self.check_token_limit(input_tokens):
-                error_message = self.get_limit_error_message(input_tokens)
-                # Raise a special exception that won't be retried
-                raise TokenLimitExceeded(error_message)
+        Args:
+            messages: List of conversation messages
+            system_msgs: Optional system messages to prepend
+            timeout: Request timeout in seconds
+            tools: List of tools to use
+            tool_choice: Tool choice strategy
+            temperature: Sampling temperature for the response
+            on_tool_call: Callback invoked once per completed tool call, in order
+            priority: Scheduling priority when the endpoint is rate limited
+            **kwargs: Additional completion arguments
 
-            # Validate tools if provided
-            if tools:
-                for tool in tools:
-                    if not isinstance(tool, dict) or "type" not in tool:
-                        raise ValueError("Each tool must be a dict with 'type' field")
+        Returns:
+            ChatCompletionMessage: The fully assembled response
 
-            # Set up the completion request
-            params = {
-                "model": self.model,
-                "messages": messages,
-                "tools": tools,
-                "tool_choice": tool_choice,
-                "timeout": timeout,
+        Raises:
+            TokenLimitExceeded: If token limits are exceeded
+            ValueError: If tools, tool_choice, or messages are invalid
+            OpenAIError: If the API call fails
+            Exception: For unexpected errors
+        """
+        try:
+            params, input_tokens = self._prepare_tool_request(
+                messages,
+                system_msgs,
+                timeout,
+                tools,
+                tool_choice,
+                temperature,
                 **kwargs,
-            }
-
-            if self.model in REASONING_MODELS:
-                params["max_completion_tokens"] = self.max_tokens
-            else:
-                params["max_tokens"] = self.max_tokens
-                params["temperature"] = (
-                    temperature if temperature is not None else self.temperature
-                )
-
-            params["stream"] = False  # Always use non-streaming for tool requests
-            response: ChatCompletion = await self.client.chat.completions.create(
-                **params
             )
 
-            # Check if response is valid
-            if not response.choices or not response.choices[0].message:
-                print(response)
-                # raise ValueError("Invalid or empty response from LLM")
-                return None
-
-            # Update token counts
-            self.update_token_count(
-                response.usage.prompt_tokens, response.usage.completion_tokens
+            dispatched = set()
+
+            def dispatch(tool_call: ChatCompletionMessageToolCall) -> None:
+                dispatched.add(tool_call.id)
+                on_tool_call(tool_call)
+
+            message = await self._send_request(
+                params,
+                lambda endpoint: self._ask_tool_stream_completion(
+                    endpoint, params, input_tokens, dispatch if on_tool_call else None
+                ),
+                input_tokens,
+                priority,
+                encode=lambda message: message.model_dump(),
+                decode=ChatCompletionMessage.model_validate,
+                # Once a tool call has started, a retry elsewhere could repeat it
+                can_failover=lambda: not dispatched,
             )
 
-            return response.choices[0].message
+            # Responses served from the cache or a coalesced request did not
+            # stream through our callback, so dispatch their tool calls now
+            if message and message.tool_calls and on_tool_call:
+                for tool_call in message.tool_calls:
+                    if tool_call.id not in dispatched:
+                        dispatch(tool_call)
+            return message
 
         except TokenLimitExceeded:
-            # Re-raise token limit errors without logging
             raise
         except ValueError as ve:
-            logger.error(f"Validation error in ask_tool: {ve}")
+            logger.error(f"Validation error in ask_tool_stream: {ve}")
             raise
         except OpenAIError as oe:
             logger.error(f"OpenAI API error: {oe}")
@@ -762,5 +1749,5 @@ class LLM:
                 logger.error(f"API error: {oe}")
             raise
         except Exception as e:
-            logger.error(f"Unexpected error in ask_tool: {e}")
+            logger.error(f"Unexpected error in ask_tool_stream: {e}")
             raise
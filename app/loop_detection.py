@@ -0,0 +1,160 @@
+"""Detection of agents that keep repeating the same steps.
+
+Every step is reduced to a hash of its tool calls (name and normalized
+arguments) and a digest of their observations. For each cycle length L up to
+`max_cycle_length` the detector counts how many consecutive steps equal the
+step L positions earlier, so a cycle repeated r times is recognized in
+O(max_cycle_length) per step, independent of the history length. Each further
+repetition escalates the intervention: a nudge, a warning naming the repeated
+calls, and finally stopping the agent.
+"""
+import hashlib
+import json
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from app.config import LoopDetectionSettings, config
+from app.schema import Message, Role
+
+
+NUDGE, WARN, STOP = 1, 2, 3
+
+
+class LoopDetection(BaseModel):
+    """A cycle of steps the agent repeated"""
+
+    cycle_length: int = Field(..., description="Steps in one repetition")
+    repeats: int = Field(..., description="Consecutive repetitions so far")
+    level: int = Field(..., description="Intervention level, NUDGE to STOP")
+    steps: List[str] = Field(..., description="Tool calls of each cycle step")
+
+    def prompt(self) -> str:
+        """Guidance for the agent's next request"""
+        steps = "\n".join(f"- {step}" for step in self.steps)
+        if self.level == NUDGE:
+            return (
+                f"You repeated the same {self.cycle_length} step(s) {self.repeats} "
+                f"times with identical results:\n{steps}\n"
+                "Repeating them will not change the outcome. Consider a different "
+                "approach."
+            )
+        return (
+            f"You are stuck in a loop: the steps below were repeated "
+            f"{self.repeats} times with identical results and you were already "
+            f"told so.\n{steps}\n"
+            "Do not call these tools with the same arguments again. Change "
+            "strategy, or terminate if the task cannot make progress."
+        )
+
+
+def normalize_arguments(arguments: Optional[str]) -> str:
+    """Canonical form of tool call arguments, independent of key order and spacing"""
+    try:
+        parsed = json.loads(arguments or "{}")
+    except json.JSONDecodeError:
+        return " ".join((arguments or "").split())
+    return json.dumps(parsed, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def step_messages(messages: List[Message]) -> List[Message]:
+    """Messages of the latest step: the last assistant message and what follows"""
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index].role == Role.ASSISTANT:
+            return messages[index:]
+    return []
+
+
+def step_signature(messages: List[Message]) -> Tuple[str, str]:
+    """Hash and short description of a step's tool calls and observations"""
+    parts, calls = [], []
+    for message in messages:
+        if message.role == Role.ASSISTANT:
+            if message.tool_calls:
+                for tool_call in message.tool_calls:
+                    name = tool_call.function.name
+                    arguments = normalize_arguments(tool_call.function.arguments)
+                    parts.append(f"call:{name}:{arguments}")
+                    calls.append(f"{name}({arguments[:120]})")
+            else:
+                # Steps without tools repeat if the model says the same thing
+                parts.append(f"say:{message.content or ''}")
+                calls.append(f"reply: {(message.content or '')[:120]!r}")
+        elif message.role == Role.TOOL:
+            digest = hashlib.sha1(
+                (message.content or "").encode("utf-8", "surrogatepass")
+            ).hexdigest()
+            parts.append(f"observe:{digest}")
+    key = hashlib.sha1("\n".join(parts).encode("utf-8", "surrogatepass")).hexdigest()
+    return key, ", ".join(calls) or "no action"
+
+
+class LoopDetector:
+    """Tracks step hashes of one agent and reports repeated cycles"""
+
+    def __init__(self, settings: LoopDetectionSettings):
+        self.settings = settings
+        self.max_cycle_length = max(1, settings.max_cycle_length)
+        self.min_repeats = max(2, settings.min_repeats)
+        self._keys: Deque[str] = deque(maxlen=self.max_cycle_length)
+        self._steps: Deque[str] = deque(maxlen=self.max_cycle_length)
+        # _runs[L - 1]: consecutive steps equal to the step L positions earlier
+        self._runs = [0] * self.max_cycle_length
+        self.level = 0
+        # Position and assistant message of the last observed step
+        self._last_step: Optional[Tuple[int, Message]] = None
+
+    @classmethod
+    def from_config(cls) -> Optional["LoopDetector"]:
+        settings = config.loop_detection
+        if not settings or not settings.enabled:
+            return None
+        return cls(settings)
+
+    def reset(self) -> None:
+        self._keys.clear()
+        self._steps.clear()
+        self._runs = [0] * self.max_cycle_length
+        self.level = 0
+        self._last_step = None
+
+    def observe(self, messages: List[Message]) -> Optional[LoopDetection]:
+        """Record the latest step of a memory and report a loop it continues.
+
+        A step that added no assistant message is not a repetition of the
+        previous one and is ignored.
+        """
+        step = step_messages(messages)
+        if not step:
+            return None
+        index = len(messages) - len(step)
+        if self._last_step and self._last_step[0] == index:
+            if self._last_step[1] is step[0]:
+                return None  # Memory did not grow since the last observation
+        self._last_step = (index, step[0])
+        key, description = step_signature(step)
+        for length in range(1, self.max_cycle_length + 1):
+            repeated = len(self._keys) >= length and self._keys[-length] == key
+            self._runs[length - 1] = self._runs[length - 1] + 1 if repeated else 0
+        self._keys.append(key)
+        self._steps.append(description)
+
+        if not any(self._runs):
+            self.level = 0  # The agent made progress, start over
+            return None
+
+        for length, run in enumerate(self._runs, start=1):
+            needed = (self.min_repeats - 1) * length
+            # Escalate once per further full repetition of the cycle
+            if run >= needed and (run - needed) % length == 0:
+                self.level = min(self.level + 1, STOP)
+                if self.level == STOP and not self.settings.stop:
+                    self.level = WARN
+                return LoopDetection(
+                    cycle_length=length,
+                    repeats=run // length + 1,
+                    level=self.level,
+                    steps=list(self._steps)[-length:],
+                )
+        return None
@@ -0,0 +1,205 @@
+"""Type-aware compression of tool outputs before they enter agent memory.
+
+Much of what tools print is formatting rather than information: indented
+JSON, long arrays of similar records, build logs repeating one line with a
+changing counter, and page text full of blank lines, navigation and cookie
+banners. `ObservationCompressor` runs each output through a pipeline of
+stages. Every stage decides from the tool name and the text whether it
+applies, so new stages can be added without touching the agent. Tokens
+saved are counted per tool and recorded in the run ledger. Summaries drop
+data, so the agent stores the original output as an artifact when it has an
+artifact store.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from app.config import ObservationSettings, config
+from app.logger import logger
+from app.schema import count_tokens
+
+
+class CompressionStage(Protocol):
+    """One step of the pipeline"""
+
+    name: str
+
+    def applies(self, tool: str, text: str) -> bool:
+        ...
+
+    def compress(self, text: str) -> str:
+        ...
+
+
+class JSONStage:
+    """Minify JSON outputs and summarize long arrays as schema and samples"""
+
+    name = "json"
+
+    def __init__(self, max_array_items: int, sample_items: int):
+        self.max_array_items = max_array_items
+        self.sample_items = sample_items
+
+    def applies(self, tool: str, text: str) -> bool:
+        return text.lstrip()[:1] in ("{", "[")
+
+    def compress(self, text: str) -> str:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return text
+        return json.dumps(
+            self._summarize(data), ensure_ascii=False, separators=(",", ":")
+        )
+
+    def _summarize(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: self._summarize(item) for key, item in value.items()}
+        if not isinstance(value, list):
+            return value
+        if len(value) <= self.max_array_items:
+            return [self._summarize(item) for item in value]
+        return {
+            "_summary": f"array of {len(value)} items, "
+            f"showing the first {self.sample_items}",
+            "schema": _schema(value),
+            "sample": [self._summarize(item) for item in value[: self.sample_items]],
+        }
+
+
+def _schema(items: List[Any]) -> Any:
+    """Type names of the items of an array, merged over all items"""
+    if all(isinstance(item, dict) for item in items):
+        fields: Dict[str, List[str]] = {}
+        for item in items:
+            for key, value in item.items():
+                names = fields.setdefault(key, [])
+                if type(value).__name__ not in names:
+                    names.append(type(value).__name__)
+        return {key: "|".join(names) for key, names in fields.items()}
+    names: List[str] = []
+    for item in items:
+        if type(item).__name__ not in names:
+            names.append(type(item).__name__)
+    return "|".join(names)
+
+
+class RepeatedLinesStage:
+    """Collapse runs of log lines that only differ in their numbers"""
+
+    name = "logs"
+
+    def __init__(self, tools: List[str], min_repeats: int):
+        self.tools = set(tools)
+        self.min_repeats = max(min_repeats, 2)
+
+    def applies(self, tool: str, text: str) -> bool:
+        return tool in self.tools and text.count("\n") >= self.min_repeats
+
+    def compress(self, text: str) -> str:
+        lines = text.split("\n")
+        output: List[str] = []
+        start = 0
+        while start < len(lines):
+            key = re.sub(r"\d+", "0", lines[start])
+            end = start + 1
+            while end < len(lines) and re.sub(r"\d+", "0", lines[end]) == key:
+                end += 1
+            count = end - start
+            if count >= self.min_repeats and lines[start].strip():
+                output.append(lines[start])
+                output.append(f"[... {count - 2} similar lines ...]")
+                output.append(lines[end - 1])
+            else:
+                output.extend(lines[start:end])
+            start = end
+        return "\n".join(output)
+
+
+# Lines of page chrome rather than content
+BOILERPLATE = re.compile(
+    r"^(skip to (main )?content|accept( all)?( cookies)?|reject all|"
+    r"(this (web)?site )?uses cookies.*|cookie (settings|preferences|policy)|"
+    r"privacy policy|terms (of (use|service)|and conditions)|"
+    r"(copyright )?(©|\(c\)).*|all rights reserved\.?|sign (in|up)|log ?in|"
+    r"subscribe( to our newsletter)?|share( on \w+)?|back to top|menu|"
+    r"toggle navigation|advertisement)$",
+    re.IGNORECASE,
+)
+
+
+class PageTextStage:
+    """Strip whitespace, boilerplate and repeated lines from page text"""
+
+    name = "page_text"
+
+    def __init__(self, tools: List[str]):
+        self.tools = set(tools)
+
+    def applies(self, tool: str, text: str) -> bool:
+        return tool in self.tools
+
+    def compress(self, text: str) -> str:
+        seen = set()
+        output: List[str] = []
+        for line in text.split("\n"):
+            line = re.sub(r"[ \t\xa0]+", " ", line).strip()
+            if not line or BOILERPLATE.match(line):
+                continue
+            # Navigation and footers repeat on every page of a crawl
+            if len(line) < 80 and line in seen:
+                continue
+            seen.add(line)
+            output.append(line)
+        return "\n".join(output)
+
+
+class ObservationCompressor:
+    """Runs tool outputs through the compression stages"""
+
+    def __init__(
+        self,
+        settings: ObservationSettings,
+        stages: Optional[List[CompressionStage]] = None,
+    ):
+        self.settings = settings
+        if stages is None:
+            stages = [
+                RepeatedLinesStage(settings.log_tools, settings.min_repeats),
+                PageTextStage(settings.page_tools),
+            ]
+            if settings.minify_json:
+                stages.insert(
+                    0, JSONStage(settings.max_array_items, settings.sample_items)
+                )
+        self.stages = stages
+        self.tokens_saved: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls) -> Optional["ObservationCompressor"]:
+        """Create a compressor from the config, or None if it is disabled"""
+        settings = config.observation
+        if not settings or not settings.enabled:
+            return None
+        return cls(settings)
+
+    def add_stage(self, stage: CompressionStage) -> None:
+        self.stages.append(stage)
+
+    def compress(self, tool: str, text: str) -> Tuple[str, int]:
+        """Compress the output of a tool, returning it and the tokens saved"""
+        compressed = text
+        for stage in self.stages:
+            if not stage.applies(tool, compressed):
+                continue
+            try:
+                compressed = stage.compress(compressed)
+            except Exception as e:  # A broken stage must not lose the output
+                logger.warning(f"Compression stage {stage.name} failed: {e}")
+        if compressed == text:
+            return text, 0
+        saved = count_tokens(text) - count_tokens(compressed)
+        if saved <= 0:
+            return text, 0
+        self.tokens_saved[tool] = self.tokens_saved.get(tool, 0) + saved
+        return compressed, saved
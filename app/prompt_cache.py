@@ -0,0 +1,141 @@
+"""Cache-friendly prompt layout for agent step requests.
+
+Providers with prompt caching (OpenAI automatically, Anthropic via
+`cache_control` breakpoints, Bedrock via cache points) only reuse the part of
+a request that is byte-identical to an earlier one, counted from the start.
+`PromptLayout` keeps the system prompt, tool schemas and earlier turns in a
+fixed order at the front, puts volatile per-step context at the tail, marks
+cache breakpoints where the provider supports them and measures how much of
+each request repeats the previous one.
+"""
+from typing import List, Optional, Sequence, Tuple, Union
+
+from app.config import PromptCacheSettings, config
+from app.llm import LLM, MULTIMODAL_MODELS, TokenCounter
+from app.logger import logger
+from app.schema import Message
+
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def mark_cache_breakpoint(message: dict) -> bool:
+    """Add a cache breakpoint after the last content part of a message"""
+    content = message.get("content")
+    if not content:
+        return False
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = [
+        {"type": "text", "text": item} if isinstance(item, str) else item
+        for item in content
+    ]
+    content[-1] = {**content[-1], "cache_control": CACHE_CONTROL}
+    message["content"] = content
+    return True
+
+
+class PromptLayout:
+    """Lays out the requests of one agent so consecutive ones share a prefix"""
+
+    def __init__(self, settings: PromptCacheSettings):
+        self.settings = settings
+        self._previous: List[str] = []  # Fingerprints of the last request
+        self._previous_boundary = 0  # Stable messages of the last request
+        self.reuse_ratios: List[float] = []
+
+    @classmethod
+    def from_config(cls) -> Optional["PromptLayout"]:
+        settings = config.prompt_cache
+        if not settings or not settings.enabled:
+            return None
+        return cls(settings)
+
+    def supports_cache_control(self, llm: LLM) -> bool:
+        """Whether the endpoint understands Anthropic-style cache breakpoints"""
+        if self.settings.cache_control in ("always", "never"):
+            return self.settings.cache_control == "always"
+        target = f"{llm.model} {llm.base_url}".lower()
+        return "claude" in target or "anthropic" in target
+
+    def build(
+        self,
+        llm: LLM,
+        system_msgs: Optional[List[Union[dict, Message]]],
+        history: List[Union[dict, Message]],
+        tools: Optional[List[dict]] = None,
+        tail: Sequence[Union[dict, Message]] = (),
+    ) -> Tuple[List[dict], List[dict], float]:
+        """Format a step request.
+
+        Args:
+            llm: LLM the request is sent to
+            system_msgs: System prompts, sent first
+            history: Conversation so far, which only grows at the end
+            tools: Tool schemas of the request
+            tail: Volatile context appended after the history
+
+        Returns:
+            Formatted system messages, formatted messages and the share of
+            prompt tokens identical to the previous request
+        """
+        supports_images = llm.model in MULTIMODAL_MODELS
+        system = llm.format_messages(list(system_msgs or []), supports_images)
+        stable = llm.format_messages(list(history), supports_images)
+        volatile = llm.format_messages(list(tail), supports_images)
+
+        reuse = self._measure(llm, tools, system + stable + volatile)
+        if self.supports_cache_control(llm):
+            self._mark_breakpoints(system, stable)
+        self._previous_boundary = len(stable)
+        return system, stable + volatile, reuse
+
+    def _measure(
+        self, llm: LLM, tools: Optional[List[dict]], messages: List[dict]
+    ) -> float:
+        """Share of prompt tokens in the prefix shared with the last request"""
+        keys = [TokenCounter._fingerprint(tools or [])]
+        keys += [TokenCounter._fingerprint(message) for message in messages]
+        shared = 0
+        for key, previous in zip(keys, self._previous):
+            if key != previous:
+                break
+            shared += 1
+        first_request = not self._previous
+        self._previous = keys
+
+        # Message counts are memoized, so this costs one hash per message
+        sizes = [llm.token_counter.count_tools(tools)]
+        sizes += [llm.count_message_tokens([message]) for message in messages]
+        total = sum(sizes)
+        reuse = sum(sizes[:shared]) / total if total else 0.0
+        self.reuse_ratios.append(reuse)
+        if not first_request:
+            logger.info(
+                f"♻️ Prompt prefix reuse: {reuse:.0%} of {total} tokens "
+                f"({shared}/{len(keys)} leading blocks unchanged)"
+            )
+        return reuse
+
+    def _mark_breakpoints(self, system: List[dict], stable: List[dict]) -> None:
+        """Mark the system prompt, the end of the history and the previous end.
+
+        Keeping the previous request's breakpoint lets the provider read the
+        cache it wrote last step even when the history grew by many blocks.
+        """
+        budget = self.settings.max_breakpoints
+        if budget > 0 and system and mark_cache_breakpoint(system[-1]):
+            budget -= 1
+
+        positions = [len(stable) - 1]
+        if 0 < self._previous_boundary < len(stable):
+            positions.append(self._previous_boundary - 1)
+        marked = set()
+        for position in positions:
+            # Messages carrying only tool calls cannot hold a breakpoint
+            while budget > 0 and position >= 0 and position not in marked:
+                if mark_cache_breakpoint(stable[position]):
+                    marked.add(position)
+                    budget -= 1
+                    break
+                position -= 1
@@ -11,8 +11,11 @@ from docker.errors import NotFound
 from docker.models.containers import Container
 
 from app.config import SandboxSettings
+from app.deadline import remaining
+from app.exceptions import DeadlineExceeded
 from app.sandbox.core.exceptions import SandboxTimeoutError
 from app.sandbox.core.terminal import AsyncDockerizedTerminal
+from app.tracing import span
 
 
 class DockerSandbox:
@@ -150,17 +153,23 @@ class DockerSandbox:
         Raises:
             RuntimeError: If sandbox not initialized or command execution fails.
             TimeoutError: If command execution times out.
+            DeadlineExceeded: If the deadline passed before the command started.
         """
         if not self.terminal:
             raise RuntimeError("Sandbox not initialized")
 
+        timeout = remaining(timeout or self.config.timeout)
+        if timeout is not None and timeout <= 0:
+            # The terminal would take a timeout of 0 as no timeout at all
+            raise DeadlineExceeded("Sandbox command exceeded its deadline")
         try:
-            return await self.terminal.run_command(
-                cmd, timeout=timeout or self.config.timeout
-            )
+            with span("sandbox.run_command") as command_span:
+                output = await self.terminal.run_command(cmd, timeout=timeout)
+                command_span.set(bytes=len(output))
+                return output
         except TimeoutError:
             raise SandboxTimeoutError(
-                f"Command execution timed out after {timeout or self.config.timeout} seconds"
+                f"Command execution timed out after {timeout:.0f} seconds"
             )
 
     async def read_file(self, path: str) -> str:
@@ -182,12 +191,14 @@ class DockerSandbox:
         try:
             # Get file archive
             resolved_path = self._safe_resolve_path(path)
-            tar_stream, _ = await asyncio.to_thread(
-                self.container.get_archive, resolved_path
-            )
+            with span("sandbox.read_file") as read_span:
+                tar_stream, _ = await asyncio.to_thread(
+                    self.container.get_archive, resolved_path
+                )
 
-            # Read file content from tar stream
-            content = await self._read_from_tar(tar_stream)
+                # Read file content from tar stream
+                content = await self._read_from_tar(tar_stream)
+                read_span.set(bytes=len(content))
             return content.decode("utf-8")
 
         except NotFound:
@@ -222,9 +233,10 @@ class DockerSandbox:
             )
 
             # Write file
-            await asyncio.to_thread(
-                self.container.put_archive, parent_dir or "/", tar_stream
-            )
+            with span("sandbox.write_file", bytes=len(content)):
+                await asyncio.to_thread(
+                    self.container.put_archive, parent_dir or "/", tar_stream
+                )
 
         except Exception as e:
             raise RuntimeError(f"Failed to write file: {e}")
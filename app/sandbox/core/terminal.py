@@ -203,10 +203,18 @@ class DockerSession:
 
                 return output
 
-            if timeout:
-                result = await asyncio.wait_for(read_output(), timeout)
-            else:
-                result = await read_output()
+            try:
+                if timeout is not None:
+                    result = await asyncio.wait_for(read_output(), timeout)
+                else:
+                    result = await read_output()
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # Interrupt the command so it does not keep running in the container
+                try:
+                    self.socket.sendall(b"\x03")
+                except OSError:
+                    pass
+                raise
 
             return result.strip()
 
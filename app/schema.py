@@ -1,8 +1,15 @@
+import itertools
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
-from typing import Any, List, Literal, Optional, Union
+from pathlib import Path
+from typing import Any, List, Literal, Optional, Tuple, Union
 
 from pydantic import BaseModel, Field
 
+from app.config import PROJECT_ROOT, MemorySettings, config
+from app.logger import logger
+
 
 class Role(str, Enum):
     """Message role options"""
@@ -60,6 +67,7 @@ class Message(BaseModel):
     name: Optional[str] = Field(default=None)
     tool_call_id: Optional[str] = Field(default=None)
     base64_image: Optional[str] = Field(default=None)
+    image_caption: Optional[str] = Field(default=None)
 
     def __add__(self, other) -> List["Message"]:
         """支持 Message + list 或 Message + Message 的操作"""
@@ -96,12 +104,32 @@ class Message(BaseModel):
             message["base64_image"] = self.base64_image
         return message
 
+    def without_image(self) -> "Message":
+        """Copy of the message with its image replaced by a short text placeholder"""
+        if not self.base64_image:
+            return self
+        placeholder = (
+            f"[Image removed to save context: {self.image_caption}]"
+            if self.image_caption
+            else "[Image removed to save context]"
+        )
+        content = f"{self.content}\n{placeholder}" if self.content else placeholder
+        return self.model_copy(update={"content": content, "base64_image": None})
+
     @classmethod
     def user_message(
-        cls, content: str, base64_image: Optional[str] = None
+        cls,
+        content: str,
+        base64_image: Optional[str] = None,
+        image_caption: Optional[str] = None,
     ) -> "Message":
         """Create a user message"""
-        return cls(role=Role.USER, content=content, base64_image=base64_image)
+        return cls(
+            role=Role.USER,
+            content=content,
+            base64_image=base64_image,
+            image_caption=image_caption,
+        )
 
     @classmethod
     def system_message(cls, content: str) -> "Message":
@@ -117,7 +145,12 @@ class Message(BaseModel):
 
     @classmethod
     def tool_message(
-        cls, content: str, name, tool_call_id: str, base64_image: Optional[str] = None
+        cls,
+        content: str,
+        name,
+        tool_call_id: str,
+        base64_image: Optional[str] = None,
+        image_caption: Optional[str] = None,
     ) -> "Message":
         """Create a tool message"""
         return cls(
@@ -126,6 +159,7 @@ class Message(BaseModel):
             name=name,
             tool_call_id=tool_call_id,
             base64_image=base64_image,
+            image_caption=image_caption,
         )
 
     @classmethod
@@ -156,27 +190,246 @@ class Message(BaseModel):
         )
 
 
+class CompactionRecord(BaseModel):
+    """What a memory compaction replaced with a summary"""
+
+    created_at: float = Field(..., description="Unix time of the compaction")
+    tokens_before: int = Field(..., description="Prompt tokens before compaction")
+    tokens_after: int = Field(..., description="Prompt tokens after compaction")
+    summary: str = Field(..., description="Summary that replaced the messages")
+    tool_calls: List[str] = Field(
+        default_factory=list, description="Names of the tool calls that were dropped"
+    )
+    message_count: int = Field(0, description="Messages removed from memory")
+    spill_start: Optional[int] = Field(
+        None,
+        description="Position of the removed messages in the spill log (None if discarded)",
+    )
+
+
+_token_counter = None
+
+
+def _counter():
+    global _token_counter
+    if _token_counter is None:
+        import tiktoken
+
+        from app.llm import TokenCounter  # app.llm imports this module
+
+        _token_counter = TokenCounter(tiktoken.get_encoding("cl100k_base"))
+    return _token_counter
+
+
+def estimate_tokens(message: Message) -> int:
+    """Approximate prompt tokens of a message, without its image"""
+    data = message.to_dict()
+    data.pop("base64_image", None)
+    return _counter().count_message_tokens([data])
+
+
+def count_tokens(text: str) -> int:
+    """Approximate tokens of a text"""
+    return _counter().count_text(text)
+
+
+def _memory_settings() -> MemorySettings:
+    return config.memory or MemorySettings()
+
+
+def _spill_path() -> Optional[str]:
+    spill_dir = _memory_settings().spill_dir
+    if not spill_dir:
+        return None
+    path = Path(spill_dir)
+    if not path.is_absolute():
+        path = PROJECT_ROOT / path
+    return str(path / f"{uuid.uuid4().hex}.jsonl")
+
+
+_spill_writer: Optional[ThreadPoolExecutor] = None
+
+
+def _spill_executor() -> ThreadPoolExecutor:
+    global _spill_writer
+    if _spill_writer is None:
+        _spill_writer = ThreadPoolExecutor(1, thread_name_prefix="memory-spill")
+    return _spill_writer
+
+
+def _append_lines(path: Path, lines: List[str]) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as log:
+            log.writelines(lines)
+    except OSError as e:
+        logger.warning(f"Failed to spill {len(lines)} messages to {path}: {e}")
+
+
 class Memory(BaseModel):
+    """Recent messages of an agent.
+
+    Appends are amortized O(1): once a limit is exceeded, the oldest messages
+    are evicted in one batch down to `trim_ratio` of the limits, never
+    separating tool results from their call and keeping the first user
+    message, the task. Evicted and compacted messages are appended to an
+    on-disk log when `spill_path` is set and can be read back with
+    `load_spilled`.
+    """
+
     messages: List[Message] = Field(default_factory=list)
-    max_messages: int = Field(default=100)
+    max_messages: int = Field(default_factory=lambda: _memory_settings().max_messages)
+    max_tokens: Optional[int] = Field(
+        default_factory=lambda: _memory_settings().max_tokens
+    )
+    trim_ratio: float = Field(default_factory=lambda: _memory_settings().trim_ratio)
+    max_images: Optional[int] = Field(
+        default_factory=lambda: config.memory.max_images if config.memory else None
+    )
+    spill_path: Optional[str] = Field(
+        default_factory=_spill_path,
+        description="Append-only JSONL log of evicted messages",
+    )
+    spilled: int = Field(default=0, description="Messages written to the spill log")
+    compactions: List[CompactionRecord] = Field(default_factory=list)
+
+    # Token estimate of `messages`, valid for the list object and length tracked
+    _tokens: int = 0
+    _tracked: Tuple[int, int] = (0, 0)
+    # Latest write to the spill log, writes run in order on one thread
+    _spill_write: Optional[Future] = None
 
     def add_message(self, message: Message) -> None:
         """Add a message to memory"""
-        self.messages.append(message)
-        # Optional: Implement message limit
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages :]
+        self.add_messages([message])
 
     def add_messages(self, messages: List[Message]) -> None:
         """Add multiple messages to memory"""
         self.messages.extend(messages)
-        # Optional: Implement message limit
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages :]
+        self._track(messages)
+        self._trim()
+        if any(message.base64_image for message in messages):
+            self.drop_old_images()
+
+    def _track(self, added: List[Message]) -> None:
+        """Update the token estimate, recounting if the list changed elsewhere"""
+        if self.max_tokens is None:
+            return
+        list_id, length = self._tracked
+        if list_id != id(self.messages) or length + len(added) != len(self.messages):
+            self._tokens = sum(estimate_tokens(message) for message in self.messages)
+        else:
+            self._tokens += sum(estimate_tokens(message) for message in added)
+        self._tracked = (id(self.messages), len(self.messages))
+
+    def _trim(self) -> None:
+        """Evict the oldest messages in one batch once a limit is exceeded"""
+        over_tokens = self.max_tokens is not None and self._tokens > self.max_tokens
+        if len(self.messages) <= self.max_messages and not over_tokens:
+            return
+
+        # The latest call and its results are always kept
+        last_group = len(self.messages) - 1
+        while last_group > 0 and self.messages[last_group].role == Role.TOOL:
+            last_group -= 1
+
+        cut = len(self.messages) - int(self.max_messages * self.trim_ratio)
+        cut = min(max(cut, 0), last_group)
+        counting = self.max_tokens is not None
+        evicted_tokens = (
+            sum(estimate_tokens(message) for message in self.messages[:cut])
+            if counting
+            else 0
+        )
+        if counting:
+            target = self.max_tokens * self.trim_ratio
+            while cut < last_group and self._tokens - evicted_tokens > target:
+                evicted_tokens += estimate_tokens(self.messages[cut])
+                cut += 1
+        # Results belong to the evicted call that produced them
+        while cut < last_group and self.messages[cut].role == Role.TOOL:
+            if counting:
+                evicted_tokens += estimate_tokens(self.messages[cut])
+            cut += 1
+        if cut == 0:
+            return
+
+        evicted = self.messages[:cut]
+        # The first user message, usually the task, is never evicted
+        task = next((m for m in evicted if m.role == Role.USER), None)
+        if task is not None:
+            evicted.remove(task)
+            if counting:
+                evicted_tokens -= estimate_tokens(task)
+        self.messages[:cut] = [task] if task is not None else []
+        self._tokens -= evicted_tokens
+        self._tracked = (id(self.messages), len(self.messages))
+        if evicted:
+            self.spill(evicted)
+
+    def spill(self, messages: List[Message]) -> Optional[int]:
+        """Append messages removed from memory to the spill log.
+
+        The file is written by a background thread, so callers on the event
+        loop do not block on disk I/O; `load_spilled` waits for pending writes.
+
+        Returns:
+            Position of the first message for `load_spilled`, or None if the
+            messages are not stored
+        """
+        if not self.spill_path:
+            return None
+        lines = [message.model_dump_json() + "\n" for message in messages]
+        self._spill_write = _spill_executor().submit(
+            _append_lines, Path(self.spill_path), lines
+        )
+        start = self.spilled
+        self.spilled += len(messages)
+        return start
+
+    def flush_spilled(self) -> None:
+        """Wait until the spill log holds every spilled message"""
+        if self._spill_write is not None:
+            self._spill_write.result()
+
+    def load_spilled(self, start: int = 0, stop: Optional[int] = None) -> List[Message]:
+        """Read evicted messages back from the spill log, oldest first"""
+        self.flush_spilled()
+        if not self.spill_path or not Path(self.spill_path).exists():
+            return []
+        with open(self.spill_path, encoding="utf-8") as log:
+            return [
+                Message.model_validate_json(line)
+                for line in itertools.islice(log, start, stop)
+            ]
+
+    def drop_old_images(self) -> None:
+        """Replace older images by placeholders once more than `max_images` are inline.
+
+        Images are dropped in one batch down to `trim_ratio` of the limit, so
+        the history, and with it the cached prompt prefix, changes only every
+        few images. Messages are replaced rather than modified, as checkpoints
+        detect changed messages by identity.
+        """
+        if self.max_images is None:
+            return
+        images = [i for i, message in enumerate(self.messages) if message.base64_image]
+        if len(images) <= self.max_images:
+            return
+        keep = int(self.max_images * self.trim_ratio)
+        if self.max_images:
+            keep = max(keep, 1)  # The latest image was just added
+        for index in images[: len(images) - keep]:
+            message = self.messages[index]
+            self.messages[index] = placeholder = message.without_image()
+            if self.max_tokens is not None:
+                self._tokens += estimate_tokens(placeholder) - estimate_tokens(message)
 
     def clear(self) -> None:
         """Clear all messages"""
         self.messages.clear()
+        self._tokens = 0
+        self._tracked = (id(self.messages), 0)
 
     def get_recent_messages(self, n: int) -> List[Message]:
         """Get n most recent messages"""
@@ -0,0 +1,62 @@
+"""Per-session resources, so many agents can run in one process.
+
+A session owns the resources that used to be process-wide: the sandbox
+client and the LLM instances (with their token counters). Agents keep the
+session that is current when they are created and make it current while they
+run, so their tools and LLM calls resolve the session's resources. Outside
+any session the process-wide defaults are used, as before.
+"""
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Dict, Iterator, Optional
+
+from app.logger import logger
+from app.sandbox.client import SANDBOX_CLIENT, BaseSandboxClient, create_sandbox_client
+
+
+if TYPE_CHECKING:
+    from app.llm import LLM
+
+
+class Session:
+    """Resources of one user session, released with `close`"""
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.sandbox_client: BaseSandboxClient = create_sandbox_client()
+        self.llms: Dict[str, "LLM"] = {}
+
+    async def close(self) -> None:
+        """Release the session's sandbox"""
+        try:
+            await self.sandbox_client.cleanup()
+        except Exception as e:
+            logger.error(f"Error cleaning up sandbox of session {self.session_id}: {e}")
+
+    def __repr__(self) -> str:
+        return f"Session({self.session_id!r})"
+
+
+_current_session: ContextVar[Optional[Session]] = ContextVar("session", default=None)
+
+
+def current_session() -> Optional[Session]:
+    """Return the session the caller runs in, if any"""
+    return _current_session.get()
+
+
+@contextmanager
+def use_session(session: Optional[Session]) -> Iterator[Optional[Session]]:
+    """Make a session current; agents and LLMs created inside belong to it"""
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+
+
+def get_sandbox_client() -> BaseSandboxClient:
+    """Return the sandbox client of the current session or the shared one"""
+    session = _current_session.get()
+    return session.sandbox_client if session else SANDBOX_CLIENT
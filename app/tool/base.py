@@ -94,6 +94,11 @@ class BaseTool(ABC, BaseModel):
     name: str
     description: str
     parameters: Optional[dict] = None
+    # Whether calls may run concurrently with other calls of the same turn,
+    # e.g. because they are read-only or use an independent resource
+    concurrency_safe: bool = False
+    # Limit on concurrent calls of this tool, None for only the agent's limit
+    max_concurrency: Optional[int] = None
     # _schemas: Dict[str, List[ToolSchema]] = {}
 
     class Config:
@@ -121,6 +126,17 @@ class BaseTool(ABC, BaseModel):
     async def execute(self, **kwargs) -> Any:
         """Execute the tool with given parameters."""
 
+    def get_state(self) -> Optional[dict]:
+        """JSON-serializable state to checkpoint, None for stateless tools"""
+        return None
+
+    def set_state(self, state: dict) -> None:
+        """Restore the state returned by `get_state`"""
+
+    def is_concurrency_safe(self, **kwargs) -> bool:
+        """Whether a call with these arguments can run concurrently with others"""
+        return self.concurrency_safe
+
     def to_param(self) -> Dict:
         """Convert tool to function call format.
 
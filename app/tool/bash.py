@@ -1,8 +1,13 @@
 import asyncio
+import codecs
 import os
-from typing import Optional
+import re
+import signal
+import uuid
+from typing import Any, Callable, Optional
 
-from app.exceptions import ToolError
+from app.deadline import expired, remaining
+from app.exceptions import DeadlineExceeded, ToolError
 from app.tool.base import BaseTool, CLIResult
 
 
@@ -13,6 +18,36 @@ _BASH_DESCRIPTION = """Execute a bash command in the terminal.
 """
 
 
+class _OutputBuffer:
+    """Output of one command, keeping its head and tail within `max_bytes`"""
+
+    def __init__(self, max_bytes: int):
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.omitted = 0
+
+    def append(self, data: bytes) -> None:
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            excess = len(self.tail) - self.tail_limit
+            if excess > 0:
+                del self.tail[:excess]
+                self.omitted += excess
+
+    def text(self) -> str:
+        head = self.head.decode(errors="replace")
+        tail = self.tail.decode(errors="replace")
+        if not self.omitted:
+            return head + tail
+        return f"{head}\n[... {self.omitted} bytes of output omitted ...]\n{tail}"
+
+
 class _BashSession:
     """A session of a bash shell."""
 
@@ -20,13 +55,24 @@ class _BashSession:
     _process: asyncio.subprocess.Process
 
     command: str = "/bin/bash"
-    _output_delay: float = 0.2  # seconds
     _timeout: float = 120.0  # seconds
-    _sentinel: str = "<<exit>>"
+    _chunk_size: int = 65536
 
-    def __init__(self):
+    def __init__(
+        self,
+        max_output: int = 100_000,
+        on_output: Optional[Callable[[str], Any]] = None,
+    ):
         self._started = False
         self._timed_out = False
+        self._max_output = max_output
+        self._on_output = on_output
+        # Printed after each command with its exit status; unique per session
+        # so command output cannot fake it
+        self._sentinel = f"<<exit-{uuid.uuid4().hex}:"
+        self._end = re.compile(
+            rb"\n" + re.escape(self._sentinel.encode()) + rb"(-?\d+)>>\n"
+        )
 
     async def start(self):
         if self._started:
@@ -39,18 +85,23 @@ class _BashSession:
             bufsize=0,
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+            # One pipe keeps stdout and stderr in the order they were written
+            stderr=asyncio.subprocess.STDOUT,
         )
 
         self._started = True
 
     def stop(self):
-        """Terminate the bash shell."""
+        """Terminate the bash shell and the commands it started."""
         if not self._started:
             raise ToolError("Session has not started.")
         if self._process.returncode is not None:
             return
-        self._process.terminate()
+        try:
+            # The shell leads its own process group (setsid)
+            os.killpg(self._process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
 
     async def run(self, command: str):
         """Execute a command in the bash shell."""
@@ -69,48 +120,68 @@ class _BashSession:
         # we know these are not None because we created the process with PIPEs
         assert self._process.stdin
         assert self._process.stdout
-        assert self._process.stderr
 
-        # send command to the process
+        # send the command, then print the sentinel with its exit status on
+        # its own line, so commands ending in `&` or a comment work too
         self._process.stdin.write(
-            command.encode() + f"; echo '{self._sentinel}'\n".encode()
+            f"{command}\n__status=$?; printf '\\n{self._sentinel}%d>>\\n' "
+            f'"$__status"\n'.encode()
         )
         await self._process.stdin.drain()
 
-        # read output from the process, until the sentinel is found
+        # read output chunks as they arrive, until the sentinel is found
+        timeout = remaining(self._timeout)
+        output = _OutputBuffer(self._max_output)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # Bytes that may hold the start of the sentinel line are held back
+        keep = len(self._sentinel) + 32
+        pending = b""
         try:
-            async with asyncio.timeout(self._timeout):
+            async with asyncio.timeout(timeout):
                 while True:
-                    await asyncio.sleep(self._output_delay)
-                    # if we read directly from stdout/stderr, it will wait forever for
-                    # EOF. use the StreamReader buffer directly instead.
-                    output = (
-                        self._process.stdout._buffer.decode()
-                    )  # pyright: ignore[reportAttributeAccessIssue]
-                    if self._sentinel in output:
-                        # strip the sentinel and break
-                        output = output[: output.index(self._sentinel)]
+                    chunk = await self._process.stdout.read(self._chunk_size)
+                    if not chunk:
+                        return CLIResult(
+                            output=output.text() + pending.decode(errors="replace"),
+                            system="tool must be restarted",
+                            error="bash has exited",
+                        )
+                    # Only the new bytes and the held back ones are searched
+                    pending += chunk
+                    match = self._end.search(pending)
+                    if match:
+                        self._emit(output, decoder, pending[: match.start()])
+                        exit_code = int(match.group(1))
                         break
+                    self._emit(output, decoder, pending[:-keep])
+                    pending = pending[-keep:]
         except asyncio.TimeoutError:
+            if expired():  # The deadline, not bash's own limit, was reached
+                raise DeadlineExceeded("Tool 'bash' exceeded its deadline") from None
             self._timed_out = True
             raise ToolError(
-                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
+                f"timed out: bash has not returned in {timeout:.0f} seconds and must be restarted",
             ) from None
 
-        if output.endswith("\n"):
-            output = output[:-1]
-
-        error = (
-            self._process.stderr._buffer.decode()
-        )  # pyright: ignore[reportAttributeAccessIssue]
-        if error.endswith("\n"):
-            error = error[:-1]
-
-        # clear the buffers so that the next output can be read correctly
-        self._process.stdout._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
-        self._process.stderr._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
+        text = output.text()
+        if text.endswith("\n"):
+            text = text[:-1]
+        if exit_code:
+            text = (
+                f"{text}\n[exit code {exit_code}]"
+                if text
+                else f"[exit code {exit_code}]"
+            )
+        return CLIResult(output=text)
 
-        return CLIResult(output=output, error=error)
+    def _emit(self, output: _OutputBuffer, decoder, data: bytes) -> None:
+        if not data:
+            return
+        output.append(data)
+        if self._on_output:
+            text = decoder.decode(data)
+            if text:
+                self._on_output(text)
 
 
 class Bash(BaseTool):
@@ -129,6 +200,11 @@ class Bash(BaseTool):
         "required": ["command"],
     }
 
+    # Bytes of output kept per command, half head and half tail
+    max_output: int = 100_000
+    # Called with output chunks as they arrive, e.g. for long-running commands
+    on_output: Optional[Callable[[str], Any]] = None
+
     _session: Optional[_BashSession] = None
 
     async def execute(
@@ -137,17 +213,23 @@ class Bash(BaseTool):
         if restart:
             if self._session:
                 self._session.stop()
-            self._session = _BashSession()
+            self._session = _BashSession(self.max_output, self.on_output)
             await self._session.start()
 
             return CLIResult(system="tool has been restarted.")
 
         if self._session is None:
-            self._session = _BashSession()
+            self._session = _BashSession(self.max_output, self.on_output)
             await self._session.start()
 
         if command is not None:
-            return await self._session.run(command)
+            try:
+                return await self._session.run(command)
+            except (asyncio.CancelledError, DeadlineExceeded):
+                # Kill the interrupted command, the next call starts a new shell
+                self._session.stop()
+                self._session = None
+                raise
 
         raise ToolError("no command provided.")
 
@@ -11,9 +11,13 @@ from pydantic import Field, field_validator
 from pydantic_core.core_schema import ValidationInfo
 
 from app.config import config
+from app.deadline import remaining
+from app.exceptions import DeadlineExceeded
+from app.ledger import call_site
 from app.llm import LLM
 from app.tool.base import BaseTool, ToolResult
 from app.tool.web_search import WebSearch
+from app.tracing import span
 
 
 _BROWSER_DESCRIPTION = """\
@@ -36,6 +40,16 @@ Note: When using element indices, refer to the numbered elements shown in the cu
 Context = TypeVar("Context")
 
 
+def _timeout_ms() -> Optional[float]:
+    """Page load timeout within the current deadline, None for the default"""
+    timeout = remaining()
+    if timeout is None:
+        return None
+    if timeout <= 0:  # Playwright takes a timeout of 0 as no timeout at all
+        raise DeadlineExceeded("Tool 'browser_use' exceeded its deadline")
+    return timeout * 1000
+
+
 class BrowserUseTool(BaseTool, Generic[Context]):
     name: str = "browser_use"
     description: str = _BROWSER_DESCRIPTION
@@ -182,7 +196,8 @@ class BrowserUseTool(BaseTool, Generic[Context]):
             ):
                 context_config = config.browser_config.new_context_config
 
-            self.context = await self.browser.new_context(context_config)
+            with span("browser.new_context"):
+                self.context = await self.browser.new_context(context_config)
             self.dom_service = DomService(await self.context.get_current_page())
 
         return self.context
@@ -236,8 +251,9 @@ class BrowserUseTool(BaseTool, Generic[Context]):
                             error="URL is required for 'go_to_url' action"
                         )
                     page = await context.get_current_page()
-                    await page.goto(url)
-                    await page.wait_for_load_state()
+                    with span("browser.navigate"):
+                        await page.goto(url, timeout=_timeout_ms())
+                        await page.wait_for_load_state()
                     return ToolResult(output=f"Navigated to {url}")
 
                 elif action == "go_back":
@@ -262,8 +278,9 @@ class BrowserUseTool(BaseTool, Generic[Context]):
                     url_to_navigate = first_search_result.url
 
                     page = await context.get_current_page()
-                    await page.goto(url_to_navigate)
-                    await page.wait_for_load_state()
+                    with span("browser.navigate"):
+                        await page.goto(url_to_navigate, timeout=_timeout_ms())
+                        await page.wait_for_load_state()
 
                     return search_response
 
@@ -428,11 +445,12 @@ Page content:
                     }
 
                     # Use LLM to extract content with required function calling
-                    response = await self.llm.ask_tool(
-                        messages,
-                        tools=[extraction_function],
-                        tool_choice="required",
-                    )
+                    with call_site("extract_content"):
+                        response = await self.llm.ask_tool(
+                            messages,
+                            tools=[extraction_function],
+                            tool_choice="required",
+                        )
 
                     if response and response.tool_calls:
                         args = json.loads(response.tool_calls[0].function.arguments)
@@ -489,7 +507,8 @@ Page content:
             if not ctx:
                 return ToolResult(error="Browser context not initialized")
 
-            state = await ctx.get_state()
+            with span("browser.get_state"):
+                state = await ctx.get_state()
 
             # Create a viewport_info dictionary if it doesn't exist
             viewport_height = 0
@@ -504,9 +523,11 @@ Page content:
             await page.bring_to_front()
             await page.wait_for_load_state()
 
-            screenshot = await page.screenshot(
-                full_page=True, animations="disabled", type="jpeg", quality=100
-            )
+            with span("browser.screenshot") as screenshot_span:
+                screenshot = await page.screenshot(
+                    full_page=True, animations="disabled", type="jpeg", quality=100
+                )
+                screenshot_span.set(bytes=len(screenshot))
 
             screenshot = base64.b64encode(screenshot).decode("utf-8")
 
@@ -6,7 +6,7 @@ providing fast, precise, and AI-ready data extraction with clean Markdown genera
 """
 
 import asyncio
-from typing import List, Union
+from typing import List, Optional, Union
 from urllib.parse import urlparse
 
 from app.logger import logger
@@ -61,6 +61,9 @@ class Crawl4aiTool(BaseTool):
         },
         "required": ["urls"],
     }
+    # Each call crawls with its own browser instance
+    concurrency_safe: bool = True
+    max_concurrency: Optional[int] = 2
 
     async def execute(
         self,
@@ -9,6 +9,7 @@ from mcp.types import ListToolsResult, TextContent
 from app.logger import logger
 from app.tool.base import BaseTool, ToolResult
 from app.tool.tool_collection import ToolCollection
+from app.tracing import span
 
 
 class MCPClientTool(BaseTool):
@@ -25,7 +26,8 @@ class MCPClientTool(BaseTool):
 
         try:
             logger.info(f"Executing tool: {self.original_name}")
-            result = await self.session.call_tool(self.original_name, kwargs)
+            with span("mcp.call_tool", server=self.server_id):
+                result = await self.session.call_tool(self.original_name, kwargs)
             content_str = ", ".join(
                 item.text for item in result.content if isinstance(item, TextContent)
             )
@@ -116,6 +118,9 @@ class MCPClients(ToolCollection):
                 session=session,
                 server_id=server_id,
                 original_name=original_name,
+                concurrency_safe=bool(
+                    getattr(getattr(tool, "annotations", None), "readOnlyHint", False)
+                ),
             )
             self.tool_map[tool_name] = server_tool
 
@@ -69,6 +69,13 @@ class PlanningTool(BaseTool):
     plans: dict = {}  # Dictionary to store plans by plan_id
     _current_plan_id: Optional[str] = None  # Track the current active plan
 
+    def get_state(self) -> Optional[dict]:
+        return {"plans": self.plans, "current_plan_id": self._current_plan_id}
+
+    def set_state(self, state: dict) -> None:
+        self.plans = state.get("plans", {})
+        self._current_plan_id = state.get("current_plan_id")
+
     async def execute(
         self,
         *,
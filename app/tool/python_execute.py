@@ -1,9 +1,25 @@
+import asyncio
 import multiprocessing
 import sys
-from io import StringIO
-from typing import Dict
+import uuid
+from typing import Any, Callable, Dict, Optional
 
+from pydantic import Field
+
+from app.config import InterpreterSettings, config
+from app.deadline import remaining
+from app.logger import logger
 from app.tool.base import BaseTool
+from app.tool.python_pool import get_pool
+from app.tool.python_worker import (
+    BoundedOutput,
+    apply_limits,
+    cpu_time,
+    limit_cpu_time,
+    memory_usage,
+    reset_peak_rss,
+)
+from app.tracing import span
 
 
 class PythonExecute(BaseTool):
@@ -21,11 +37,24 @@ class PythonExecute(BaseTool):
         },
         "required": ["code"],
     }
+    # Called with output chunks while code runs in a pooled interpreter
+    on_output: Optional[Callable[[str], Any]] = None
+    # Key of this tool's interpreter, whose variables persist between calls
+    interpreter_key: str = Field(default_factory=lambda: uuid.uuid4().hex)
 
-    def _run_code(self, code: str, result_dict: dict, safe_globals: dict) -> None:
+    def _run_code(
+        self,
+        code: str,
+        result_dict: dict,
+        safe_globals: dict,
+        settings: InterpreterSettings,
+    ) -> None:
         original_stdout = sys.stdout
+        output_buffer = BoundedOutput(settings.max_output_chars)
         try:
-            output_buffer = StringIO()
+            reset_peak_rss()
+            apply_limits(settings.limits)
+            limit_cpu_time(settings.cpu_time_limit)
             sys.stdout = output_buffer
             exec(code, safe_globals, safe_globals)
             result_dict["observation"] = output_buffer.getvalue()
@@ -35,6 +64,9 @@ class PythonExecute(BaseTool):
             result_dict["success"] = False
         finally:
             sys.stdout = original_stdout
+            # Peak since reset_peak_rss, of the whole process without /proc
+            result_dict["peak_rss_mb"] = round(memory_usage()[1] / 2**20, 1)
+            result_dict["cpu_time"] = round(cpu_time(), 3)
 
     async def execute(
         self,
@@ -52,24 +84,58 @@ class PythonExecute(BaseTool):
             Dict: Contains 'output' with execution output or error message and 'success' status.
         """
 
+        timeout = remaining(timeout)
+        pool = get_pool()
+        with span("python.execute", pooled=pool is not None) as execute_span:
+            if pool:
+                result = await pool.run(
+                    self.interpreter_key, code, timeout, on_output=self.on_output
+                )
+            else:
+                result = await self._execute_in_process(code, timeout)
+            if "peak_rss_mb" in result:
+                execute_span.set(
+                    peak_rss_mb=result["peak_rss_mb"], cpu_time=result["cpu_time"]
+                )
+                logger.info(
+                    f"Python execution used {result['cpu_time']:.2f}s CPU, "
+                    f"peak RSS {result['peak_rss_mb']:.0f} MB"
+                )
+        return result
+
+    async def _execute_in_process(self, code: str, timeout: Optional[float]) -> Dict:
+        """Run code in a new process, killed after `timeout` seconds"""
         with multiprocessing.Manager() as manager:
             result = manager.dict({"observation": "", "success": False})
             if isinstance(__builtins__, dict):
                 safe_globals = {"__builtins__": __builtins__}
             else:
                 safe_globals = {"__builtins__": __builtins__.__dict__.copy()}
+            settings = config.interpreter or InterpreterSettings()
             proc = multiprocessing.Process(
-                target=self._run_code, args=(code, result, safe_globals)
+                target=self._run_code, args=(code, result, safe_globals, settings)
             )
             proc.start()
-            proc.join(timeout)
+            try:
+                # Wait in a thread so the event loop, and cancellation, keep running
+                await asyncio.to_thread(proc.join, timeout)
+            except asyncio.CancelledError:
+                proc.terminate()
+                proc.join(1)
+                raise
 
             # timeout process
             if proc.is_alive():
                 proc.terminate()
                 proc.join(1)
                 return {
-                    "observation": f"Execution timeout after {timeout} seconds",
+                    "observation": f"Execution timeout after {timeout:.0f} seconds",
                     "success": False,
                 }
             return dict(result)
+
+    async def cleanup(self) -> None:
+        """Stop this tool's pooled interpreter"""
+        pool = get_pool()
+        if pool:
+            pool.release(self.interpreter_key)
@@ -0,0 +1,286 @@
+"""Pool of warm Python interpreters for PythonExecute.
+
+Each interpreter is a `python_worker.py` process that keeps its namespace
+between executions, like a notebook kernel, so imports, variables and
+loaded data survive from one tool call to the next. The pool keeps
+`pool_size` idle interpreters started, binds one to each key (a
+PythonExecute tool, i.e. one agent) on first use and recycles it after
+`max_calls` executions or above `max_memory_mb`. A timeout interrupts the
+running code with SIGINT; only an interpreter that does not stop within
+`interrupt_grace` seconds is killed. Interpreters run under the configured
+resource limits, and every execution reports its peak RSS and CPU time.
+"""
+import asyncio
+import json
+import os
+import signal
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import InterpreterSettings, config
+from app.logger import logger
+from app.tool.python_worker import join_output
+
+
+WORKER_SCRIPT = Path(__file__).with_name("python_worker.py")
+STREAM_LIMIT = 2**20
+
+OutputCallback = Callable[[str], Any]
+
+
+class InterpreterDied(Exception):
+    """The interpreter process exited or broke the protocol"""
+
+
+class Interpreter:
+    """One worker process and its persistent namespace"""
+
+    def __init__(self, settings: InterpreterSettings):
+        self.settings = settings
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.calls = 0
+        self.rss = 0
+        self._lock = asyncio.Lock()
+        self._started = asyncio.ensure_future(self._start())
+
+    async def _start(self) -> None:
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-u",
+            str(WORKER_SCRIPT),
+            json.dumps(
+                {
+                    "max_output": self.settings.max_output_chars,
+                    "preload": self.settings.preload,
+                    "limits": self.settings.limits,
+                }
+            ),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            limit=STREAM_LIMIT,
+        )
+        event = await self._read_event()
+        if event.get("type") != "ready":
+            raise InterpreterDied(f"Unexpected first event: {event}")
+
+    @property
+    def alive(self) -> bool:
+        if not self._started.done():
+            return True
+        if self._started.cancelled() or self._started.exception():
+            return False
+        return self.process.returncode is None
+
+    @property
+    def exhausted(self) -> bool:
+        """Whether the interpreter should be replaced before its next execution"""
+        return (
+            self.calls >= self.settings.max_calls
+            or self.rss >= self.settings.max_memory_mb * 2**20
+        )
+
+    async def _read_event(self) -> dict:
+        line = await self.process.stdout.readline()
+        if not line:
+            raise InterpreterDied("Interpreter exited")
+        try:
+            return json.loads(line)
+        except ValueError:
+            raise InterpreterDied(f"Invalid event from interpreter: {line[:200]!r}")
+
+    async def _collect(self, output: List[str], on_output: Optional[OutputCallback]):
+        """Read events of the running execution until it is done"""
+        while True:
+            event = await self._read_event()
+            if event["type"] == "output":
+                output.append(event["data"])
+                if on_output:
+                    on_output(event["data"])
+            elif event["type"] == "done":
+                self.calls += 1
+                self.rss = event.get("rss") or 0
+                if on_output and event.get("tail"):
+                    on_output(join_output("", event["tail"], event["omitted"]))
+                return event
+
+    def interrupt(self) -> None:
+        if self.process and self.process.returncode is None:
+            self.process.send_signal(signal.SIGINT)
+
+    def kill(self) -> None:
+        if not self._started.done() and not self._started.get_loop().is_closed():
+            self._started.cancel()
+        if self.process and self.process.returncode is None:
+            try:  # Not through the transport, which may belong to a closed loop
+                os.kill(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    async def close(self) -> None:
+        """Kill the interpreter and wait for its process to exit"""
+        self.kill()
+        if self.process:
+            await self.process.wait()
+
+    async def _stop_or_kill(self, collecting: "asyncio.Task[dict]") -> Optional[dict]:
+        """Interrupt the running code, killing the interpreter if it does not stop"""
+        self.interrupt()
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(collecting), self.settings.interrupt_grace
+            )
+        except (asyncio.TimeoutError, InterpreterDied):
+            collecting.cancel()
+            self.kill()
+            return None
+
+    async def run(
+        self,
+        code: str,
+        timeout: Optional[float],
+        on_output: Optional[OutputCallback] = None,
+    ) -> Dict[str, Any]:
+        """Execute code, interrupting it after `timeout` seconds"""
+        await self._lock.acquire()
+        handed_off = False
+        try:
+            await self._started
+            output: List[str] = []
+            request = json.dumps({"code": code}) + "\n"
+            self.process.stdin.write(request.encode("utf-8"))
+            await self.process.stdin.drain()
+            collecting = asyncio.ensure_future(self._collect(output, on_output))
+            try:
+                event = await asyncio.wait_for(asyncio.shield(collecting), timeout)
+            except asyncio.TimeoutError:
+                event = await self._stop_or_kill(collecting)
+                return self._result(output, event, timeout=timeout)
+            except asyncio.CancelledError:
+                # Stop the code in the background; the next execution waits for it
+                handed_off = True
+                task = asyncio.ensure_future(self._stop_or_kill(collecting))
+                task.add_done_callback(lambda _: self._lock.release())
+                raise
+            return self._result(output, event)
+        except (InterpreterDied, OSError) as e:
+            self.kill()
+            return {
+                "observation": f"The Python interpreter stopped unexpectedly ({e}); "
+                "its variables were lost",
+                "success": False,
+            }
+        finally:
+            if not handed_off:
+                self._lock.release()
+
+    def _result(
+        self,
+        output: List[str],
+        event: Optional[dict],
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        text = "".join(output)
+        usage = {}
+        if event:
+            text = join_output(text, event.get("tail", ""), event.get("omitted", 0))
+            usage = {
+                "peak_rss_mb": round(event.get("peak_rss", 0) / 2**20, 1),
+                "cpu_time": round(event.get("cpu_time", 0.0), 3),
+            }
+        if timeout is not None:
+            message = f"Execution timeout after {timeout:.0f} seconds"
+            if event is None:
+                message += "; the interpreter was restarted and its variables were lost"
+            return {"observation": f"{text}{message}", "success": False, **usage}
+        if not event["success"]:
+            text = f"{text}{event['error']}"
+        return {"observation": text, "success": event["success"], **usage}
+
+
+class InterpreterPool:
+    """Idle interpreters plus the interpreters bound to keys"""
+
+    def __init__(self, settings: InterpreterSettings):
+        self.settings = settings
+        self.loop = asyncio.get_running_loop()
+        self._idle: List[Interpreter] = []
+        self._bound: Dict[str, Interpreter] = {}
+
+    def _acquire(self) -> Interpreter:
+        while self._idle:
+            interpreter = self._idle.pop(0)
+            if interpreter.alive:
+                break
+        else:
+            interpreter = Interpreter(self.settings)
+        self._fill()
+        return interpreter
+
+    def _fill(self) -> None:
+        """Start interpreters until `pool_size` are idle"""
+        while len(self._idle) < self.settings.pool_size:
+            self._idle.append(Interpreter(self.settings))
+
+    async def run(
+        self,
+        key: str,
+        code: str,
+        timeout: Optional[float],
+        on_output: Optional[OutputCallback] = None,
+    ) -> Dict[str, Any]:
+        """Execute code in the interpreter bound to a key"""
+        interpreter = self._bound.get(key)
+        if interpreter is None or not interpreter.alive:
+            interpreter = self._bound[key] = self._acquire()
+        result = await interpreter.run(code, timeout, on_output)
+        if not interpreter.alive or interpreter.exhausted:
+            if self._bound.get(key) is interpreter:
+                del self._bound[key]
+            if interpreter.alive:
+                logger.info(
+                    f"Recycling Python interpreter after {interpreter.calls} calls "
+                    f"using {interpreter.rss / 2**20:.0f} MB"
+                )
+                interpreter.kill()
+                result["observation"] = result["observation"].rstrip("\n") + (
+                    "\n[The interpreter was recycled, variables are not kept "
+                    "for the next execution]"
+                )
+        return result
+
+    def release(self, key: str) -> None:
+        """Stop the interpreter bound to a key"""
+        interpreter = self._bound.pop(key, None)
+        if interpreter:
+            interpreter.kill()
+
+    def shutdown(self) -> None:
+        """Kill all interpreters without waiting for them"""
+        for interpreter in self._idle + list(self._bound.values()):
+            interpreter.kill()
+        self._idle, self._bound = [], {}
+
+    async def close(self) -> None:
+        """Stop all interpreters"""
+        interpreters = self._idle + list(self._bound.values())
+        self._idle, self._bound = [], {}
+        await asyncio.gather(*(interpreter.close() for interpreter in interpreters))
+
+
+_pool: Optional[InterpreterPool] = None
+
+
+def get_pool() -> Optional[InterpreterPool]:
+    """Return the pool of the running event loop, or None if it is disabled"""
+    global _pool
+    settings = config.interpreter
+    if not settings or not settings.enabled or os.name != "posix":
+        return None
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool.loop is not loop:
+        if _pool is not None:
+            _pool.shutdown()  # Its processes belong to a closed event loop
+        _pool = InterpreterPool(settings)
+    return _pool
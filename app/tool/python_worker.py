@@ -0,0 +1,267 @@
+"""Worker interpreter of the PythonExecute pool.
+
+Runs as a script (`python python_worker.py <options json>`) and imports
+nothing from `app`, so a warm worker starts in milliseconds; the legacy
+one-process-per-call path imports its helpers. It reads one JSON request
+per line from stdin, executes its code in a namespace that persists between
+requests and writes JSON events to its original stdout:
+
+    {"type": "ready", "pid": ...}
+    {"type": "output", "data": ...}           streamed while the code runs
+    {"type": "done", "success": ..., "error": ..., "tail": ..., "omitted": ...,
+     "rss": ..., "peak_rss": ..., "cpu_time": ...}
+
+SIGINT interrupts the running code with KeyboardInterrupt and is ignored
+between requests; the namespace survives. The code reads stdin from
+/dev/null and output of child processes goes to stderr, so neither can mix
+with the requests and events.
+"""
+import io
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+
+
+FLUSH_CHARS = 4096
+FLUSH_INTERVAL = 0.1
+
+
+class CPUTimeExceeded(Exception):
+    """Raised in the executed code when it used up its CPU time"""
+
+
+class BoundedOutput(io.TextIOBase):
+    """stdout and stderr of executed code, keeping only its head and tail.
+
+    The first half of `max_chars` is the head, passed to `send` in chunks as
+    it is written when a callback is given; the last half is the tail, kept
+    in a ring of chunks. Everything in between is counted, not stored.
+    """
+
+    def __init__(self, max_chars: int, send: Optional[Callable[[str], None]] = None):
+        self.send = send
+        self.head_limit = max_chars // 2
+        self.tail_limit = max_chars - self.head_limit
+        self.head: List[str] = []
+        self.head_chars = 0
+        self.pending: List[str] = []  # Head not sent yet
+        self.pending_chars = 0
+        self.tail: deque = deque()
+        self.tail_chars = 0
+        self.total = 0
+        self.last_flush = time.monotonic()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        length = len(text)
+        self.total += length
+        room = self.head_limit - self.head_chars
+        if room > 0:
+            part, text = text[:room], text[room:]
+            self.head_chars += len(part)
+            if self.send:
+                self.pending.append(part)
+                self.pending_chars += len(part)
+            else:
+                self.head.append(part)
+        if text:
+            self.tail.append(text)
+            self.tail_chars += len(text)
+            while self.tail and self.tail_chars - len(self.tail[0]) >= self.tail_limit:
+                self.tail_chars -= len(self.tail.popleft())
+        if self.pending and (
+            self.pending_chars >= FLUSH_CHARS
+            or time.monotonic() - self.last_flush >= FLUSH_INTERVAL
+        ):
+            self.flush()
+        return length
+
+    def flush(self) -> None:
+        if self.pending:
+            data = "".join(self.pending)
+            self.pending, self.pending_chars = [], 0
+            for start in range(0, len(data), FLUSH_CHARS):
+                self.send(data[start : start + FLUSH_CHARS])
+        self.last_flush = time.monotonic()
+
+    def tail_text(self) -> str:
+        text = "".join(self.tail)
+        return text[max(len(text) - self.tail_limit, 0) :]
+
+    @property
+    def omitted(self) -> int:
+        return self.total - self.head_chars - len(self.tail_text())
+
+    def getvalue(self) -> str:
+        return join_output("".join(self.head), self.tail_text(), self.omitted)
+
+
+def join_output(head: str, tail: str, omitted: int) -> str:
+    if not omitted:
+        return head + tail
+    return f"{head}\n[... {omitted} characters of output omitted ...]\n{tail}"
+
+
+def _raise_cpu_time_exceeded(signum, frame):
+    raise CPUTimeExceeded("CPU time limit exceeded")
+
+
+def apply_limits(limits: dict) -> None:
+    """Set soft resource limits of this process.
+
+    `memory_mb` limits the address space, `file_size_mb` the size of written
+    files (writes beyond it fail with EFBIG instead of killing the process)
+    and `open_files` the file descriptors. CPU time is limited per execution
+    with `limit_cpu_time`.
+    """
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    for key, name, scale in (
+        ("memory_mb", "RLIMIT_AS", 2**20),
+        ("file_size_mb", "RLIMIT_FSIZE", 2**20),
+        ("open_files", "RLIMIT_NOFILE", 1),
+    ):
+        if limits.get(key) and hasattr(resource, name):
+            _set_soft_limit(resource, getattr(resource, name), limits[key] * scale)
+    if limits.get("file_size_mb") and hasattr(signal, "SIGXFSZ"):
+        signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+    if limits.get("cpu_seconds") and hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _raise_cpu_time_exceeded)
+
+
+def limit_cpu_time(seconds: Optional[float]) -> None:
+    """Allow `seconds` more CPU time, or any amount for None"""
+    try:
+        import resource
+    except ImportError:
+        return
+    if seconds is None:
+        _set_soft_limit(resource, resource.RLIMIT_CPU, resource.RLIM_INFINITY)
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = usage.ru_utime + usage.ru_stime
+    _set_soft_limit(resource, resource.RLIMIT_CPU, int(used + seconds) + 1)
+
+
+def _set_soft_limit(resource, limit: int, value: int) -> None:
+    _, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        # No limit means as much as the hard limit allows
+        value = hard if value == resource.RLIM_INFINITY else min(value, hard)
+    # The hard limit is kept so the soft one can be raised again
+    resource.setrlimit(limit, (value, hard))
+
+
+def reset_peak_rss() -> None:
+    """Reset the peak RSS of this process where Linux allows it"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def memory_usage() -> Tuple[int, int]:
+    """Current and peak resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/status") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+        return (
+            int(fields["VmRSS"].split()[0]) * 1024,
+            int(fields["VmHWM"].split()[0]) * 1024,
+        )
+    except (OSError, KeyError, ValueError, IndexError):
+        import resource
+
+        # Only the peak is known without /proc (KiB on Linux)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return peak, peak
+
+
+def cpu_time() -> float:
+    """CPU seconds used by this process and its finished children"""
+    try:
+        import resource
+    except ImportError:
+        return time.process_time()
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def main() -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    requests = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    channel = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(2, 1)
+
+    def send(event: dict) -> None:
+        channel.write(json.dumps(event) + "\n")
+        channel.flush()
+
+    options = json.loads(sys.argv[1])
+    for module in options.get("preload", []):
+        try:
+            __import__(module)
+        except Exception:
+            pass
+    limits = options.get("limits", {})
+    apply_limits(limits)
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    send({"type": "ready", "pid": os.getpid()})
+
+    while True:
+        line = requests.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        output = BoundedOutput(
+            options["max_output"], lambda data: send({"type": "output", "data": data})
+        )
+        event = {"type": "done", "success": True, "error": None}
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = output
+        reset_peak_rss()
+        start_cpu = cpu_time()
+        try:
+            try:
+                limit_cpu_time(limits.get("cpu_seconds"))
+                signal.signal(signal.SIGINT, signal.default_int_handler)
+                exec(compile(request["code"], "<python_execute>", "exec"), namespace)
+            finally:
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                limit_cpu_time(None)
+        except KeyboardInterrupt:
+            event.update(success=False, error="KeyboardInterrupt", interrupted=True)
+        except BaseException as e:  # SystemExit included, the worker keeps running
+            lines = traceback.format_exception_only(type(e), e)
+            event.update(success=False, error="".join(lines).strip())
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        output.flush()
+        rss, peak_rss = memory_usage()
+        event.update(
+            tail=output.tail_text(),
+            omitted=output.omitted,
+            rss=rss,
+            peak_rss=peak_rss,
+            cpu_time=cpu_time() - start_cpu,
+        )
+        send(event)
+
+
+if __name__ == "__main__":
+    main()
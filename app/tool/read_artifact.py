@@ -0,0 +1,119 @@
+from typing import List, Optional, Tuple
+
+from app.artifacts import ArtifactStore
+from app.exceptions import ToolError
+from app.tool.base import BaseTool, ToolResult
+
+
+_READ_ARTIFACT_DESCRIPTION = """Read a tool output that was too long to show in full.
+Long outputs are shown as their beginning and end plus an artifact id. Use this tool with that id to:
+* read a range of lines with `start_line` and `end_line` (1-based, inclusive)
+* search with `pattern` (a regular expression), optionally with `context` lines around each match
+Long lines are cut off; read the rest of one with `offset`, the first character to return.
+"""
+
+MAX_LINES = 200
+MAX_CHARS = 20_000
+# Room for the observation header and notes, so results are not spilled again
+RESERVED_CHARS = 200
+
+
+class ReadArtifact(BaseTool):
+    name: str = "read_artifact"
+    description: str = _READ_ARTIFACT_DESCRIPTION
+    parameters: dict = {
+        "type": "object",
+        "properties": {
+            "artifact_id": {
+                "type": "string",
+                "description": "Id of the stored output.",
+            },
+            "start_line": {
+                "type": "integer",
+                "description": "First line to read, defaults to 1.",
+            },
+            "end_line": {
+                "type": "integer",
+                "description": f"Last line to read, at most {MAX_LINES} lines are returned.",
+            },
+            "pattern": {
+                "type": "string",
+                "description": "Regular expression to search for instead of reading a range.",
+            },
+            "context": {
+                "type": "integer",
+                "description": "Lines shown before and after each match, defaults to 0.",
+            },
+            "offset": {
+                "type": "integer",
+                "description": "First character of each line to return, defaults to 0.",
+            },
+            "max_chars": {
+                "type": "integer",
+                "description": "Characters returned in total, defaults to the most the agent observes.",
+            },
+        },
+        "required": ["artifact_id"],
+    }
+    concurrency_safe: bool = True
+
+    store: ArtifactStore
+    # Characters of lines in one result, below the agent's max_observe
+    max_output: int = MAX_CHARS
+
+    async def execute(
+        self,
+        artifact_id: str,
+        start_line: int = 1,
+        end_line: Optional[int] = None,
+        pattern: Optional[str] = None,
+        context: int = 0,
+        offset: int = 0,
+        max_chars: Optional[int] = None,
+    ) -> ToolResult:
+        try:
+            if pattern:
+                found = self.store.grep(artifact_id, pattern, context)
+                if not found:
+                    return ToolResult(output=f"No lines match {pattern!r}")
+                numbered = found[:MAX_LINES]
+            else:
+                if end_line is None or end_line - start_line >= MAX_LINES:
+                    end_line = start_line + MAX_LINES - 1
+                lines, total = self.store.read_lines(artifact_id, start_line, end_line)
+                if not lines:
+                    return ToolResult(output=f"The artifact has {total} lines")
+                numbered = list(enumerate(lines, start=max(start_line, 1)))
+        except (KeyError, ValueError) as e:
+            raise ToolError(str(e).strip("'"))
+        except Exception as e:  # e.g. an invalid regular expression
+            raise ToolError(f"Cannot read artifact {artifact_id}: {e}")
+        limit = (
+            self.max_output if max_chars is None else min(max_chars, self.max_output)
+        )
+        return ToolResult(output=_format(numbered, offset, limit))
+
+
+def _format(numbered: List[Tuple[int, str]], offset: int, limit: int) -> str:
+    """Number lines, showing each from `offset`, in about `limit` characters"""
+    offset = max(offset, 0)
+    budget = max(limit, 1)
+    # Every line gets a share, so one long line does not hide the others
+    per_line = max(budget // len(numbered), 200)
+    output: List[str] = []
+    for number, line in numbered:
+        prefix = f"{number:6}\t"
+        room = min(per_line, budget - len(prefix))
+        if room <= 0 and output:
+            output.append(f"[... {len(numbered) - len(output)} more lines omitted ...]")
+            break
+        part = line[offset : offset + max(room, 1)]
+        end = offset + len(part)
+        if end < len(line):
+            part += (
+                f" [... {len(line) - end} more characters, read line {number} "
+                f"with offset={end} ...]"
+            )
+        output.append(prefix + part)
+        budget -= len(output[-1]) + 1
+    return "\n".join(output)
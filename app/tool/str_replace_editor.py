@@ -4,6 +4,8 @@ from collections import defaultdict
 from pathlib import Path
 from typing import Any, DefaultDict, List, Literal, Optional, get_args
 
+from pydantic import PrivateAttr
+
 from app.config import config
 from app.exceptions import ToolError
 from app.tool import BaseTool
@@ -98,9 +100,18 @@ class StrReplaceEditor(BaseTool):
         },
         "required": ["command", "path"],
     }
-    _file_history: DefaultDict[PathLike, List[str]] = defaultdict(list)
-    _local_operator: LocalFileOperator = LocalFileOperator()
-    _sandbox_operator: SandboxFileOperator = SandboxFileOperator()
+    # Edit history is kept per editor, so agents never undo each other's edits
+    _file_history: DefaultDict[PathLike, List[str]] = PrivateAttr(
+        default_factory=lambda: defaultdict(list)
+    )
+    _local_operator: LocalFileOperator = PrivateAttr(default_factory=LocalFileOperator)
+    _sandbox_operator: SandboxFileOperator = PrivateAttr(
+        default_factory=SandboxFileOperator
+    )
+
+    def is_concurrency_safe(self, command: str = "", **kwargs) -> bool:
+        """Views are read-only and can run alongside other calls"""
+        return command == "view"
 
     # def _get_operator(self, use_sandbox: bool) -> FileOperator:
     def _get_operator(self) -> FileOperator:
@@ -1,7 +1,8 @@
 """Collection classes for managing multiple tools."""
 from typing import Any, Dict, List
 
-from app.exceptions import ToolError
+from app.deadline import run_with_deadline, tool_timeout
+from app.exceptions import DeadlineExceeded, ToolError
 from app.logger import logger
 from app.tool.base import BaseTool, ToolFailure, ToolResult
 
@@ -29,10 +30,16 @@ class ToolCollection:
         if not tool:
             return ToolFailure(error=f"Tool {name} is invalid")
         try:
-            result = await tool(**tool_input)
+            # The tool is cancelled when it overruns its own or the step's deadline
+            result = await run_with_deadline(
+                tool(**tool_input), tool_timeout(name), f"Tool '{name}'"
+            )
             return result
         except ToolError as e:
             return ToolFailure(error=e.message)
+        except DeadlineExceeded as e:
+            logger.warning(str(e))
+            return ToolFailure(error=str(e))
 
     async def execute_all(self) -> List[ToolResult]:
         """Execute all tools in the collection sequentially."""
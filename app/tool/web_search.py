@@ -17,6 +17,7 @@ from app.tool.search import (
     WebSearchEngine,
 )
 from app.tool.search.base import SearchItem
+from app.tracing import span
 
 
 class SearchResult(BaseModel):
@@ -124,9 +125,11 @@ class WebContentFetcher:
 
         try:
             # Use asyncio to run requests in a thread pool
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: requests.get(url, headers=headers, timeout=timeout)
-            )
+            with span("network.fetch") as fetch_span:
+                response = await asyncio.get_event_loop().run_in_executor(
+                    None, lambda: requests.get(url, headers=headers, timeout=timeout)
+                )
+                fetch_span.set(status=response.status_code, bytes=len(response.content))
 
             if response.status_code != 200:
                 logger.warning(
@@ -190,6 +193,8 @@ class WebSearch(BaseTool):
         },
         "required": ["query"],
     }
+    concurrency_safe: bool = True
+    max_concurrency: Optional[int] = 3
     _search_engine: dict[str, WebSearchEngine] = {
         "google": GoogleSearchEngine(),
         "baidu": BaiduSearchEngine(),
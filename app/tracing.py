@@ -0,0 +1,224 @@
+"""Lightweight tracing of agent runs.
+
+Code wraps a phase in `span(name, **attributes)`. Spans nest through a
+context variable: a run contains its steps, a step its think and act
+phases, and those the LLM requests and tool calls they make, down to
+sandbox and browser operations. Finished spans are handed to the exporters
+of the active tracer, e.g. an `InMemoryCollector` or a `FileExporter`.
+Without a tracer `span` returns a shared no-op span, so disabled tracing
+costs one global lookup per phase.
+"""
+import json
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import PROJECT_ROOT, config
+from app.logger import logger
+
+
+class Span:
+    """A timed phase with attributes such as tokens, bytes or tool name"""
+
+    __slots__ = (
+        "name",
+        "span_id",
+        "trace_id",
+        "parent_id",
+        "attributes",
+        "start",
+        "end",
+        "error",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = attributes
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes, e.g. results only known at the end of the phase"""
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "trace_id": self.trace_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Span returned while tracing is disabled"""
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+    def set(self, **attributes: Any) -> None:
+        return None
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter(ABC):
+    """Receives every span when it finishes"""
+
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        """Handle a finished span"""
+
+    def shutdown(self) -> None:
+        """Flush and release resources"""
+
+
+class InMemoryCollector(SpanExporter):
+    """Keeps finished spans in memory, e.g. for tests or a live view"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def find(self, name: str) -> List[Span]:
+        return [span for span in self.spans if span.name == name]
+
+    def children(self, parent: Span) -> List[Span]:
+        return [span for span in self.spans if span.parent_id == parent.span_id]
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class FileExporter(SpanExporter):
+    """Appends each finished span as one JSON line to a file"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+class _ActiveSpan:
+    """Context manager that makes a span current while it runs"""
+
+    __slots__ = ("tracer", "span", "token")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+        self.token = None
+
+    def __enter__(self) -> Span:
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self.token)
+        self.span.end = time.time()
+        if exc_type is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        self.tracer.finish(self.span)
+
+
+class Tracer:
+    """Creates spans and hands finished ones to its exporters"""
+
+    def __init__(self, *exporters: SpanExporter):
+        self.exporters = list(exporters)
+
+    def span(self, name: str, **attributes: Any) -> _ActiveSpan:
+        return _ActiveSpan(self, Span(name, _current_span.get(), attributes))
+
+    def finish(self, span: Span) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning(f"Failed to export span {span.name}: {e}")
+
+    def shutdown(self) -> None:
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+_tracer: Optional[Tracer] = None
+_configured = False
+
+
+def _configure() -> Optional[Tracer]:
+    global _tracer, _configured
+    _configured = True
+    settings = config.tracing
+    if not settings or not settings.enabled:
+        return None
+    exporters: List[SpanExporter] = []
+    if settings.export_path:
+        path = Path(settings.export_path)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        exporters.append(FileExporter(path))
+    _tracer = Tracer(*exporters)
+    return _tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Return the active tracer, configured from `[tracing]` on first use"""
+    return _tracer if _configured else _configure()
+
+
+def set_tracer(tracer: Optional[Tracer]) -> Optional[Tracer]:
+    """Install a tracer (None disables tracing) and return the previous one"""
+    global _tracer, _configured
+    previous = get_tracer()
+    _tracer, _configured = tracer, True
+    return previous
+
+
+def span(name: str, **attributes: Any):
+    """Trace a phase: `with span("act", tools=2) as s: ...; s.set(bytes=n)`"""
+    tracer = _tracer if _configured else _configure()
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.span(name, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    """Return the innermost span the caller runs in"""
+    return _current_span.get()
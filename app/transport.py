@@ -0,0 +1,154 @@
+"""Process-wide HTTP connection pool shared by all LLM clients.
+
+Every LLM client sends its requests through one `PooledTransport`, which keeps
+a separate keep-alive connection pool per event loop. Connections and TLS
+sessions are reused across agents and config profiles instead of being set up
+again by each client.
+"""
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional
+
+import httpx
+
+from app.config import HTTPPoolSettings, config
+from app.logger import logger
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """An httpx transport that dispatches to one connection pool per event loop"""
+
+    def __init__(self, settings: HTTPPoolSettings):
+        self.settings = settings
+        self.http2 = settings.http2
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning(
+                    "HTTP/2 requested but 'h2' is not installed, using HTTP/1.1"
+                )
+                self.http2 = False
+
+        self._lock = threading.Lock()
+        self._pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._in_flight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, int]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.total_requests = 0
+
+    def _pool(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            with self._lock:
+                self._drop_closed_loops()
+                pool = self._pools.get(loop)
+                if pool is None:
+                    pool = httpx.AsyncHTTPTransport(
+                        http2=self.http2,
+                        limits=httpx.Limits(
+                            max_connections=self.settings.max_connections,
+                            max_keepalive_connections=self.settings.max_keepalive_connections,
+                            keepalive_expiry=self.settings.keepalive_expiry,
+                        ),
+                    )
+                    self._pools[loop] = pool
+                    self._in_flight[loop] = 0
+        return pool
+
+    def _drop_closed_loops(self) -> None:
+        # Pooled connections reference their loop, so entries of finished
+        # loops would never be released by the weak mapping on their own
+        for loop in [loop for loop in self._pools if loop.is_closed()]:
+            del self._pools[loop]
+            self._in_flight.pop(loop, None)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        pool = self._pool()
+        loop = asyncio.get_running_loop()
+        self.total_requests += 1
+        self._in_flight[loop] += 1
+        try:
+            return await pool.handle_async_request(request)
+        finally:
+            if loop in self._in_flight:
+                self._in_flight[loop] -= 1
+
+    async def aclose(self) -> None:
+        """Close the connection pool of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            pool = self._pools.pop(loop, None)
+            self._in_flight.pop(loop, None)
+        if pool is not None:
+            await pool.aclose()
+
+    def stats(self) -> Dict[str, int]:
+        """Return pool occupancy for the running event loop (or all loops)"""
+        try:
+            loops = [asyncio.get_running_loop()]
+        except RuntimeError:
+            loops = list(self._pools.keys())
+
+        connections = idle = http2 = 0
+        for loop in loops:
+            pool = self._pools.get(loop)
+            if pool is None:
+                continue
+            for connection in pool._pool.connections:
+                connections += 1
+                if connection.is_idle():
+                    idle += 1
+                if connection.info().startswith("HTTP/2"):
+                    http2 += 1
+
+        return {
+            "pools": len(self._pools),
+            "connections": connections,
+            "active_connections": connections - idle,
+            "idle_connections": idle,
+            "http2_connections": http2,
+            "max_connections": self.settings.max_connections,
+            "in_flight_requests": sum(self._in_flight.get(loop, 0) for loop in loops),
+            "total_requests": self.total_requests,
+        }
+
+
+_transport: Optional[PooledTransport] = None
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_transport() -> PooledTransport:
+    """Return the process-wide pooled transport"""
+    global _transport
+    if _transport is None:
+        _transport = PooledTransport(config.http_pool or HTTPPoolSettings())
+    return _transport
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the httpx client shared by all LLM clients"""
+    global _http_client
+    if _http_client is None:
+        transport = get_transport()
+        settings = transport.settings
+        _http_client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(
+                connect=settings.connect_timeout,
+                read=settings.read_timeout,
+                write=settings.write_timeout,
+                pool=settings.pool_timeout,
+            ),
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+def get_pool_stats() -> Dict[str, int]:
+    """Return occupancy metrics of the shared LLM connection pool"""
+    return get_transport().stats()
@@ -0,0 +1,83 @@
+"""Micro-benchmark for token accounting across agent steps.
+
+Simulates a tool-calling agent whose history grows by one assistant and one
+tool message per step, and measures the time spent in
+``TokenCounter.count_message_tokens`` for each step. With memoized counting
+the per-step cost stays roughly flat instead of growing with the history.
+
+Usage:
+    python -m examples.benchmarks.token_counting --steps 40
+"""
+
+import argparse
+import time
+
+import tiktoken
+
+from app.llm import TokenCounter
+
+
+OBSERVATION = "Observed output of cmd `python_execute` executed:\n" + (
+    "row,value,label\n" * 400
+)
+
+
+def build_step(step: int) -> list:
+    return [
+        {
+            "role": "assistant",
+            "content": f"Step {step}: inspecting the data before the next action.",
+            "tool_calls": [
+                {
+                    "id": f"call_{step}",
+                    "type": "function",
+                    "function": {
+                        "name": "python_execute",
+                        "arguments": '{"code": "print(df.describe())"}',
+                    },
+                }
+            ],
+        },
+        {
+            "role": "tool",
+            "content": f"{OBSERVATION}step={step}",
+            "name": "python_execute",
+            "tool_call_id": f"call_{step}",
+        },
+    ]
+
+
+def run(steps: int, memoized: bool) -> list:
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+    counter = TokenCounter(tokenizer)
+    history = [{"role": "system", "content": "You are a helpful agent."}]
+    timings = []
+    for step in range(steps):
+        history.extend(build_step(step))
+        if not memoized:
+            # Emulate the previous behaviour: nothing is reused between steps
+            counter = TokenCounter(tokenizer)
+        start = time.perf_counter()
+        counter.count_message_tokens(history)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=40)
+    args = parser.parse_args()
+
+    baseline = run(args.steps, memoized=False)
+    memoized = run(args.steps, memoized=True)
+
+    print(f"{'step':>6} {'full recount (ms)':>18} {'memoized (ms)':>14}")
+    for step in range(0, args.steps, max(1, args.steps // 10)):
+        print(
+            f"{step + 1:>6} {baseline[step] * 1000:>18.3f} {memoized[step] * 1000:>14.3f}"
+        )
+    print(f"{'total':>6} {sum(baseline) * 1000:>18.3f} {sum(memoized) * 1000:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
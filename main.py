@@ -11,11 +11,23 @@ async def main():
     parser.add_argument(
         "--prompt", type=str, required=False, help="Input prompt for the agent"
     )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        required=False,
+        help="Run ID of a checkpointed run to continue",
+    )
     args = parser.parse_args()
 
     # Create and initialize Manus agent
     agent = await Manus.create()
     try:
+        if args.resume:
+            logger.warning(f"Resuming run {args.resume}...")
+            await agent.resume(args.resume)
+            logger.info("Request processing completed.")
+            return
+
         # Use command line prompt if provided, otherwise ask for input
         prompt = args.prompt if args.prompt else input("Enter your prompt: ")
         if not prompt.strip():
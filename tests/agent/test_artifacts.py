@@ -0,0 +1,99 @@
+"""Tests for spilling large tool outputs to the artifact store."""
+
+import pytest
+
+from app.agent.toolcall import ToolCallAgent
+from app.artifacts import ArtifactStore
+from app.config import ArtifactSettings
+from app.exceptions import ToolError
+from app.schema import ToolCall
+from app.tool import ToolCollection
+from app.tool.base import BaseTool, ToolResult
+from app.tool.read_artifact import RESERVED_CHARS, ReadArtifact
+
+
+class LongOutput(BaseTool):
+    name: str = "long_output"
+    description: str = "Print many lines"
+
+    async def execute(self) -> ToolResult:
+        return ToolResult(output="\n".join(f"line {i}" for i in range(1, 1001)))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(
+        ArtifactSettings(enabled=True, dir=str(tmp_path), head_chars=100, tail_chars=50)
+    )
+
+
+def test_identical_outputs_are_stored_once(store, tmp_path):
+    first = store.put("same text")
+    assert store.put("same text") == first
+    assert store.get(first) == "same text"
+    assert len(list(tmp_path.rglob("*.txt"))) == 1
+
+
+@pytest.mark.asyncio
+async def test_long_observation_keeps_head_tail_and_id(store):
+    agent = ToolCallAgent(
+        available_tools=ToolCollection(LongOutput()),
+        max_observe=500,
+        artifact_store=store,
+    )
+    agent.tool_calls = [
+        ToolCall(id="call_0", function={"name": "long_output", "arguments": "{}"})
+    ]
+    await agent.act()
+
+    observation = agent.messages[-1].content
+    assert "line 1\n" in observation
+    assert "line 1000" in observation
+    artifact_id = observation.split("artifact ")[1].split(";")[0]
+
+    # The first stored line is the "Observed output of cmd" header
+    reader = agent.available_tools.get_tool("read_artifact")
+    result = await reader.execute(artifact_id=artifact_id, start_line=500, end_line=501)
+    assert result.output == "   500\tline 499\n   501\tline 500"
+
+    result = await reader.execute(artifact_id=artifact_id, pattern=r"^line 77$")
+    assert result.output == "    78\tline 77"
+
+
+def test_agent_without_store_truncates(store):
+    agent = ToolCallAgent(max_observe=10, artifact_store=None)
+    assert agent.available_tools.get_tool("read_artifact") is None
+    assert agent._observe("x" * 20) == "x" * 10
+
+
+@pytest.mark.asyncio
+async def test_unknown_artifact_is_a_tool_error(store):
+    with pytest.raises(ToolError, match="Unknown artifact"):
+        await ReadArtifact(store=store).execute(artifact_id="0" * 16)
+    with pytest.raises(ToolError, match="Invalid artifact id"):
+        await ReadArtifact(store=store).execute(artifact_id="../../etc/passwd")
+
+
+@pytest.mark.asyncio
+async def test_long_lines_are_cut_and_continued_with_offset(store):
+    text = "a" * 30_000 + "b" * 30_000
+    artifact_id = store.put(text)
+    reader = ReadArtifact(store=store)
+
+    result = await reader.execute(artifact_id=artifact_id)
+    assert len(result.output) < 20_100
+    assert result.output.endswith(
+        "[... 40007 more characters, read line 1 with offset=19993 ...]"
+    )
+
+    result = await reader.execute(artifact_id=artifact_id, offset=29_990, max_chars=27)
+    assert result.output == (
+        "     1\t" + "a" * 10 + "b" * 10 + " [... 29990 more characters, read line 1 "
+        "with offset=30010 ...]"
+    )
+
+
+def test_artifact_reads_fit_in_the_observation(store):
+    agent = ToolCallAgent(max_observe=5000, artifact_store=store)
+    reader = agent.available_tools.get_tool("read_artifact")
+    assert reader.max_output == 5000 - RESERVED_CHARS
@@ -0,0 +1,42 @@
+"""Tests for the event-driven I/O of bash sessions."""
+
+import time
+
+import pytest
+
+from app.tool import Bash
+
+
+@pytest.mark.asyncio
+async def test_fast_commands_return_without_polling_delay():
+    bash = Bash()
+    await bash.execute(command="true")
+
+    start = time.monotonic()
+    result = await bash.execute(command="echo hello")
+    assert result.output == "hello"
+    assert time.monotonic() - start < 0.1
+
+
+@pytest.mark.asyncio
+async def test_stderr_is_interleaved_and_exit_code_reported():
+    bash = Bash()
+    result = await bash.execute(command="echo one; echo two >&2; echo three; false")
+    assert result.output == "one\ntwo\nthree\n[exit code 1]"
+    assert result.error is None
+
+    result = await bash.execute(command="echo '<<exit>>'; sleep 0 &")
+    assert result.output == "<<exit>>"
+
+
+@pytest.mark.asyncio
+async def test_large_output_keeps_head_and_tail_and_streams():
+    chunks = []
+    bash = Bash(max_output=40, on_output=chunks.append)
+    result = await bash.execute(command="seq 1 10000")
+
+    assert result.output.startswith("1\n2\n3\n")
+    assert "bytes of output omitted" in result.output
+    assert result.output.endswith("9999\n10000")
+    streamed = "".join(chunks)
+    assert streamed.startswith("1\n2\n") and "5000\n" in streamed
@@ -0,0 +1,140 @@
+"""Tests for checkpointing runs and resuming them after a crash."""
+
+import pytest
+
+from app.agent.base import BaseAgent
+from app.agent.toolcall import ToolCallAgent
+from app.checkpoint import CheckpointStore, MemoryTracker
+from app.flow.planning import PlanningFlow
+from app.ledger import track_run
+from app.schema import AgentState, Message, ToolCall
+from app.tool import Terminate, ToolCollection
+from app.tool.base import BaseTool, ToolResult
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CheckpointStore(tmp_path / "checkpoints.db")
+    yield store
+    store.close()
+
+
+def test_tracker_stores_only_changes():
+    messages = [Message.user_message(f"m{index}") for index in range(4)]
+    tracker = MemoryTracker()
+
+    assert tracker.delta(messages[:2]) == (0, [(0, messages[0]), (1, messages[1])])
+    assert tracker.delta(messages[:3]) == (0, [(2, messages[2])])
+    # Trimmed from the front: only the start moves
+    assert tracker.delta(messages[1:4]) == (1, [(3, messages[3])])
+    # Rewritten (e.g. compacted): stored again after the previous rows
+    summary = Message.user_message("summary")
+    assert tracker.delta([summary, messages[3]]) == (
+        4,
+        [(4, summary), (5, messages[3])],
+    )
+
+
+class EchoTool(BaseTool):
+    name: str = "echo"
+    description: str = "Echo"
+
+    async def execute(self, text: str) -> ToolResult:
+        return ToolResult(output=text)
+
+
+def make_agent(store, monkeypatch, script) -> ToolCallAgent:
+    agent = ToolCallAgent(
+        available_tools=ToolCollection(EchoTool(), Terminate()),
+        checkpoints=store,
+        next_step_prompt="",
+    )
+
+    async def ask_tool(messages, **kwargs):
+        name, arguments = script.pop(0)
+        if name == "crash":
+            raise RuntimeError("process died")
+        call = ToolCall(
+            id=f"call_{len(script)}",
+            function={"name": name, "arguments": arguments},
+        )
+        return Message.from_tool_calls([call])
+
+    monkeypatch.setattr(agent.llm, "ask_tool", ask_tool)
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_agent_resumes_after_crash(store, monkeypatch):
+    script = [
+        ("echo", '{"text": "one"}'),
+        ("echo", '{"text": "two"}'),
+        ("crash", ""),
+        ("terminate", '{"status": "success"}'),
+    ]
+    agent = make_agent(store, monkeypatch, script)
+    with pytest.raises(RuntimeError):
+        await agent.run("task")
+    run_id = agent.ledger.run_id
+
+    resumed = make_agent(store, monkeypatch, script)
+    result = await resumed.resume(run_id)
+
+    assert "Step 3" in result
+    contents = [message.content for message in resumed.messages]
+    assert contents[0] == "task"
+    assert any(content and content.endswith("two") for content in contents)
+    assert resumed.state == AgentState.IDLE
+    with pytest.raises(ValueError, match="already finished"):
+        await make_agent(store, monkeypatch, []).resume(run_id)
+
+    # Every message was written once, not once per checkpoint
+    rows = store._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    assert rows == len(resumed.messages)
+
+
+@pytest.mark.asyncio
+async def test_resume_without_checkpoint(store, monkeypatch):
+    with pytest.raises(ValueError, match="No checkpoint"):
+        await make_agent(store, monkeypatch, []).resume("missing")
+
+
+class StepAgent(BaseAgent):
+    name: str = "worker"
+
+    async def step(self) -> str:
+        self.memory.add_message(Message.assistant_message("done"))
+        self.state = AgentState.FINISHED
+        return "done"
+
+
+@pytest.mark.asyncio
+async def test_planning_flow_resumes_at_unfinished_step(store, monkeypatch):
+    flow = PlanningFlow(StepAgent(checkpoints=store), checkpoints=store)
+    with track_run("planning_flow", "run1"):
+        await flow.planning_tool.execute(
+            command="create",
+            plan_id=flow.active_plan_id,
+            title="Plan",
+            steps=["first", "second"],
+        )
+        await flow.planning_tool.execute(
+            command="mark_step",
+            plan_id=flow.active_plan_id,
+            step_index=0,
+            step_status="completed",
+        )
+        flow.save_checkpoint()
+
+    resumed = PlanningFlow(StepAgent(checkpoints=store), checkpoints=store)
+    monkeypatch.setattr(resumed.llm, "ask", lambda **kwargs: _summary())
+    result = await resumed.resume("run1")
+
+    plan = resumed.planning_tool.plans[flow.active_plan_id]
+    assert plan["step_statuses"] == ["completed", "completed"]
+    # Only the unfinished step runs again before the plan is finalized
+    assert result == "Step 1: done\nPlan completed:\n\nsummary"
+
+
+async def _summary() -> str:
+    return "summary"
@@ -0,0 +1,134 @@
+"""Tests for compacting agent memory close to the context limit."""
+
+import pytest
+
+from app.agent.toolcall import ToolCallAgent
+from app.compaction import ContextCompactor, group_messages
+from app.config import CompactionSettings
+from app.exceptions import TokenLimitExceeded
+from app.llm import LLM
+from app.schema import Memory, Message, Role, ToolCall
+
+
+def tool_turn(index: int, size: int = 400) -> list:
+    call = ToolCall(
+        id=f"call_{index}",
+        function={"name": "bash", "arguments": f'{{"command": "step {index}"}}'},
+    )
+    return [
+        Message.from_tool_calls([call], content=f"Running step {index}"),
+        Message.tool_message("output " * size, name="bash", tool_call_id=call.id),
+    ]
+
+
+@pytest.fixture
+def compactor(monkeypatch):
+    compactor = ContextCompactor(
+        CompactionSettings(enabled=True, context_window=4000, max_summary_tokens=100)
+    )
+
+    async def summarize(messages):
+        return f"{len(messages)} messages"
+
+    monkeypatch.setattr(compactor, "summarize", summarize)
+    return compactor
+
+
+def test_tool_calls_grouped_with_results():
+    messages = [Message.user_message("task")] + tool_turn(1) + tool_turn(2)
+    groups = group_messages(messages)
+    assert [len(group) for group in groups] == [1, 2, 2]
+
+
+@pytest.mark.asyncio
+async def test_below_threshold_is_untouched(compactor):
+    memory = Memory(messages=[Message.user_message("task")] + tool_turn(1))
+    assert await compactor.compact(memory, LLM()) is None
+    assert len(memory.messages) == 3
+
+
+@pytest.mark.asyncio
+async def test_compaction_keeps_task_pairs_and_recent_turns(compactor, tmp_path):
+    messages = [Message.user_message("task")]
+    for index in range(10):
+        messages += tool_turn(index)
+    memory = Memory(messages=list(messages), spill_path=str(tmp_path / "memory.jsonl"))
+
+    record = await compactor.compact(memory, LLM())
+
+    assert record is not None
+    assert record.tokens_after <= compactor.settings.target_ratio * 4000
+    assert memory.messages[0].content == "task"
+    assert memory.messages[1].content.endswith(f"{record.message_count} messages")
+    assert memory.messages[-1] is messages[-1]
+    assert memory.compactions == [record]
+    assert record.tool_calls == ["bash"] * (record.message_count // 2)
+    # The removed messages are spilled to disk instead of kept in the record
+    start = record.spill_start
+    dropped = memory.load_spilled(start, start + record.message_count)
+    assert dropped == messages[1 : 1 + record.message_count]
+
+    # Every remaining tool result still follows its tool call
+    pending = set()
+    for message in memory.messages[2:]:
+        if message.role == Role.ASSISTANT:
+            pending = {call.id for call in message.tool_calls}
+        else:
+            assert message.tool_call_id in pending
+
+
+@pytest.mark.asyncio
+async def test_run_budget_is_not_a_context_window(monkeypatch):
+    compactor = ContextCompactor(CompactionSettings(enabled=True))
+    llm = LLM()
+    monkeypatch.setattr(llm, "max_input_tokens", 1000)
+    messages = [Message.user_message("task")]
+    for index in range(10):
+        messages += tool_turn(index)
+    memory = Memory(messages=list(messages))
+
+    assert await compactor.compact(memory, llm) is None
+    assert not compactor.can_relieve(llm)
+    assert memory.messages == messages
+
+
+@pytest.mark.asyncio
+async def test_exhausted_summarizer_falls_back_to_digest(monkeypatch):
+    compactor = ContextCompactor(CompactionSettings(enabled=True, context_window=4000))
+    llm = LLM()
+    monkeypatch.setattr(llm, "max_input_tokens", 1000)
+    monkeypatch.setattr(llm, "total_input_tokens", 1000)
+
+    async def ask(*args, **kwargs):
+        raise AssertionError("The exhausted LLM must not be asked")
+
+    monkeypatch.setattr(llm, "ask", ask)
+    summary = await compactor.summarize(tool_turn(1))
+    assert summary == compactor.digest(tool_turn(1))
+
+
+@pytest.mark.asyncio
+async def test_token_limit_is_retried_only_if_compaction_fits(compactor, monkeypatch):
+    agent = ToolCallAgent(compactor=compactor)
+    agent.memory.messages = [Message.user_message("task")]
+    for index in range(6):
+        agent.memory.messages += tool_turn(index)
+    monkeypatch.setattr(agent.llm, "max_input_tokens", 10_000)
+    attempts = []
+
+    async def ask_step():
+        attempts.append(len(agent.memory.messages))
+        if len(attempts) == 1:
+            raise TokenLimitExceeded("too large")
+        return "response"
+
+    monkeypatch.setattr(agent, "_ask_step", ask_step)
+    assert await agent._ask_with_compaction() == "response"
+    assert attempts[1] < attempts[0]
+
+    # Little budget left: even a compacted prompt would not fit
+    attempts.clear()
+    monkeypatch.setattr(agent.llm, "total_input_tokens", 9_000)
+    with pytest.raises(TokenLimitExceeded):
+        await agent._ask_with_compaction()
+    assert len(attempts) == 1
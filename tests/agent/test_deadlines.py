@@ -0,0 +1,115 @@
+"""Tests for step and tool call deadlines and cancellation cleanup."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+import app.deadline
+from app.agent.toolcall import STEP_DEADLINE_EXCEEDED, ToolCallAgent
+from app.config import DeadlineSettings
+from app.deadline import deadline_scope, remaining, run_with_deadline
+from app.exceptions import DeadlineExceeded
+from app.schema import ToolCall
+from app.tool import Bash, ToolCollection
+from app.tool.base import BaseTool, ToolResult
+from app.tool.browser_use_tool import _timeout_ms
+
+
+class SlowTool(BaseTool):
+    name: str = "slow"
+    description: str = "Sleep"
+    cancelled: int = 0
+
+    async def execute(self, delay: float) -> ToolResult:
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return ToolResult(output="done")
+
+
+def call(index: int, delay: float) -> ToolCall:
+    return ToolCall(
+        id=f"call_{index}",
+        function={"name": "slow", "arguments": json.dumps({"delay": delay})},
+    )
+
+
+def test_nested_scopes_only_shorten_the_deadline():
+    assert remaining() is None
+    with deadline_scope(10):
+        with deadline_scope(100):
+            assert remaining() <= 10
+        with deadline_scope(1):
+            assert remaining(5) <= 1
+        assert remaining(0.5) == 0.5
+
+
+def test_expired_deadline_is_not_a_zero_page_timeout():
+    assert _timeout_ms() is None
+    with deadline_scope(10):
+        assert 0 < _timeout_ms() <= 10_000
+    with deadline_scope(0):
+        with pytest.raises(DeadlineExceeded):
+            _timeout_ms()
+
+
+@pytest.mark.asyncio
+async def test_step_deadline_cancels_tool_and_skips_the_rest():
+    tool = SlowTool()
+    agent = ToolCallAgent(available_tools=ToolCollection(tool))
+    agent.tool_calls = [call(0, 5), call(1, 0)]
+
+    start = time.monotonic()
+    with deadline_scope(0.2):
+        await agent.act()
+
+    assert time.monotonic() - start < 1
+    assert tool.cancelled == 1
+    first, second = agent.messages
+    assert "exceeded its deadline" in first.content
+    assert second.content == STEP_DEADLINE_EXCEEDED
+    assert second.tool_call_id == "call_1"
+
+
+@pytest.mark.asyncio
+async def test_configured_tool_timeout(monkeypatch):
+    monkeypatch.setattr(
+        app.deadline,
+        "_settings",
+        lambda: DeadlineSettings(tool_timeout=10, tool_timeouts={"slow": 0.1}),
+    )
+    tool = SlowTool()
+    result = await ToolCollection(tool).execute(name="slow", tool_input={"delay": 5})
+
+    assert result.error == "Tool 'slow' exceeded its deadline"
+    assert tool.cancelled == 1
+
+
+@pytest.mark.asyncio
+async def test_own_timeouts_are_not_reported_as_deadlines():
+    async def times_out():
+        raise asyncio.TimeoutError
+
+    with pytest.raises(asyncio.TimeoutError):
+        await run_with_deadline(times_out(), 5, "op")
+
+
+@pytest.mark.asyncio
+async def test_cancelled_bash_command_is_killed(tmp_path):
+    bash = Bash()
+    marker = tmp_path / "marker"
+    with pytest.raises(DeadlineExceeded):
+        await run_with_deadline(
+            bash.execute(command=f"sleep 1 && touch {marker}"), 0.3, "bash"
+        )
+
+    assert bash._session is None
+    await asyncio.sleep(1.2)
+    assert not marker.exists()
+
+    result = await bash.execute(command="echo again")
+    assert result.output == "again"
@@ -0,0 +1,117 @@
+"""Tests for detecting agents that repeat cycles of steps."""
+
+import json
+
+import pytest
+
+from app.agent.toolcall import ToolCallAgent
+from app.config import LoopDetectionSettings
+from app.loop_detection import NUDGE, STOP, WARN, LoopDetector, normalize_arguments
+from app.schema import AgentState, Message, ToolCall
+from app.tool import ToolCollection
+from app.tool.base import BaseTool, ToolResult
+
+
+def step(name: str, output: str = "same", **args) -> list:
+    call = ToolCall(
+        id=f"call_{name}", function={"name": name, "arguments": json.dumps(args)}
+    )
+    return [
+        Message.from_tool_calls([call]),
+        Message.tool_message(output, name=name, tool_call_id=call.id),
+    ]
+
+
+def feed(detector: LoopDetector, steps: list) -> list:
+    memory, results = [], []
+    for messages in steps:
+        memory += messages
+        results.append(detector.observe(memory))
+    return results
+
+
+@pytest.fixture
+def detector():
+    return LoopDetector(LoopDetectionSettings(max_cycle_length=3, min_repeats=3))
+
+
+def test_repeated_call_escalates(detector):
+    results = feed(detector, [step("search", query="x")] * 5)
+
+    assert results[:2] == [None, None]
+    assert [result.level for result in results[2:]] == [NUDGE, WARN, STOP]
+    assert results[2].cycle_length == 1 and results[2].repeats == 3
+    assert "search" in results[2].steps[0]
+
+
+def test_cycle_of_two_steps(detector):
+    a, b = step("view", path="a"), step("view", path="b")
+    results = feed(detector, [a, b] * 3)
+
+    assert results[:5] == [None] * 5
+    assert results[5].cycle_length == 2 and results[5].repeats == 3
+
+
+def test_changing_observation_is_progress(detector):
+    steps = [
+        step("bash", output=f"line {index}", command="tail log") for index in range(6)
+    ]
+    assert feed(detector, steps) == [None] * 6
+
+
+def test_progress_resets_escalation(detector):
+    repeat = step("search", query="x")
+    results = feed(detector, [repeat] * 3 + [step("search", query="y")] + [repeat] * 3)
+    assert results[2].level == NUDGE
+    assert results[-1].level == NUDGE
+
+
+def test_unchanged_memory_is_not_a_repeat(detector):
+    memory = step("search", query="x")
+    assert [detector.observe(memory) for _ in range(4)] == [None] * 4
+
+    memory += step("search", query="x")
+    assert detector.observe(memory) is None
+    memory += step("search", query="x")
+    assert detector.observe(memory).level == NUDGE
+
+
+def test_arguments_normalized():
+    assert normalize_arguments('{"b": 1, "a": 2}') == normalize_arguments(
+        '{ "a":2,\n "b":1 }'
+    )
+
+
+class EchoTool(BaseTool):
+    name: str = "echo"
+    description: str = "Echo"
+
+    async def execute(self, text: str) -> ToolResult:
+        return ToolResult(output=text)
+
+
+@pytest.mark.asyncio
+async def test_looping_agent_is_warned_then_stopped(monkeypatch):
+    agent = ToolCallAgent(
+        available_tools=ToolCollection(EchoTool()),
+        loop_detector=LoopDetector(LoopDetectionSettings()),
+        max_steps=20,
+    )
+    requests = []
+
+    async def ask_tool(messages, **kwargs):
+        requests.append(messages)
+        call = ToolCall(
+            id=f"call_{len(requests)}",
+            function={"name": "echo", "arguments": '{"text": "hi"}'},
+        )
+        return Message.from_tool_calls([call])
+
+    monkeypatch.setattr(agent.llm, "ask_tool", ask_tool)
+    await agent.run("task")
+
+    assert agent.state == AgentState.IDLE  # Reset after the run finished
+    assert len(requests) == 5
+    assert "You repeated the same 1 step(s) 3 times" in requests[3][-1].content
+    assert "stuck in a loop" in requests[4][-1].content
+    assert agent.messages[-1].content.startswith("Stopped:")
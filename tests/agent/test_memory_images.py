@@ -0,0 +1,68 @@
+"""Tests for keeping only the latest images inline in agent memory."""
+
+from app.checkpoint import MemoryTracker
+from app.schema import Memory, Message
+
+
+def screenshot(step: int) -> Message:
+    return Message.user_message(
+        "Current browser screenshot:",
+        base64_image=f"image-{step}",
+        image_caption=f"browser screenshot at step {step}",
+    )
+
+
+def test_older_images_become_placeholders():
+    memory = Memory(max_images=2)
+    for step in range(1, 5):
+        memory.add_message(screenshot(step))
+
+    assert [message.base64_image for message in memory.messages] == [
+        None,
+        None,
+        "image-3",
+        "image-4",
+    ]
+    assert memory.messages[0].content == (
+        "Current browser screenshot:\n"
+        "[Image removed to save context: browser screenshot at step 1]"
+    )
+
+
+def test_unlimited_images():
+    memory = Memory(max_images=None)
+    memory.add_messages([screenshot(step) for step in range(5)])
+    assert all(message.base64_image for message in memory.messages)
+
+
+def test_images_are_dropped_in_batches_without_mutating_messages():
+    memory = Memory(max_images=5, trim_ratio=0.6)
+    added = [screenshot(step) for step in range(1, 7)]
+    for message in added[:5]:
+        memory.add_message(message)
+    assert memory.messages == added[:5]
+
+    memory.add_message(added[5])
+    assert [bool(message.base64_image) for message in memory.messages] == [
+        False,
+        False,
+        False,
+        True,
+        True,
+        True,
+    ]
+    # Dropped images are new messages, the originals are untouched
+    assert all(message.base64_image for message in added)
+    assert memory.messages[3:] == added[3:]
+    assert memory.messages[3] is added[3]
+
+
+def test_checkpoints_store_messages_whose_image_was_dropped():
+    memory = Memory(max_images=1)
+    tracker = MemoryTracker()
+    memory.add_message(screenshot(1))
+    tracker.delta(memory.messages)
+
+    memory.add_message(screenshot(2))
+    _, stored = tracker.delta(memory.messages)
+    assert [message.base64_image for _, message in stored] == [None, "image-2"]
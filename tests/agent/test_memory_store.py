@@ -0,0 +1,105 @@
+"""Tests for trimming agent memory and spilling evicted messages to disk."""
+
+import threading
+
+import app.schema
+from app.schema import Memory, Message, ToolCall, estimate_tokens
+
+
+def tool_turn(index: int, results: int = 1) -> list:
+    calls = [
+        ToolCall(
+            id=f"call_{index}_{n}",
+            function={"name": "bash", "arguments": f'{{"command": "step {index}"}}'},
+        )
+        for n in range(results)
+    ]
+    return [Message.from_tool_calls(calls, content=f"step {index}")] + [
+        Message.tool_message(f"output {index}", name="bash", tool_call_id=call.id)
+        for call in calls
+    ]
+
+
+def test_trims_in_batches_in_place():
+    memory = Memory(max_messages=10, trim_ratio=0.5, spill_path=None)
+    messages = memory.messages
+    for index in range(10):
+        memory.add_message(Message.user_message(f"m{index}"))
+    assert len(memory.messages) == 10
+
+    memory.add_message(Message.user_message("m10"))
+
+    assert memory.messages is messages
+    # The first user message, the task, is pinned
+    assert [message.content for message in memory.messages] == ["m0"] + [
+        f"m{index}" for index in range(6, 11)
+    ]
+
+
+def test_tool_results_stay_with_their_call():
+    memory = Memory(max_messages=6, trim_ratio=0.5, spill_path=None)
+    memory.add_messages([Message.user_message("task")] + tool_turn(1, results=3))
+    memory.add_messages(tool_turn(2))
+
+    assert [message.content for message in memory.messages] == [
+        "task",
+        "step 2",
+        "output 2",
+    ]
+
+
+def test_token_budget():
+    memory = Memory(max_tokens=200, trim_ratio=0.5, spill_path=None)
+    for index in range(20):
+        memory.add_messages(tool_turn(index))
+
+    tokens = sum(estimate_tokens(message) for message in memory.messages)
+    assert tokens <= 200
+    assert memory._tokens == tokens
+    assert memory.messages[-1].content == "output 19"
+
+
+def test_latest_turn_kept_over_budget():
+    memory = Memory(max_tokens=10, spill_path=None)
+    memory.add_messages(tool_turn(1, results=2))
+    assert len(memory.messages) == 3
+
+
+def test_evicted_messages_spill_to_disk(tmp_path):
+    path = tmp_path / "memory.jsonl"
+    memory = Memory(max_messages=4, trim_ratio=0.5, spill_path=str(path))
+    history = [Message.user_message("task")]
+    for index in range(4):
+        history += tool_turn(index)
+    for message in history:
+        memory.add_message(message)
+
+    spilled = memory.load_spilled()
+    assert memory.spilled == len(spilled) > 0
+    assert memory.messages[0] is history[0]
+    assert history[:1] + spilled + memory.messages[1:] == history
+    assert memory.load_spilled(1, 3) == history[2:4]
+
+
+def test_spill_writes_do_not_block_the_caller(tmp_path, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    append_lines = app.schema._append_lines
+
+    def slow_append(path, lines):
+        started.set()
+        release.wait(5)
+        append_lines(path, lines)
+
+    monkeypatch.setattr(app.schema, "_append_lines", slow_append)
+    memory = Memory(
+        max_messages=2, trim_ratio=0.5, spill_path=str(tmp_path / "m.jsonl")
+    )
+    memory.add_messages([Message.user_message("task")] + tool_turn(1) + tool_turn(2))
+
+    assert started.wait(5)
+    assert memory.spilled == 2  # Counted before the write finished
+    release.set()
+    assert [message.content for message in memory.load_spilled()] == [
+        "step 1",
+        "output 1",
+    ]
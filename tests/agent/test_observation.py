@@ -0,0 +1,109 @@
+"""Tests for compressing tool outputs before they enter memory."""
+
+import json
+
+import pytest
+
+from app.agent.toolcall import ToolCallAgent
+from app.artifacts import ArtifactStore
+from app.config import ArtifactSettings, ObservationSettings
+from app.ledger import track_run
+from app.observation import ObservationCompressor
+from app.schema import ToolCall
+from app.tool import ToolCollection
+from app.tool.base import BaseTool, ToolResult
+
+
+@pytest.fixture
+def compressor():
+    return ObservationCompressor(
+        ObservationSettings(enabled=True, max_array_items=5, sample_items=2)
+    )
+
+
+def test_json_is_minified(compressor):
+    text = json.dumps({"status": "ok", "items": [1, 2]}, indent=2)
+    output, saved = compressor.compress("planning", text)
+    assert output == '{"status":"ok","items":[1,2]}'
+    assert saved > 0
+
+
+def test_long_arrays_become_schema_and_samples(compressor):
+    rows = [{"id": i, "name": f"row {i}"} for i in range(100)]
+    output, _ = compressor.compress("planning", json.dumps(rows, indent=2))
+    summary = json.loads(output)
+    assert summary["_summary"] == "array of 100 items, showing the first 2"
+    assert summary["schema"] == {"id": "int", "name": "str"}
+    assert summary["sample"] == rows[:2]
+
+
+def test_repeated_log_lines_are_collapsed(compressor):
+    log = "\n".join(
+        ["Building"] + [f"Downloading part {i}/50" for i in range(1, 51)] + ["Done"]
+    )
+    output, _ = compressor.compress("bash", log)
+    assert output == (
+        "Building\nDownloading part 1/50\n[... 48 similar lines ...]\n"
+        "Downloading part 50/50\nDone"
+    )
+    # Other tools, e.g. file views, keep their lines
+    assert compressor.compress("str_replace_editor", log) == (log, 0)
+
+
+def test_page_text_is_stripped(compressor):
+    page = (
+        "Skip to content\n\n   Menu  \nArticle   title\n\n\n"
+        "Body text.\nMenu\nAccept all cookies\n© 2024 Example Inc."
+    )
+    output, _ = compressor.compress("web_search", page)
+    assert output == "Article title\nBody text."
+
+
+class RowsTool(BaseTool):
+    name: str = "rows"
+    description: str = "Return rows"
+
+    async def execute(self) -> ToolResult:
+        return self.success_response([{"id": i} for i in range(50)])
+
+
+@pytest.mark.asyncio
+async def test_agent_records_tokens_saved(compressor):
+    agent = ToolCallAgent(
+        available_tools=ToolCollection(RowsTool()), compressor=compressor
+    )
+    agent.tool_calls = [
+        ToolCall(id="call_0", function={"name": "rows", "arguments": "{}"})
+    ]
+    with track_run("test") as ledger:
+        await agent.act()
+
+    assert "array of 50 items" in agent.messages[-1].content
+    saved = ledger.summary("call_site")["rows"]["tokens_saved"]
+    assert saved > 0
+    assert compressor.tokens_saved == {"rows": saved}
+
+
+@pytest.mark.asyncio
+async def test_original_output_is_stored_as_artifact(compressor, tmp_path):
+    store = ArtifactStore(ArtifactSettings(enabled=True, dir=str(tmp_path)))
+    agent = ToolCallAgent(
+        available_tools=ToolCollection(RowsTool()),
+        compressor=compressor,
+        artifact_store=store,
+    )
+    agent.tool_calls = [
+        ToolCall(id="call_0", function={"name": "rows", "arguments": "{}"})
+    ]
+    await agent.act()
+
+    observation = agent.messages[-1].content
+    assert "array of 50 items" in observation
+    artifact_id = observation.split("artifact ")[1].split(";")[0]
+    assert json.loads(store.get(artifact_id)) == [{"id": i} for i in range(50)]
+    assert agent.available_tools.get_tool("read_artifact")
+
+
+def test_python_output_is_not_collapsed(compressor):
+    table = "   a     b\n0  1.5  2.25\n1  3.0  4.75\n2  4.5  6.25\n3  6.0  8.75"
+    assert compressor.compress("python_execute", table) == (table, 0)
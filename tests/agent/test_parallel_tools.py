@@ -0,0 +1,103 @@
+"""Tests for running concurrency-safe tool calls of one turn in parallel."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.agent.toolcall import ToolCallAgent
+from app.schema import ToolCall
+from app.tool import ToolCollection
+from app.tool.base import BaseTool, ToolResult
+from app.tool.str_replace_editor import StrReplaceEditor
+
+
+class SleepTool(BaseTool):
+    name: str = "sleep"
+    description: str = "Sleep and report"
+    concurrency_safe: bool = True
+    running: int = 0
+    peak: int = 0
+    log: list = []
+
+    async def execute(self, label: str, delay: float = 0.1) -> ToolResult:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        self.log.append(f"start {label}")
+        await asyncio.sleep(delay)
+        self.running -= 1
+        self.log.append(f"end {label}")
+        return ToolResult(output=label)
+
+
+class WriteTool(SleepTool):
+    name: str = "write"
+    concurrency_safe: bool = False
+
+
+def call(index: int, name: str = "sleep", **args) -> ToolCall:
+    args.setdefault("label", f"{name}{index}")
+    return ToolCall(
+        id=f"call_{index}",
+        function={"name": name, "arguments": json.dumps(args)},
+    )
+
+
+def make_agent(*tools: BaseTool, **fields) -> ToolCallAgent:
+    return ToolCallAgent(available_tools=ToolCollection(*tools), **fields)
+
+
+@pytest.mark.asyncio
+async def test_safe_calls_overlap_and_keep_call_order():
+    agent = make_agent(SleepTool())
+    agent.tool_calls = [
+        call(0, delay=0.3),
+        call(1, delay=0.1),
+        call(2, delay=0.2),
+    ]
+
+    start = time.monotonic()
+    await agent.act()
+
+    assert time.monotonic() - start < 0.5
+    assert [message.tool_call_id for message in agent.messages] == [
+        "call_0",
+        "call_1",
+        "call_2",
+    ]
+    assert agent.messages[0].content.endswith("sleep0")
+
+
+@pytest.mark.asyncio
+async def test_unsafe_call_is_a_barrier():
+    sleep, write = SleepTool(log=[]), WriteTool()
+    write.log = sleep.log
+    agent = make_agent(sleep, write)
+    agent.tool_calls = [call(0), call(1), call(2, "write"), call(3)]
+
+    await agent.act()
+
+    assert sleep.log[4:] == ["start write2", "end write2", "start sleep3", "end sleep3"]
+    assert sleep.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_global_and_per_tool_limits():
+    limited = SleepTool(max_concurrency=2)
+    agent = make_agent(limited)
+    agent.tool_calls = [call(index, delay=0.05) for index in range(6)]
+    await agent.act()
+    assert limited.peak == 2
+
+    unlimited = SleepTool()
+    agent = make_agent(unlimited, max_parallel_tools=3)
+    agent.tool_calls = [call(index, delay=0.05) for index in range(6)]
+    await agent.act()
+    assert unlimited.peak == 3
+
+
+def test_editor_views_are_concurrency_safe():
+    editor = StrReplaceEditor()
+    assert editor.is_concurrency_safe(command="view", path="/tmp")
+    assert not editor.is_concurrency_safe(command="create", path="/tmp/a")
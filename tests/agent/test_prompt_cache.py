@@ -0,0 +1,101 @@
+"""Tests for the prefix-stable prompt layout."""
+
+from app.bedrock import CACHE_POINT, ChatCompletions
+from app.config import PromptCacheSettings
+from app.ledger import annotate, track_llm_call, track_run
+from app.llm import LLM
+from app.prompt_cache import PromptLayout
+from app.schema import Message, ToolCall
+
+
+TOOLS = [{"type": "function", "function": {"name": "bash", "parameters": {}}}]
+SYSTEM = [Message.system_message("You are an agent. " * 50)]
+
+
+def turn(index: int) -> list:
+    call = ToolCall(
+        id=f"call_{index}",
+        function={"name": "bash", "arguments": f'{{"command": "step {index}"}}'},
+    )
+    return [
+        Message.from_tool_calls([call]),
+        Message.tool_message(f"output {index}", name="bash", tool_call_id=call.id),
+    ]
+
+
+def has_breakpoint(message: dict) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and "cache_control" in content[-1]
+
+
+def test_reuse_ratio_tracks_shared_prefix():
+    layout = PromptLayout(PromptCacheSettings(enabled=True, cache_control="never"))
+    llm = LLM()
+    history = [Message.user_message("task")] + turn(1)
+
+    *_, first = layout.build(llm, SYSTEM, history, TOOLS)
+    history += turn(2)
+    *_, grown = layout.build(llm, SYSTEM, history, TOOLS)
+    *_, new_system = layout.build(
+        llm, [Message.system_message("Other")], history, TOOLS
+    )
+
+    assert first == 0.0
+    assert 0.8 < grown < 1.0
+    assert new_system < 0.25  # Only the tool schemas are still shared
+    assert layout.reuse_ratios == [first, grown, new_system]
+
+
+def test_breakpoints_on_system_history_end_and_previous_end():
+    layout = PromptLayout(PromptCacheSettings(enabled=True, cache_control="always"))
+    llm = LLM()
+    history = [Message.user_message("task")] + turn(1)
+    layout.build(llm, SYSTEM, history, TOOLS)
+
+    history += turn(2)
+    tail = [Message.user_message("What next?")]
+    system, messages, _ = layout.build(llm, SYSTEM, history, TOOLS, tail=tail)
+
+    assert has_breakpoint(system[0])
+    marked = [
+        index for index, message in enumerate(messages) if has_breakpoint(message)
+    ]
+    # Both ends of the history; tool-call-only messages and the tail are skipped
+    assert marked == [2, 4]
+    assert history[-1].content == "output 2"  # Memory is not modified
+
+
+def test_no_breakpoints_without_cache_control_support():
+    layout = PromptLayout(PromptCacheSettings(enabled=True, cache_control="never"))
+    system, messages, _ = layout.build(
+        LLM(), SYSTEM, [Message.user_message("task")], TOOLS
+    )
+    assert not any(has_breakpoint(message) for message in system + messages)
+
+
+def test_bedrock_cache_points_follow_marked_blocks():
+    layout = PromptLayout(PromptCacheSettings(enabled=True, cache_control="always"))
+    system, messages, _ = layout.build(
+        LLM(), SYSTEM, [Message.user_message("task")] + turn(1), TOOLS
+    )
+
+    (
+        system_blocks,
+        bedrock_messages,
+    ) = ChatCompletions._convert_openai_messages_to_bedrock_format(system + messages)
+
+    assert system_blocks[-1] == CACHE_POINT
+    # The cache point goes after the toolResult, never inside it
+    results = bedrock_messages[-1]["content"]
+    assert "toolResult" in results[0] and results[-1] == CACHE_POINT
+    assert CACHE_POINT not in results[0]["toolResult"]["content"]
+
+
+def test_prefix_reuse_recorded_in_ledger():
+    with track_run("agent") as ledger:
+        with annotate(prefix_reuse=0.75):
+            with track_llm_call("model"):
+                pass
+        with track_llm_call("model"):
+            pass
+    assert [entry.prefix_reuse for entry in ledger.entries] == [0.75, None]
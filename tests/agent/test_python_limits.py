@@ -0,0 +1,108 @@
+"""Tests for resource limits and usage reports of PythonExecute."""
+
+import subprocess
+import sys
+
+import pytest
+import pytest_asyncio
+
+import app.tool.python_execute
+import app.tool.python_worker
+from app.config import Config, InterpreterSettings
+from app.tool.python_execute import PythonExecute
+from app.tool.python_pool import InterpreterPool
+from app.tool.python_worker import BoundedOutput
+
+
+SETTINGS = InterpreterSettings(
+    enabled=True,
+    pool_size=0,
+    max_output_chars=100,
+    memory_limit_mb=1024,
+    cpu_time_limit=1,
+    file_size_limit_mb=1,
+)
+
+
+@pytest_asyncio.fixture
+async def pool(monkeypatch):
+    pool = InterpreterPool(SETTINGS)
+    monkeypatch.setattr(app.tool.python_execute, "get_pool", lambda: pool)
+    yield pool
+    await pool.close()
+
+
+def test_output_keeps_head_and_tail():
+    output = BoundedOutput(20)
+    for i in range(100):
+        output.write(f"{i:02}|")
+    assert output.getvalue() == (
+        "00|01|02|0\n[... 280 characters of output omitted ...]\n|97|98|99|"
+    )
+
+
+def test_cpu_time_is_unlimited_up_to_a_finite_hard_limit():
+    # Lowering the hard limit cannot be undone, so it happens in a child process
+    script = (
+        "import importlib.util, resource\n"
+        "spec = importlib.util.spec_from_file_location(\n"
+        f"    'python_worker', {app.tool.python_worker.__file__!r}\n"
+        ")\n"
+        "worker = importlib.util.module_from_spec(spec)\n"
+        "spec.loader.exec_module(worker)\n"
+        "resource.setrlimit(resource.RLIMIT_CPU, (1000, 1000))\n"
+        "worker.limit_cpu_time(5)\n"
+        "worker.limit_cpu_time(None)\n"
+        "print(resource.getrlimit(resource.RLIMIT_CPU))\n"
+    )
+    output = subprocess.check_output([sys.executable, "-c", script], text=True)
+    assert output == "(1000, 1000)\n"
+
+
+@pytest.mark.asyncio
+async def test_cpu_time_limit_stops_one_execution(pool):
+    tool = PythonExecute()
+    await tool.execute(code="x = 1")
+    result = await tool.execute(code="while True: pass", timeout=10)
+    assert result["observation"] == "CPUTimeExceeded: CPU time limit exceeded"
+    assert 1 <= result["cpu_time"] < 3
+
+    # The limit applies per execution, and the namespace survives
+    result = await tool.execute(code="print(x)")
+    assert result["observation"] == "1\n"
+
+
+@pytest.mark.asyncio
+async def test_memory_and_file_size_limits(pool, tmp_path):
+    tool = PythonExecute()
+    result = await tool.execute(code="data = bytearray(2 * 2**30)")
+    assert result["observation"] == "MemoryError"
+
+    path = tmp_path / "big.bin"
+    result = await tool.execute(code=f"open({str(path)!r}, 'wb').write(bytes(2**21))")
+    assert "File too large" in result["observation"]
+
+
+@pytest.mark.asyncio
+async def test_peak_rss_is_reported_per_execution(pool):
+    tool = PythonExecute()
+    result = await tool.execute(code="data = bytearray(200 * 2**20); del data")
+    assert result["peak_rss_mb"] >= 200
+
+    result = await tool.execute(code="pass")
+    assert result["peak_rss_mb"] < 100
+
+
+@pytest.mark.asyncio
+async def test_limits_apply_without_the_pool(monkeypatch):
+    monkeypatch.setattr(app.tool.python_execute, "get_pool", lambda: None)
+    monkeypatch.setattr(Config, "interpreter", property(lambda self: SETTINGS))
+    tool = PythonExecute()
+
+    result = await tool.execute(code="for i in range(1000): print(i)")
+    assert result["observation"].startswith("0\n1\n")
+    assert result["observation"].endswith("998\n999\n")
+    assert "peak_rss_mb" in result and "cpu_time" in result
+
+    result = await tool.execute(code="data = bytearray(2 * 2**30)")
+    assert result["success"] is False
@@ -0,0 +1,105 @@
+"""Tests for the pool of persistent PythonExecute interpreters."""
+
+import time
+
+import pytest
+import pytest_asyncio
+
+import app.tool.python_execute
+from app.config import InterpreterSettings
+from app.deadline import run_with_deadline
+from app.exceptions import DeadlineExceeded
+from app.tool.python_execute import PythonExecute
+from app.tool.python_pool import InterpreterPool
+
+
+@pytest_asyncio.fixture
+async def pool(monkeypatch):
+    pool = InterpreterPool(
+        InterpreterSettings(
+            enabled=True, pool_size=1, max_calls=10, max_output_chars=1000
+        )
+    )
+    monkeypatch.setattr(app.tool.python_execute, "get_pool", lambda: pool)
+    yield pool
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_variables_persist_per_tool(pool):
+    tool, other = PythonExecute(), PythonExecute()
+    await tool.execute(code="import math\nx = 41")
+    result = await tool.execute(code="print(math.floor(x + 1.5))")
+    assert (result["observation"], result["success"]) == ("42\n", True)
+
+    result = await other.execute(code="print(x)")
+    assert result["observation"] == "NameError: name 'x' is not defined"
+    assert not result["success"]
+
+
+@pytest.mark.asyncio
+async def test_timeout_interrupts_without_losing_state(pool):
+    tool = PythonExecute()
+    await tool.execute(code="data = [1, 2, 3]")
+
+    start = time.monotonic()
+    result = await tool.execute(code="print('working')\nwhile True: pass", timeout=0.5)
+    assert time.monotonic() - start < 2
+    assert result["observation"] == "working\nExecution timeout after 0 seconds"
+    assert not result["success"]
+
+    result = await tool.execute(code="print(sum(data))")
+    assert result["observation"] == "6\n"
+
+
+@pytest.mark.asyncio
+async def test_output_is_streamed_and_capped(pool):
+    chunks = []
+    tool = PythonExecute(on_output=chunks.append)
+    result = await tool.execute(code="for i in range(500): print('line', i)")
+
+    observation = result["observation"]
+    assert len(observation) < 1100
+    assert observation.startswith("line 0\nline 1\n")
+    assert "characters of output omitted ...]" in observation
+    assert observation.endswith("line 498\nline 499\n")
+    assert "".join(chunks) == observation
+
+
+@pytest.mark.asyncio
+async def test_interpreter_is_recycled_after_max_calls(pool):
+    pool.settings.max_calls = 2
+    tool = PythonExecute()
+    await tool.execute(code="x = 1")
+    result = await tool.execute(code="print(x)")
+    assert result["observation"].startswith("1\n[The interpreter was recycled")
+
+    result = await tool.execute(code="print('x' in globals())")
+    assert result["observation"] == "False\n"
+
+
+@pytest.mark.asyncio
+async def test_interpreter_survives_exit_and_cleanup_releases_it(pool):
+    tool = PythonExecute()
+    result = await tool.execute(code="x = 1\nraise SystemExit(3)")
+    assert result["observation"] == "SystemExit: 3"
+    assert (await tool.execute(code="print(x)"))["observation"] == "1\n"
+
+    await tool.cleanup()
+    assert (await tool.execute(code="print('x' in dir())"))["observation"] == (
+        "False\n"
+    )
+
+
+@pytest.mark.asyncio
+async def test_cancelled_execution_is_interrupted(pool):
+    tool = PythonExecute()
+    await tool.execute(code="x = 1")
+    with pytest.raises(DeadlineExceeded):
+        await run_with_deadline(
+            tool.execute(code="import time\ntime.sleep(10)"), 0.3, "python"
+        )
+
+    start = time.monotonic()
+    assert (await tool.execute(code="print(x)"))["observation"] == "1\n"
+    assert time.monotonic() - start < 2
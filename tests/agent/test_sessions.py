@@ -0,0 +1,112 @@
+"""Tests for running many isolated agent sessions in one event loop."""
+
+import asyncio
+import json
+
+import pytest
+
+from app.agent.swe import SWEAgent
+from app.agent.toolcall import ToolCallAgent
+from app.llm import LLM
+from app.sandbox.client import SANDBOX_CLIENT
+from app.schema import Message, ToolCall
+from app.session import Session, current_session, get_sandbox_client, use_session
+from app.tool import Terminate, ToolCollection
+from app.tool.str_replace_editor import StrReplaceEditor
+
+
+SESSIONS = 50
+
+
+def call(index: int, name: str, **args) -> ToolCall:
+    return ToolCall(
+        id=f"call_{index}", function={"name": name, "arguments": json.dumps(args)}
+    )
+
+
+def make_session_agent(path: str, text: str) -> ToolCallAgent:
+    agent = ToolCallAgent(
+        available_tools=ToolCollection(StrReplaceEditor(), Terminate()),
+        next_step_prompt="",
+    )
+    script = [
+        call(0, "str_replace_editor", command="create", path=path, file_text="a"),
+        call(
+            1,
+            "str_replace_editor",
+            command="str_replace",
+            path=path,
+            old_str="a",
+            new_str=text,
+        ),
+        call(2, "str_replace_editor", command="undo_edit", path=path),
+        call(3, "terminate", status="success"),
+    ]
+
+    async def ask_tool(messages, **kwargs):
+        agent.llm.update_token_count(len(script))
+        await asyncio.sleep(0)  # Let the other sessions interleave
+        return Message.from_tool_calls([script.pop(0)])
+
+    agent.llm.ask_tool = ask_tool
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sessions_do_not_interfere(tmp_path):
+    sessions, agents = [], []
+    for index in range(SESSIONS):
+        session = Session()
+        with use_session(session):
+            agents.append(
+                make_session_agent(str(tmp_path / f"file{index}.txt"), f"s{index}")
+            )
+        sessions.append(session)
+
+    await asyncio.gather(
+        *(agent.run(f"task {index}") for index, agent in enumerate(agents))
+    )
+
+    # Each session undid only its own edit
+    for index in range(SESSIONS):
+        assert (tmp_path / f"file{index}.txt").read_text() == "a"
+    llms = {id(agent.llm) for agent in agents}
+    assert len(llms) == SESSIONS
+    assert all(agent.llm.total_input_tokens == 4 + 3 + 2 + 1 for agent in agents)
+    assert len({id(session.sandbox_client) for session in sessions}) == SESSIONS
+    await asyncio.gather(*(session.close() for session in sessions))
+
+
+@pytest.mark.asyncio
+async def test_run_makes_agent_session_current():
+    session = Session()
+    with use_session(session):
+        agent = ToolCallAgent(next_step_prompt="")
+    seen = []
+
+    async def ask_tool(messages, **kwargs):
+        seen.append((current_session(), get_sandbox_client()))
+        return Message.from_tool_calls([call(0, "terminate", status="success")])
+
+    agent.llm.ask_tool = ask_tool
+    await agent.run("task")
+
+    assert agent.session is session
+    assert seen == [(session, session.sandbox_client)]
+    assert current_session() is None and get_sandbox_client() is SANDBOX_CLIENT
+
+
+def test_llm_instances_are_per_session():
+    with use_session(Session()):
+        first = LLM()
+        assert LLM() is first
+    with use_session(Session()):
+        assert LLM() is not first
+    assert LLM() is not first
+
+
+def test_agents_do_not_share_tools():
+    first, second = SWEAgent(), SWEAgent()
+    assert first.available_tools is not second.available_tools
+    bash = first.available_tools.get_tool("bash")
+    assert bash is not second.available_tools.get_tool("bash")
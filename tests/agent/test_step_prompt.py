@@ -0,0 +1,85 @@
+"""Tests for sending next_step_prompt without storing it in memory."""
+
+import pytest
+
+from app.agent.toolcall import ToolCallAgent
+from app.schema import Message, ToolCall
+
+
+class FakeResponse:
+    def __init__(self, step: int):
+        self.content = f"thought {step}"
+        self.tool_calls = [
+            ToolCall(
+                id=f"call_{step}",
+                function={"name": "terminate", "arguments": '{"status": "success"}'},
+            )
+        ]
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    sent = []
+
+    async def ask_tool(messages, **kwargs):
+        sent.append(list(messages))
+        return FakeResponse(len(sent))
+
+    def make_agent(**fields) -> ToolCallAgent:
+        agent = ToolCallAgent(next_step_prompt="What next?", **fields)
+        monkeypatch.setattr(agent.llm, "ask_tool", ask_tool)
+        agent.memory.add_message(Message.user_message("task"))
+        return agent
+
+    return sent, make_agent
+
+
+async def run_step(agent: ToolCallAgent, step: int) -> None:
+    await agent.think()
+    agent.memory.add_message(
+        Message.tool_message("done", name="terminate", tool_call_id=f"call_{step}")
+    )
+
+
+@pytest.mark.asyncio
+async def test_next_step_prompt_is_sent_but_not_stored(requests):
+    sent, make_agent = requests
+    agent = make_agent()
+
+    for step in (1, 2, 3):
+        await run_step(agent, step)
+
+    assert all(request[-1].content == "What next?" for request in sent)
+    assert [message.content for message in agent.messages].count("What next?") == 0
+    # Every request after the first extends the previous one minus its prompt
+    assert sent[2][: len(sent[1]) - 1] == sent[1][:-1]
+    # Tool results still directly follow their assistant tool calls
+    roles = [message.role for message in agent.messages]
+    assert roles == [
+        "user",
+        "assistant",
+        "tool",
+        "assistant",
+        "tool",
+        "assistant",
+        "tool",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_next_step_prompt_can_be_persisted(requests):
+    sent, make_agent = requests
+    agent = make_agent(persist_next_step_prompt=True)
+
+    for step in (1, 2):
+        await run_step(agent, step)
+
+    assert [message.content for message in agent.messages].count("What next?") == 2
+
+
+def test_stuck_prompt_added_once(requests):
+    _, make_agent = requests
+    agent = make_agent()
+    agent.handle_stuck_state()
+    agent.handle_stuck_state()
+    assert agent.next_step_prompt.count("Observed duplicate responses") == 1
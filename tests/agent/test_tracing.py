@@ -0,0 +1,108 @@
+"""Tests for step-level tracing spans."""
+
+import json
+
+import pytest
+
+from app.agent.toolcall import ToolCallAgent
+from app.schema import Message, ToolCall
+from app.tool import Terminate, ToolCollection
+from app.tool.base import BaseTool, ToolResult
+from app.tracing import (
+    NOOP_SPAN,
+    FileExporter,
+    InMemoryCollector,
+    SpanExporter,
+    Tracer,
+    set_tracer,
+    span,
+)
+
+
+class EchoTool(BaseTool):
+    name: str = "echo"
+    description: str = "Echo"
+
+    async def execute(self, text: str) -> ToolResult:
+        with span("echo.inner"):
+            return ToolResult(output=text)
+
+
+@pytest.fixture
+def collector():
+    collector = InMemoryCollector()
+    previous = set_tracer(Tracer(collector))
+    yield collector
+    set_tracer(previous)
+
+
+def call(index: int, name: str, arguments: dict) -> ToolCall:
+    return ToolCall(
+        id=f"call_{index}",
+        function={"name": name, "arguments": json.dumps(arguments)},
+    )
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_from_run_to_tool(collector):
+    agent = ToolCallAgent(
+        available_tools=ToolCollection(EchoTool(), Terminate()), next_step_prompt=""
+    )
+    script = [
+        call(0, "echo", {"text": "hello"}),
+        call(1, "terminate", {"status": "success"}),
+    ]
+
+    async def ask_tool(messages, **kwargs):
+        return Message.from_tool_calls([script.pop(0)])
+
+    agent.llm.ask_tool = ask_tool
+    await agent.run("task")
+
+    (run,) = collector.find("agent.run")
+    steps = collector.children(run)
+    assert [step.attributes["step"] for step in steps] == [1, 2]
+    assert [child.name for child in collector.children(steps[0])] == ["think", "act"]
+    act = collector.children(steps[0])[1]
+    (tool,) = collector.children(act)
+    assert tool.attributes["tool"] == "echo"
+    assert tool.attributes["bytes"] > len("hello")
+    assert [child.name for child in collector.children(tool)] == ["echo.inner"]
+    assert all(s.trace_id == run.trace_id for s in collector.spans)
+    assert all(s.duration is not None and s.duration >= 0 for s in collector.spans)
+
+
+def test_errors_are_recorded_and_exported(collector, tmp_path):
+    exporter = FileExporter(tmp_path / "traces.jsonl")
+    collector_tracer = Tracer(collector, exporter)
+    set_tracer(collector_tracer)
+
+    with pytest.raises(RuntimeError):
+        with span("outer", size=1) as outer:
+            outer.set(bytes=10)
+            raise RuntimeError("boom")
+    exporter.shutdown()
+
+    (line,) = (tmp_path / "traces.jsonl").read_text().splitlines()
+    exported = json.loads(line)
+    assert exported["name"] == "outer"
+    assert exported["attributes"] == {"size": 1, "bytes": 10}
+    assert exported["error"] == "RuntimeError: boom"
+
+
+def test_disabled_tracing_returns_noop_span():
+    previous = set_tracer(None)
+    try:
+        with span("anything", a=1) as traced:
+            traced.set(b=2)
+        assert traced is NOOP_SPAN
+    finally:
+        set_tracer(previous)
+
+
+def test_exporters_must_implement_export():
+    class Incomplete(SpanExporter):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,28 @@
+"""Shared fixtures for the test suite."""
+
+import pytest
+import tiktoken
+
+import app.schema
+
+
+class WhitespaceTokenizer:
+    """Offline stand-in for a tiktoken encoding, one token per word."""
+
+    name = "whitespace"
+
+    def encode(self, text, **kwargs):
+        return text.split()
+
+    def encode_batch(self, texts, **kwargs):
+        return [self.encode(text) for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def offline_tokenizer(monkeypatch):
+    """Keep tests from downloading tiktoken encodings."""
+    tokenizer = WhitespaceTokenizer()
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: tokenizer)
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: tokenizer)
+    monkeypatch.setattr(app.schema, "_token_counter", None)
+    return tokenizer
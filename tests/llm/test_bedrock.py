@@ -0,0 +1,180 @@
+"""Tests for the Bedrock backend's OpenAI-compatible interface."""
+
+import asyncio
+import time
+
+import pytest
+
+from app.bedrock import ChatCompletions
+from app.llm import ToolCallAssembler
+
+
+class FakeEventStream:
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def __iter__(self):
+        for event in self.events:
+            time.sleep(0.01)
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBedrockRuntime:
+    """Synchronous stand-in for the boto3 bedrock-runtime client"""
+
+    def __init__(self, response=None, events=None):
+        self.response = response
+        self.stream = FakeEventStream(events or [])
+        self.requests = []
+
+    def converse(self, **request):
+        self.requests.append(request)
+        time.sleep(0.2)  # Blocking network call
+        return self.response
+
+    def converse_stream(self, **request):
+        self.requests.append(request)
+        return {"stream": self.stream}
+
+
+HISTORY = [
+    {"role": "system", "content": "You are an agent"},
+    {"role": "user", "content": "Check both files"},
+    {
+        "role": "assistant",
+        "content": "",
+        "tool_calls": [
+            {
+                "id": "call_a",
+                "type": "function",
+                "function": {"name": "read", "arguments": '{"path": "a.txt"}'},
+            },
+            {
+                "id": "call_b",
+                "type": "function",
+                "function": {"name": "read", "arguments": '{"path": "b.txt"}'},
+            },
+        ],
+    },
+    {"role": "tool", "tool_call_id": "call_a", "name": "read", "content": "A"},
+    {"role": "tool", "tool_call_id": "call_b", "name": "read", "content": "B"},
+    {"role": "user", "content": "Continue"},
+]
+
+
+def test_every_tool_call_and_result_is_converted():
+    system, messages = ChatCompletions._convert_openai_messages_to_bedrock_format(
+        HISTORY
+    )
+
+    assert system == [{"text": "You are an agent"}]
+    assert [message["role"] for message in messages] == ["user", "assistant", "user"]
+    assert [block["toolUse"]["toolUseId"] for block in messages[1]["content"]] == [
+        "call_a",
+        "call_b",
+    ]
+    assert messages[1]["content"][1]["toolUse"]["input"] == {"path": "b.txt"}
+    assert messages[2]["content"] == [
+        {"toolResult": {"toolUseId": "call_a", "content": [{"text": "A"}]}},
+        {"toolResult": {"toolUseId": "call_b", "content": [{"text": "B"}]}},
+        {"text": "Continue"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_converse_does_not_block_event_loop():
+    runtime = FakeBedrockRuntime(
+        response={
+            "output": {
+                "message": {
+                    "role": "assistant",
+                    "content": [
+                        {"text": "Reading"},
+                        {"toolUse": {"toolUseId": "t1", "name": "read", "input": {}}},
+                        {"toolUse": {"toolUseId": "t2", "name": "read", "input": {}}},
+                    ],
+                }
+            },
+            "stopReason": "tool_use",
+            "usage": {"inputTokens": 10, "outputTokens": 5, "totalTokens": 15},
+        }
+    )
+    completions = ChatCompletions(runtime)
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    response = await completions.create(
+        model="m", messages=HISTORY, max_tokens=100, stream=False, tools=[]
+    )
+    task.cancel()
+
+    assert ticks >= 10
+    assert [call.id for call in response.choices[0].message.tool_calls] == [
+        "t1",
+        "t2",
+    ]
+    assert response.choices[0].finish_reason == "tool_calls"
+    assert response.usage.prompt_tokens == 10
+
+
+@pytest.mark.asyncio
+async def test_converse_stream_yields_openai_chunks():
+    runtime = FakeBedrockRuntime(
+        events=[
+            {"messageStart": {"role": "assistant"}},
+            {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": "Hi"}}},
+            {"contentBlockStop": {"contentBlockIndex": 0}},
+            {
+                "contentBlockStart": {
+                    "contentBlockIndex": 1,
+                    "start": {"toolUse": {"toolUseId": "t1", "name": "read"}},
+                }
+            },
+            {
+                "contentBlockDelta": {
+                    "contentBlockIndex": 1,
+                    "delta": {"toolUse": {"input": '{"path": "a"}'}},
+                }
+            },
+            {
+                "contentBlockStart": {
+                    "contentBlockIndex": 2,
+                    "start": {"toolUse": {"toolUseId": "t2", "name": "read"}},
+                }
+            },
+            {
+                "contentBlockDelta": {
+                    "contentBlockIndex": 2,
+                    "delta": {"toolUse": {"input": '{"path": "b"}'}},
+                }
+            },
+            {"messageStop": {"stopReason": "tool_use"}},
+            {"metadata": {"usage": {"inputTokens": 3, "outputTokens": 4}}},
+        ]
+    )
+    completions = ChatCompletions(runtime)
+    dispatched = []
+    assembler = ToolCallAssembler(dispatched.append)
+
+    chunks = await completions.create(model="m", messages=HISTORY, stream=True)
+    async for chunk in chunks:
+        assembler.add_delta(chunk.choices[0].delta)
+    message = assembler.finish()
+
+    assert message.content == "Hi"
+    assert [call.id for call in dispatched] == ["t1", "t2"]
+    assert message.tool_calls[1].function.arguments == '{"path": "b"}'
+    assert chunk.choices[0].finish_reason == "tool_calls"
+    assert chunk.usage.completion_tokens == 4
+    assert runtime.stream.closed
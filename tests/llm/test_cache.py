@@ -0,0 +1,196 @@
+"""Tests for the LLM response cache."""
+
+import asyncio
+import os
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from app.cache import LLMResponseCache
+from app.config import LLMCacheSettings, LLMSettings
+from app.llm import LLM, LLMEndpoint
+
+
+def make_cache(tmp_path: Path, **overrides) -> LLMResponseCache:
+    settings = LLMCacheSettings(enabled=True, disk_path=str(tmp_path), **overrides)
+    return LLMResponseCache(settings)
+
+
+PAYLOAD = {"model": "gpt-4o", "messages": [{"role": "user", "content": "plan"}]}
+
+
+@pytest.mark.asyncio
+async def test_memory_hit_skips_upstream(tmp_path: Path):
+    cache = make_cache(tmp_path)
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        return "plan v1"
+
+    assert await cache.get_or_create(PAYLOAD, factory) == "plan v1"
+    assert await cache.get_or_create(dict(PAYLOAD), factory) == "plan v1"
+    assert calls == 1
+    assert cache.stats.misses == 1
+    assert cache.stats.memory_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_key_is_independent_of_dict_order(tmp_path: Path):
+    cache = make_cache(tmp_path)
+    reordered = {"messages": PAYLOAD["messages"], "model": PAYLOAD["model"]}
+    assert cache.make_key(PAYLOAD) == cache.make_key(reordered)
+    assert cache.make_key(PAYLOAD) != cache.make_key({**PAYLOAD, "temperature": 0})
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_call(tmp_path: Path):
+    cache = make_cache(tmp_path)
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"content": "shared"}
+
+    results = await asyncio.gather(
+        *(cache.get_or_create(PAYLOAD, factory) for _ in range(5))
+    )
+    assert calls == 1
+    assert all(result == {"content": "shared"} for result in results)
+    assert cache.stats.coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_failures_propagate_and_are_not_cached(tmp_path: Path):
+    cache = make_cache(tmp_path)
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(
+        *(cache.get_or_create(PAYLOAD, failing) for _ in range(3)),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    async def factory():
+        return "recovered"
+
+    assert await cache.get_or_create(PAYLOAD, factory) == "recovered"
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_survives_memory_eviction(tmp_path: Path):
+    cache = make_cache(tmp_path, max_memory_entries=1)
+
+    async def factory():
+        return "first"
+
+    await cache.get_or_create(PAYLOAD, factory)
+    await cache.get_or_create({"other": 1}, factory)
+
+    fresh = make_cache(tmp_path)
+    assert await fresh.get(fresh.make_key(PAYLOAD)) == "first"
+    assert fresh.stats.disk_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_disk_entries_expire_and_respect_size_limit(tmp_path: Path):
+    cache = make_cache(tmp_path, ttl=60, max_disk_bytes=400)
+    for i in range(10):
+        await cache.put(f"{i:02d}" + "0" * 62, "x" * 50)
+        # Distinct mtimes so the oldest entries are evicted first
+        path = cache.disk._file(f"{i:02d}" + "0" * 62)
+        os.utime(path, (time.time() - 10 + i, time.time() - 10 + i))
+
+    files = list(tmp_path.glob("*/*.json"))
+    assert sum(f.stat().st_size for f in files) <= 400
+    assert cache.disk.get("09" + "0" * 62) == "x" * 50
+
+    expired = make_cache(tmp_path, ttl=0)
+    time.sleep(0.01)
+    assert expired.disk.get("09" + "0" * 62) is None
+
+
+@pytest.mark.asyncio
+async def test_none_responses_are_passed_through_and_not_cached(tmp_path: Path):
+    cache = make_cache(tmp_path)
+    calls = 0
+
+    async def empty():
+        nonlocal calls
+        calls += 1
+
+    def fail(value):
+        raise AssertionError("None must not be encoded or decoded")
+
+    for _ in range(2):
+        assert await cache.get_or_create(PAYLOAD, empty, fail, fail) is None
+    assert calls == 2
+
+
+def make_llm(name: str, base_url: str, cache: LLMResponseCache, content: str):
+    settings = LLMSettings(
+        model="gpt-4o",
+        base_url=base_url,
+        api_key="test",
+        api_type="openai",
+        api_version="",
+    )
+    llm = LLM(name, {"default": settings})
+    llm.response_cache = cache
+
+    async def create(**params):
+        return ChatCompletion.model_validate(
+            {
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": 0,
+                "model": params["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 1,
+                    "completion_tokens": 1,
+                    "total_tokens": 2,
+                },
+            }
+        )
+
+    for endpoint in llm.endpoints:
+        endpoint.client = SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+        )
+    return llm
+
+
+@pytest.mark.asyncio
+async def test_same_model_on_other_servers_is_cached_separately(tmp_path: Path):
+    cache = make_cache(tmp_path)
+    first = make_llm("cache-a", "https://a.example.com/v1", cache, "from a")
+    second = make_llm("cache-b", "https://b.example.com/v1", cache, "from b")
+    messages = [{"role": "user", "content": "hi"}]
+    try:
+        assert (await first.ask_tool(messages)).content == "from a"
+        assert (await second.ask_tool(messages)).content == "from b"
+        assert (await first.ask_tool(messages)).content == "from a"
+        assert cache.stats.misses == 2
+    finally:
+        for name, llm in (("cache-a", first), ("cache-b", second)):
+            LLM._instances.pop(name, None)
+            for key in [
+                k for k, v in LLMEndpoint._registry.items() if v in llm.endpoints
+            ]:
+                del LLMEndpoint._registry[key]
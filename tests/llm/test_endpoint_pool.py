@@ -0,0 +1,199 @@
+"""Tests for balancing LLM requests across pooled endpoints."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import InternalServerError
+from openai.types.chat import ChatCompletion
+
+from app.config import HedgingSettings, LLMSettings
+from app.llm import LLM, CircuitBreaker, HedgingPolicy, LLMEndpoint
+
+
+def make_settings(base_url: str, **kwargs) -> LLMSettings:
+    return LLMSettings(
+        model="gpt-4o",
+        base_url=base_url,
+        api_key="test",
+        api_type="openai",
+        api_version="",
+        **kwargs,
+    )
+
+
+def server_error() -> InternalServerError:
+    request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+    return InternalServerError(
+        "unavailable", response=httpx.Response(503, request=request), body=None
+    )
+
+
+class FakeCompletions:
+    def __init__(self, name: str, fail: bool = False):
+        self.name = name
+        self.fail = fail
+        self.delay = 0.0
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, **params):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise server_error()
+        return ChatCompletion.model_validate(
+            {
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": params["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": self.name},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 10,
+                    "completion_tokens": 1,
+                    "total_tokens": 11,
+                },
+            }
+        )
+
+
+@pytest.fixture
+def pool(request):
+    name = request.node.name
+    profiles = {
+        "default": make_settings(
+            f"https://{name}-primary.example.com/v1",
+            endpoints=["backup"],
+            circuit_breaker_threshold=2,
+            circuit_breaker_cooldown=60,
+        ),
+        "backup": make_settings(f"https://{name}-backup.example.com/v1"),
+    }
+    llm = LLM(name, profiles)
+    llm.name = name
+    llm.response_cache = None
+    completions = {}
+    for endpoint in llm.endpoints:
+        completions[endpoint.name] = FakeCompletions(endpoint.name)
+        endpoint.client = SimpleNamespace(
+            chat=SimpleNamespace(completions=completions[endpoint.name])
+        )
+    yield llm, completions
+    LLM._instances.pop(name, None)
+    for key in [k for k, v in LLMEndpoint._registry.items() if v in llm.endpoints]:
+        del LLMEndpoint._registry[key]
+
+
+def test_circuit_breaker_ejects_and_probes():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == "open" and not breaker.available()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open" and breaker.available()
+    breaker.on_attempt()
+    assert not breaker.available()  # Only one probe at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.available()
+
+
+def test_profiles_form_one_pool(pool):
+    llm, _ = pool
+    assert [endpoint.name for endpoint in llm.endpoints] == [llm.name, "backup"]
+
+
+@pytest.mark.asyncio
+async def test_failover_and_ejection(pool):
+    llm, completions = pool
+    primary = llm.endpoints[0]
+    completions[primary.name].fail = True
+
+    messages = [{"role": "user", "content": "hi"}]
+    assert await llm.ask(messages, stream=False) == "backup"
+    assert await llm.ask(messages, stream=False) == "backup"
+    assert primary.breaker.state == "open"
+
+    # Ejected endpoints receive no traffic until their cooldown expires
+    assert await llm.ask(messages, stream=False) == "backup"
+    assert completions[primary.name].calls == 2
+    assert completions["backup"].calls == 3
+
+
+@pytest.mark.asyncio
+async def test_least_outstanding_selection(pool):
+    llm, _ = pool
+    primary, backup = llm.endpoints
+    primary.outstanding = 2
+    assert llm._select_endpoint([]) is backup
+    assert llm._select_endpoint([backup]) is primary
+
+    primary.outstanding = 0
+    llm.load_balancing = "latency"
+    primary.record_latency(2.0)
+    backup.record_latency(0.5)
+    assert llm._select_endpoint([]) is backup
+
+
+@pytest.mark.asyncio
+async def test_image_requests_charge_completion_tokens(pool, monkeypatch):
+    llm, _ = pool
+    charged = []
+    for endpoint in llm.endpoints:
+        monkeypatch.setattr(endpoint.scheduler, "charge_tokens", charged.append)
+
+    response = await llm.ask_with_images(
+        [{"role": "user", "content": "Describe"}], ["https://example.com/cat.png"]
+    )
+    assert response == llm.endpoints[0].name
+    assert charged == [1]
+
+
+def test_hedging_policy_delay_and_budget():
+    policy = HedgingPolicy(
+        HedgingSettings(enabled=True, min_samples=10, min_delay=0.0, budget=0.1)
+    )
+    for latency in range(1, 10):
+        policy.record(latency)
+    assert policy.delay() is None  # Not enough samples yet
+
+    policy.record(10)
+    assert policy.delay() == 9  # p90 of 1..10
+
+    policy.requests = 20
+    assert policy.try_hedge() and policy.try_hedge()
+    assert not policy.try_hedge()
+
+
+@pytest.mark.asyncio
+async def test_slow_request_is_hedged_to_other_endpoint(pool):
+    llm, completions = pool
+    primary = llm.endpoints[0]
+    llm.hedging = HedgingPolicy(
+        HedgingSettings(enabled=True, min_samples=1, min_delay=0.0)
+    )
+    llm.hedging.record(0.05)
+    completions[primary.name].delay = 5
+
+    start = time.monotonic()
+    message = await llm.ask_tool([{"role": "user", "content": "hi"}])
+    assert message.content == "backup"
+    assert time.monotonic() - start < 1
+
+    assert completions[primary.name].cancelled == 1
+    assert llm.get_hedging_stats()["wins"] == 1
+    assert primary.outstanding == 0
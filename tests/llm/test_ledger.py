@@ -0,0 +1,104 @@
+"""Tests for the per-run token and latency ledger."""
+
+import asyncio
+import csv
+import io
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from app.exceptions import TokenBudgetExceeded
+from app.ledger import (
+    RunLedger,
+    call_site,
+    record_tool,
+    track_llm_call,
+    track_run,
+    track_step,
+)
+from app.llm import LLM
+
+
+class FakeCompletions:
+    async def create(self, **params):
+        await asyncio.sleep(0.01)
+        return ChatCompletion.model_validate(
+            {
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": params["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "done"},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 12,
+                    "completion_tokens": 3,
+                    "total_tokens": 15,
+                },
+            }
+        )
+
+
+@pytest.fixture
+def llm():
+    llm = LLM()
+    endpoint = llm.endpoints[0]
+    client, endpoint.client = endpoint.client, SimpleNamespace(
+        chat=SimpleNamespace(completions=FakeCompletions())
+    )
+    cache, llm.response_cache = llm.response_cache, None
+    yield llm
+    endpoint.client, llm.response_cache = client, cache
+
+
+@pytest.mark.asyncio
+async def test_concurrent_runs_are_attributed_separately(llm):
+    async def run(agent: str, steps: int) -> RunLedger:
+        with track_run(agent) as ledger:
+            for step in range(1, steps + 1):
+                with track_step(step):
+                    with call_site("think"):
+                        await llm.ask([{"role": "user", "content": "hi"}], stream=False)
+                    record_tool("bash", 0.5)
+        return ledger
+
+    first, second = await asyncio.gather(run("manus", 2), run("browser", 3))
+
+    assert first.llm_calls == 2 and second.llm_calls == 3
+    assert {entry.agent for entry in second.entries} == {"browser"}
+    think = second.summary("call_site")["think"]
+    assert think["prompt_tokens"] == 36 and think["completion_tokens"] == 9
+    assert think["retries"] == 0 and think["cache_hits"] == 0
+    assert second.summary("step")["3"]["calls"] == 2  # LLM call and tool
+
+
+@pytest.mark.asyncio
+async def test_budget_stops_further_calls(llm):
+    with track_run("manus") as ledger:
+        ledger.max_tokens = 20
+        await llm.ask([{"role": "user", "content": "hi"}], stream=False)
+        await llm.ask([{"role": "user", "content": "hi"}], stream=False)
+        with pytest.raises(TokenBudgetExceeded):
+            await llm.ask([{"role": "user", "content": "hi"}], stream=False)
+
+
+def test_failed_attempts_and_exports():
+    with track_run("manus", "run1") as ledger:
+        with pytest.raises(RuntimeError):
+            with track_llm_call("gpt-4o"):
+                raise RuntimeError("boom")
+
+    assert ledger.run_id == "run1"
+    assert ledger.summary()["llm"]["errors"] == 1
+    assert ledger.summary()["llm"]["retries"] == 1
+    assert json.loads(ledger.to_json())["entries"][0]["error"] == "RuntimeError: boom"
+    rows = list(csv.DictReader(io.StringIO(ledger.to_csv())))
+    assert rows[0]["model"] == "gpt-4o" and rows[0]["kind"] == "llm"
@@ -0,0 +1,95 @@
+"""Tests for LLM request scheduling and retry classification."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from openai import (
+    APITimeoutError,
+    AuthenticationError,
+    BadRequestError,
+    InternalServerError,
+    RateLimitError,
+)
+
+from app.exceptions import TokenLimitExceeded
+from app.llm import (
+    RateLimitScheduler,
+    RequestPriority,
+    get_retry_after,
+    is_retryable_error,
+)
+
+
+def status_error(cls, status: int, headers: dict = None):
+    request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return cls("error", response=response, body=None)
+
+
+def test_error_classification():
+    request = httpx.Request("POST", "https://api.example.com")
+    assert is_retryable_error(status_error(RateLimitError, 429))
+    assert is_retryable_error(status_error(InternalServerError, 503))
+    assert is_retryable_error(APITimeoutError(request=request))
+    assert not is_retryable_error(status_error(BadRequestError, 400))
+    assert not is_retryable_error(status_error(AuthenticationError, 401))
+    assert not is_retryable_error(TokenLimitExceeded("too long"))
+    assert not is_retryable_error(ValueError("Empty or invalid response from LLM"))
+
+
+def test_retry_after_headers():
+    assert get_retry_after(status_error(RateLimitError, 429, {"retry-after": "3"})) == 3
+    assert (
+        get_retry_after(status_error(RateLimitError, 429, {"retry-after-ms": "250"}))
+        == 0.25
+    )
+    assert get_retry_after(status_error(RateLimitError, 429)) is None
+    assert get_retry_after(ValueError("no response")) is None
+
+
+@pytest.mark.asyncio
+async def test_token_budget_delays_requests():
+    scheduler = RateLimitScheduler(tpm=6000)  # 100 tokens per second
+
+    start = time.monotonic()
+    await scheduler.acquire(6000)
+    assert time.monotonic() - start < 0.05
+
+    await scheduler.acquire(10)
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_waiting_requests_run_by_priority():
+    scheduler = RateLimitScheduler(rpm=600)
+    scheduler.block_for(0.05)
+    order = []
+
+    async def request(name: str, priority: RequestPriority):
+        await scheduler.acquire(1, priority)
+        order.append(name)
+
+    await asyncio.gather(
+        request("summary", RequestPriority.BACKGROUND),
+        request("default", RequestPriority.NORMAL),
+        request("step", RequestPriority.INTERACTIVE),
+    )
+    assert order == ["step", "default", "summary"]
+    assert scheduler.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_block_queue():
+    scheduler = RateLimitScheduler()
+    scheduler.block_for(0.05)
+
+    waiter = asyncio.create_task(scheduler.acquire(1, RequestPriority.INTERACTIVE))
+    await asyncio.sleep(0)
+    other = asyncio.create_task(scheduler.acquire(1, RequestPriority.BACKGROUND))
+    await asyncio.sleep(0)
+    waiter.cancel()
+
+    await asyncio.wait_for(other, timeout=1)
+    assert scheduler.waiting == 0
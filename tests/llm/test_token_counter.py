@@ -0,0 +1,130 @@
+"""Tests for memoized token counting in TokenCounter."""
+
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from app.llm import TokenCounter
+
+
+class CountingTokenizer:
+    """Whitespace tokenizer that records how much text it has encoded."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(text)
+        return text.split()
+
+    def encode_batch(self, texts):
+        return [self.encode(text) for text in texts]
+
+
+@pytest.fixture
+def tokenizer() -> CountingTokenizer:
+    return CountingTokenizer()
+
+
+@pytest.fixture
+def counter(tokenizer: CountingTokenizer) -> TokenCounter:
+    return TokenCounter(tokenizer)
+
+
+def _history(steps: int) -> list:
+    messages = [{"role": "user", "content": "solve the task please"}]
+    for i in range(steps):
+        messages.append(
+            {
+                "role": "assistant",
+                "content": f"thinking about step {i}",
+                "tool_calls": [
+                    {
+                        "id": f"call_{i}",
+                        "type": "function",
+                        "function": {"name": "bash", "arguments": '{"command": "ls"}'},
+                    }
+                ],
+            }
+        )
+        messages.append(
+            {
+                "role": "tool",
+                "content": f"output of step {i}",
+                "name": "bash",
+                "tool_call_id": f"call_{i}",
+            }
+        )
+    return messages
+
+
+def test_counts_match_uncached_formula(counter: TokenCounter):
+    """Memoized totals equal the plain per-field computation."""
+    messages = _history(3) + [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "look at this"},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": "data:..."},
+                    "detail": "low",
+                },
+            ],
+        }
+    ]
+    expected = counter.FORMAT_TOKENS
+    for message in messages:
+        expected += counter.BASE_MESSAGE_TOKENS
+        expected += counter.count_text(message["role"])
+        expected += counter.count_content(message.get("content"))
+        expected += counter.count_tool_calls(message.get("tool_calls", []))
+        expected += counter.count_text(message.get("name", ""))
+        expected += counter.count_text(message.get("tool_call_id", ""))
+
+    assert counter.count_message_tokens(messages) == expected
+    assert counter.count_message_tokens(messages) == expected
+
+
+def test_only_new_messages_are_encoded(
+    counter: TokenCounter, tokenizer: CountingTokenizer
+):
+    """A growing history only encodes the messages appended since the last call."""
+    counter.count_message_tokens(_history(10))
+    tokenizer.encoded.clear()
+
+    counter.count_message_tokens(_history(11))
+    encoded = " ".join(tokenizer.encoded)
+    assert "step 10" in encoded
+    assert "step 9" not in encoded
+
+
+def test_tool_schema_tokens_are_memoized(
+    counter: TokenCounter, tokenizer: CountingTokenizer
+):
+    tools = [{"type": "function", "function": {"name": "bash", "parameters": {}}}]
+    first = counter.count_tools(tools)
+    tokenizer.encoded.clear()
+
+    assert counter.count_tools(tools) == first
+    assert tokenizer.encoded == []
+    assert counter.count_tools(None) == 0
+
+
+def _png_data_url(width: int, height: int) -> str:
+    image = Image.new("RGB", (width, height))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_image_tokens_use_real_dimensions(counter: TokenCounter):
+    """Images are counted from their actual size instead of a fixed estimate."""
+    small = {"type": "image_url", "image_url": {"url": _png_data_url(512, 512)}}
+    large = {"type": "image_url", "image_url": {"url": _png_data_url(1280, 2000)}}
+
+    assert counter.count_image(small) == 765  # 768px: 2x2 tiles + 85
+    assert counter.count_image(large) == 1105  # 768x1200: 2x3 tiles + 85
+    assert counter.count_image({"image_url": {"url": "https://a.b/c.png"}}) == 1024
@@ -0,0 +1,59 @@
+"""Tests for assembling streamed tool call deltas."""
+
+from openai.types.chat.chat_completion_chunk import ChoiceDelta
+
+from app.llm import ToolCallAssembler
+
+
+def tool_delta(index: int, arguments: str, call_id: str = None, name: str = None):
+    function = {"arguments": arguments}
+    if name:
+        function["name"] = name
+    call = {"index": index, "function": function}
+    if call_id:
+        call["id"] = call_id
+        call["type"] = "function"
+    return ChoiceDelta.model_validate({"tool_calls": [call]})
+
+
+def test_tool_call_dispatched_once_arguments_are_complete():
+    dispatched = []
+    assembler = ToolCallAssembler(dispatched.append)
+
+    assembler.add_delta(ChoiceDelta(content="Searching"))
+    assembler.add_delta(tool_delta(0, "", call_id="call_a", name="web_search"))
+    assembler.add_delta(tool_delta(0, '{"query": "a}'))
+    assert dispatched == []  # "}" inside a string does not complete the JSON
+
+    assembler.add_delta(tool_delta(0, '"}'))
+    assert [call.id for call in dispatched] == ["call_a"]
+
+    assembler.add_delta(tool_delta(1, '{"query"', call_id="call_b", name="web_search"))
+    message = assembler.finish()
+
+    assert [call.id for call in dispatched] == ["call_a", "call_b"]
+    assert message.content == "Searching"
+    assert [call.function.arguments for call in message.tool_calls] == [
+        '{"query": "a}"}',
+        '{"query"',
+    ]
+
+
+def test_new_index_completes_previous_call():
+    dispatched = []
+    assembler = ToolCallAssembler(dispatched.append)
+
+    assembler.add_delta(tool_delta(0, "not json", call_id="call_a", name="bash"))
+    assembler.add_delta(tool_delta(1, "", call_id="call_b", name="bash"))
+
+    assert [call.id for call in dispatched] == ["call_a"]
+
+
+def test_message_without_tool_calls():
+    assembler = ToolCallAssembler()
+    assembler.add_delta(ChoiceDelta(content="Hello"))
+    assembler.add_delta(ChoiceDelta(content=" world"))
+
+    message = assembler.finish()
+    assert message.content == "Hello world"
+    assert message.tool_calls is None
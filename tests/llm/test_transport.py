@@ -0,0 +1,49 @@
+"""Tests for the pooled HTTP transport shared by LLM clients."""
+
+import asyncio
+
+from app.config import HTTPPoolSettings
+from app.transport import PooledTransport
+
+
+def test_one_pool_per_event_loop():
+    transport = PooledTransport(HTTPPoolSettings(max_connections=8))
+
+    async def pools():
+        return transport._pool(), transport._pool()
+
+    first, again = asyncio.run(pools())
+    assert first is again
+
+    second, _ = asyncio.run(pools())
+    assert second is not first
+    # Pools of finished loops are not kept around
+    assert transport.stats()["pools"] <= 1
+
+
+def test_stats_report_limits_and_occupancy():
+    transport = PooledTransport(HTTPPoolSettings(max_connections=8))
+
+    async def stats():
+        transport._pool()
+        return transport.stats()
+
+    stats = asyncio.run(stats())
+    assert stats["max_connections"] == 8
+    assert stats["connections"] == 0
+    assert stats["in_flight_requests"] == 0
+
+
+def test_http2_falls_back_without_h2(monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == "h2":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", fake_import)
+    transport = PooledTransport(HTTPPoolSettings(http2=True))
+    assert transport.http2 is False